@@ -155,6 +155,7 @@ class TRANSFERHISTORY(Base):
     DEST_PATH = Column(Text)
     DEST_FILENAME = Column(Text)
     DATE = Column(Text)
+    CHECKSUM = Column(Text)
 
     def as_dict(self):
         return {c.name: getattr(self, c.name) for c in self.__table__.columns}
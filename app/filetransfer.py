@@ -3,26 +3,142 @@ import os
 import random
 import re
 import shutil
+import time
 import traceback
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
 from threading import Lock
 from time import sleep
 
 import log
 from app.conf import ModuleConf
-from app.helper import DbHelper, ProgressHelper
+from app.helper import DbHelper, ProgressHelper, DeviceThreadPool, TransferJournalHelper, RcloneHelper, \
+    IoThrottleHelper, FreeSpaceHelper
 from app.helper import ThreadHelper
 from app.media import Media, Category, Scraper
 from app.media.meta import MetaInfo
 from app.mediaserver import MediaServer
 from app.message import Message
 from app.subtitle import Subtitle
-from app.utils import EpisodeFormat, PathUtils, StringUtils, SystemUtils, ExceptionUtils
+from app.utils import EpisodeFormat, PathUtils, StringUtils, SystemUtils, ExceptionUtils, PathTrie, StripedLock, \
+    DirListingCache, FileChecksum
 from app.utils.types import MediaType, SyncType, RmtMode
 from config import RMT_SUBEXT, RMT_MEDIAEXT, RMT_FAVTYPE, RMT_MIN_FILESIZE, DEFAULT_MOVIE_FORMAT, \
-    DEFAULT_TV_FORMAT, Config
+    DEFAULT_TV_FORMAT, RMT_TRANSFER_THREADS, RMT_DISC_SMALL_FILE_SIZE, RMT_STAGING_SUFFIX, Config
 
-lock = Lock()
+# 目标文件锁，同一目标文件的转移互斥
+file_locks = StripedLock(stripes=256)
+# 设备锁，同一设备上的复制、移动等耗时转移依次执行，不同设备并行
+device_locks = StripedLock(stripes=1024)
+
+
+class SubtitleIndex:
+    """
+    字幕目录索引：每个目录只列出并识别一次字幕文件，语言标签预先识别，
+    按（去除语言标签后的文件名）及（中/英文名称、季、集）建立索引，媒体文件直接按键查找对应字幕
+    """
+    # 字幕正则式
+    _zhcn_sub_re = re.compile(r"([.\[(](((zh[-_])?(cn|ch[si]|sg|sc))|zho?"
+                              r"|chinese|(cn|ch[si]|sg|zho?|eng)[-_&](cn|ch[si]|sg|zho?|eng)"
+                              r"|简[体中]?)[.\])])"
+                              r"|([\u4e00-\u9fa5]{0,3}[中双][\u4e00-\u9fa5]{0,2}[字文语][\u4e00-\u9fa5]{0,3})"
+                              r"|简体|简中", re.I)
+    _zhtw_sub_re = re.compile(r"([.\[(](((zh[-_])?(hk|tw|cht|tc))"
+                              r"|繁[体中]?)[.\])])"
+                              r"|繁体中[文字]|中[文字]繁体|繁体", re.I)
+    _eng_sub_re = re.compile(r"[.\[(]eng[.\])]", re.I)
+    # 语言标签，兼容jellyfin字幕识别(多重识别), emby则会识别最后一个后缀
+    _sub_tag_dict = {
+        ".eng": ".英文",
+        ".chi.zh-cn": ".简体中文",
+        ".zh-tw": ".繁体中文"
+    }
+    # 同语言字幕的最大数量，超出的不再转移
+    _max_same_tags = 6
+
+    def __init__(self, dir_name):
+        self.dir_name = dir_name
+        # 去除语言标签后的文件名 -> 字幕
+        self._stems = {}
+        # (cn/en, 名称) -> {(季, 集): 字幕}
+        self._names = {}
+        for order, file_item in enumerate(PathUtils.get_dir_level1_files(dir_name, RMT_SUBEXT)):
+            self.__add(order, file_item)
+        self.count = sum(len(subs) for subs in self._stems.values())
+
+    @classmethod
+    def __get_sub_tags(cls, file_item):
+        """
+        识别字幕语言，返回依次尝试的目标文件标签
+        """
+        new_file_type = ""
+        if cls._zhcn_sub_re.search(file_item):
+            new_file_type = ".chi.zh-cn"
+        elif cls._zhtw_sub_re.search(file_item):
+            new_file_type = ".zh-tw"
+        elif cls._eng_sub_re.search(file_item):
+            new_file_type = ".eng"
+        # 通过对比字幕文件大小  尽量转移所有存在的字幕
+        return [new_file_type if t == 0 else "%s%s(%s)" % (new_file_type,
+                                                           cls._sub_tag_dict.get(new_file_type, ""),
+                                                           t) for t in range(cls._max_same_tags)]
+
+    def __add(self, order, file_item):
+        sub_name = os.path.basename(file_item)
+        sub_file_name = self._eng_sub_re.sub(".", self._zhtw_sub_re.sub(".", self._zhcn_sub_re.sub(".", sub_name)))
+        sub_metainfo = MetaInfo(title=sub_name)
+        sub = {
+            "order": order,
+            "path": file_item,
+            "ext": os.path.splitext(file_item)[-1],
+            "tags": self.__get_sub_tags(file_item),
+            "season": sub_metainfo.get_season_string(),
+            "episode": sub_metainfo.get_episode_string()
+        }
+        self._stems.setdefault(os.path.splitext(sub_file_name)[0], []).append(sub)
+        season_key = (sub["season"], sub["episode"])
+        for name_key in [("cn", sub_metainfo.cn_name), ("en", sub_metainfo.en_name)]:
+            if name_key[1]:
+                self._names.setdefault(name_key, {}).setdefault(season_key, []).append(sub)
+
+    def lookup(self, file_name, new_name):
+        """
+        查找媒体文件对应的字幕
+        :param file_name: 媒体文件名
+        :param new_name: 媒体文件转移后的路径
+        :return: [(字幕文件, [依次尝试的目标文件])]
+        """
+        if not self.count:
+            return []
+        metainfo = MetaInfo(title=file_name)
+        season = metainfo.get_season_string()
+        episode = metainfo.get_episode_string()
+        matched = {}
+        for sub in self._stems.get(os.path.splitext(file_name)[0]) or []:
+            matched[sub["order"]] = sub
+        for name_key in [("cn", metainfo.cn_name), ("en", metainfo.en_name)]:
+            if not name_key[1]:
+                continue
+            season_subs = self._names.get(name_key) or {}
+            if season and episode:
+                for sub in season_subs.get((season, episode)) or []:
+                    matched[sub["order"]] = sub
+            else:
+                for subs in season_subs.values():
+                    for sub in subs:
+                        matched[sub["order"]] = sub
+        new_base = os.path.splitext(new_name)[0]
+        results = []
+        for order in sorted(matched):
+            sub = matched[order]
+            if season and season != sub["season"]:
+                continue
+            if episode and episode != sub["episode"]:
+                continue
+            results.append((sub["path"], ["%s%s%s" % (new_base, tag, sub["ext"]) for tag in sub["tags"]]))
+        return results
 
 
 class FileTransfer:
@@ -34,6 +150,8 @@ class FileTransfer:
     threadhelper = None
     dbhelper = None
     progress = None
+    journal = None
+    freespace = None
 
     _default_rmt_mode = None
     _movie_path = None
@@ -45,6 +163,9 @@ class FileTransfer:
     _unknown_path = None
     _min_filesize = RMT_MIN_FILESIZE
     _filesize_cover = False
+    _transfer_checksum = False
+    # 目标文件 -> 转移时计算的校验值
+    _transfer_checksums = {}
     _movie_dir_rmt_format = ""
     _movie_file_rmt_format = ""
     _tv_dir_rmt_format = ""
@@ -56,8 +177,18 @@ class FileTransfer:
     _refresh_mediaserver = False
     _ignored_paths = []
     _ignored_files = ''
+    _target_path_trie = None
+    # 字幕目录索引：目录 -> (目录修改时间, SubtitleIndex)
+    _subtitle_indexes = None
+    _subtitle_index_lock = None
+    # 缓存的字幕目录索引最大数量
+    _MAX_SUBTITLE_INDEXES = 32
+    # 转移历史记录批量登记数量
+    _HISTORY_BATCH_SIZE = 100
 
     def __init__(self):
+        self._subtitle_indexes = OrderedDict()
+        self._subtitle_index_lock = Lock()
         self.media = Media()
         self.message = Message()
         self.category = Category()
@@ -66,6 +197,8 @@ class FileTransfer:
         self.threadhelper = ThreadHelper()
         self.dbhelper = DbHelper()
         self.progress = ProgressHelper()
+        self.journal = TransferJournalHelper()
+        self.freespace = FreeSpaceHelper()
         self.init_config()
 
     def init_config(self):
@@ -134,6 +267,8 @@ class FileTransfer:
                 self._ignored_files = re.compile(r'%s' % re.sub(r';', r'|', ignored_files))
             # 高质量文件覆盖
             self._filesize_cover = media.get('filesize_cover')
+            # 复制时计算校验值
+            self._transfer_checksum = media.get('transfer_checksum')
             # 电影重命名格式
             movie_name_format = media.get('movie_name_format') or DEFAULT_MOVIE_FORMAT
             movie_formats = movie_name_format.rsplit('/', 1)
@@ -149,18 +284,95 @@ class FileTransfer:
                 if len(tv_formats) > 2:
                     self._tv_season_rmt_format = tv_formats[-2]
                     self._tv_file_rmt_format = tv_formats[-1]
+        # 媒体库目录前缀树
+        self._target_path_trie = PathTrie()
+        for target_path in self.get_target_dir_paths():
+            self._target_path_trie.add(target_path)
         self._default_rmt_mode = ModuleConf.RMT_MODES.get(Config().get_config('sync').get('sync_mod', 'copy'),
                                                           RmtMode.COPY)
 
     @staticmethod
-    def __transfer_command(file_item, target_file, rmt_mode):
+    def __minio_transfer(file_item, target_file, move=False):
+        """
+        通过rclone常驻服务转移到Minio，未配置对应的rclone远程或服务不可用时返回None
+        """
+        rclone = RcloneHelper()
+        if not rclone.minio_remote:
+            return None
+        return rclone.transfer(file_item, target_file, move=move, remote=rclone.minio_remote, strip_root=True,
+                               bwlimit=FileTransfer.__get_remote_bwlimit(file_item))
+
+    @staticmethod
+    def __get_remote_bwlimit(file_item):
+        """
+        Rclone、Minio远程转移的限速：目的为远程存储，按源文件所在设备的限速配置
+        """
+        return IoThrottleHelper().get_limit(DeviceThreadPool.get_device(file_item))
+
+    @staticmethod
+    def __get_transfer_devices(file_item, target_file, rmt_mode):
+        """
+        转移需要锁定的设备：硬链接、软链接及同设备内移动无需锁定设备，
+        Rclone及Minio转移到远程存储，并发数由远程转移服务控制
+        """
+        if rmt_mode in [RmtMode.LINK, RmtMode.SOFTLINK,
+                        RmtMode.RCLONE, RmtMode.RCLONECOPY, RmtMode.MINIO, RmtMode.MINIOCOPY]:
+            return []
+        src_device = DeviceThreadPool.get_device(file_item)
+        target_device = DeviceThreadPool.get_device(os.path.dirname(target_file))
+        if rmt_mode == RmtMode.MOVE and src_device == target_device:
+            return []
+        return [("dev", device) for device in {src_device, target_device} if device is not None]
+
+    @staticmethod
+    def __get_copy_progress(file_item):
+        """
+        生成复制进度回调，每秒最多更新一次转移进度，同时显示实时速度及限速
+        """
+        file_name = os.path.basename(file_item)
+        last_update = [0, 0]
+
+        def __update(copied, total):
+            now = time.time()
+            if copied < total and now - last_update[0] < 1:
+                return
+            speed = (copied - last_update[1]) / (now - last_update[0]) if last_update[0] and now > last_update[0] else 0
+            last_update[0], last_update[1] = now, copied
+            text = "正在复制 %s：%s / %s" % (file_name,
+                                         StringUtils.str_filesize(copied),
+                                         StringUtils.str_filesize(total))
+            if speed:
+                text = "%s，速度 %s/s" % (text, StringUtils.str_filesize(speed))
+            ProgressHelper().update(ptype="filetransfer", text=text)
+
+        return __update
+
+    @staticmethod
+    def get_transfer_lock_stats():
+        """
+        转移锁的等待及持有时间统计
+        """
+        return {
+            "file": file_locks.get_stats(),
+            "device": device_locks.get_stats()
+        }
+
+    def __transfer_command(self, file_item, target_file, rmt_mode, checksum=False, lock_device=True):
         """
         使用系统命令处理单个文件
         :param file_item: 文件路径
         :param target_file: 目标文件路径
         :param rmt_mode: RmtMode转移方式
+        :param checksum: 是否在复制的同时计算校验值，通过pop_transfer_checksum获取
+        :param lock_device: 是否锁定设备，并行转移小文件时不锁定
         """
-        with lock:
+        devices = self.__get_transfer_devices(file_item, target_file, rmt_mode)
+        # 复制及跨设备移动时计算校验值
+        hasher = FileChecksum() \
+            if checksum and self._transfer_checksum \
+            and (rmt_mode == RmtMode.COPY or (rmt_mode == RmtMode.MOVE and devices)) else None
+        with device_locks.lock(*(devices if lock_device else [])), \
+                file_locks.lock(os.path.normpath(target_file)):
             if rmt_mode == RmtMode.LINK:
                 # 更链接
                 retcode, retmsg = SystemUtils.link(file_item, target_file)
@@ -168,27 +380,70 @@ class FileTransfer:
                 # 软链接
                 retcode, retmsg = SystemUtils.softlink(file_item, target_file)
             elif rmt_mode == RmtMode.MOVE:
-                # 移动
-                retcode, retmsg = SystemUtils.move(file_item, target_file)
+                # 移动，跨盘复制时限速
+                retcode, retmsg = SystemUtils.move(file_item, target_file,
+                                                   callback=self.__get_copy_progress(file_item),
+                                                   hasher=hasher,
+                                                   limiter=IoThrottleHelper().get_limiter(target_file))
             elif rmt_mode == RmtMode.RCLONE:
-                # Rclone移动
-                retcode, retmsg = SystemUtils.rclone_move(file_item, target_file)
+                # Rclone移动，优先使用常驻服务
+                bwlimit = self.__get_remote_bwlimit(file_item)
+                retcode, retmsg = RcloneHelper().transfer(file_item, target_file, move=True, bwlimit=bwlimit) \
+                    or SystemUtils.rclone_move(file_item, target_file, bwlimit=bwlimit)
             elif rmt_mode == RmtMode.RCLONECOPY:
-                # Rclone复制
-                retcode, retmsg = SystemUtils.rclone_copy(file_item, target_file)
+                # Rclone复制，优先使用常驻服务
+                bwlimit = self.__get_remote_bwlimit(file_item)
+                retcode, retmsg = RcloneHelper().transfer(file_item, target_file, bwlimit=bwlimit) \
+                    or SystemUtils.rclone_copy(file_item, target_file, bwlimit=bwlimit)
             elif rmt_mode == RmtMode.MINIO:
-                # Minio移动
-                retcode, retmsg = SystemUtils.minio_move(file_item, target_file)
+                # Minio移动，配置了对应的rclone远程时使用rclone常驻服务
+                retcode, retmsg = self.__minio_transfer(file_item, target_file, move=True) \
+                    or SystemUtils.minio_move(file_item, target_file)
             elif rmt_mode == RmtMode.MINIOCOPY:
-                # Minio复制
-                retcode, retmsg = SystemUtils.minio_copy(file_item, target_file)
+                # Minio复制，配置了对应的rclone远程时使用rclone常驻服务
+                retcode, retmsg = self.__minio_transfer(file_item, target_file) \
+                    or SystemUtils.minio_copy(file_item, target_file)
             else:
-                # 复制
-                retcode, retmsg = SystemUtils.copy(file_item, target_file)
+                # 复制，限速
+                retcode, retmsg = SystemUtils.copy(file_item, target_file,
+                                                   callback=self.__get_copy_progress(file_item),
+                                                   hasher=hasher,
+                                                   limiter=IoThrottleHelper().get_limiter(target_file))
         if retcode != 0:
             log.error("【Rmt】%s" % retmsg)
+        elif hasher and hasher.get_value():
+            self._transfer_checksums[os.path.normpath(target_file)] = hasher.get_value()
         return retcode
 
+    def pop_transfer_checksum(self, target_file):
+        """
+        取出转移时计算的文件校验值，没有计算时返回None
+        """
+        if not target_file:
+            return None
+        return self._transfer_checksums.pop(os.path.normpath(target_file), None)
+
+    def __get_subtitle_index(self, dir_name):
+        """
+        查询目录的字幕索引，目录未变化时复用已建立的索引
+        """
+        try:
+            dir_mtime = os.stat(dir_name).st_mtime_ns
+        except OSError:
+            return None
+        with self._subtitle_index_lock:
+            cached = self._subtitle_indexes.get(dir_name)
+            if cached and cached[0] == dir_mtime:
+                self._subtitle_indexes.move_to_end(dir_name)
+                return cached[1]
+        sub_index = SubtitleIndex(dir_name)
+        with self._subtitle_index_lock:
+            self._subtitle_indexes[dir_name] = (dir_mtime, sub_index)
+            self._subtitle_indexes.move_to_end(dir_name)
+            while len(self._subtitle_indexes) > self._MAX_SUBTITLE_INDEXES:
+                self._subtitle_indexes.popitem(last=False)
+        return sub_index
+
     def __transfer_subtitles(self, org_name, new_name, rmt_mode):
         """
         根据文件名转移对应字幕文件
@@ -196,91 +451,36 @@ class FileTransfer:
         :param new_name: 新文件名
         :param rmt_mode: RmtMode转移方式
         """
-        # 字幕正则式
-        _zhcn_sub_re = r"([.\[(](((zh[-_])?(cn|ch[si]|sg|sc))|zho?" \
-                       r"|chinese|(cn|ch[si]|sg|zho?|eng)[-_&](cn|ch[si]|sg|zho?|eng)" \
-                       r"|简[体中]?)[.\])])" \
-                       r"|([\u4e00-\u9fa5]{0,3}[中双][\u4e00-\u9fa5]{0,2}[字文语][\u4e00-\u9fa5]{0,3})" \
-                       r"|简体|简中"
-        _zhtw_sub_re = r"([.\[(](((zh[-_])?(hk|tw|cht|tc))" \
-                       r"|繁[体中]?)[.\])])" \
-                       r"|繁体中[文字]|中[文字]繁体|繁体"
-        _eng_sub_re = r"[.\[(]eng[.\])]"
-
         # 比对文件名并转移字幕
         dir_name = os.path.dirname(org_name)
         file_name = os.path.basename(org_name)
-        file_list = PathUtils.get_dir_level1_files(dir_name, RMT_SUBEXT)
-        if len(file_list) == 0:
+        sub_index = self.__get_subtitle_index(dir_name)
+        if not sub_index or not sub_index.count:
             log.debug("【Rmt】%s 目录下没有找到字幕文件..." % dir_name)
-        else:
-            log.debug("【Rmt】字幕文件清单：" + str(file_list))
-            metainfo = MetaInfo(title=file_name)
-            for file_item in file_list:
-                sub_file_name = re.sub(_zhtw_sub_re,
-                                       ".",
-                                       re.sub(_zhcn_sub_re,
-                                              ".",
-                                              os.path.basename(file_item),
-                                              flags=re.I),
-                                       flags=re.I)
-                sub_file_name = re.sub(_eng_sub_re, ".", sub_file_name, flags=re.I)
-                sub_metainfo = MetaInfo(title=os.path.basename(file_item))
-                if (os.path.splitext(file_name)[0] == os.path.splitext(sub_file_name)[0]) or \
-                        (sub_metainfo.cn_name and sub_metainfo.cn_name == metainfo.cn_name) \
-                        or (sub_metainfo.en_name and sub_metainfo.en_name == metainfo.en_name):
-                    if metainfo.get_season_string() \
-                            and metainfo.get_season_string() != sub_metainfo.get_season_string():
-                        continue
-                    if metainfo.get_episode_string() \
-                            and metainfo.get_episode_string() != sub_metainfo.get_episode_string():
-                        continue
-                    new_file_type = ""
-                    # 兼容jellyfin字幕识别(多重识别), emby则会识别最后一个后缀
-                    if re.search(_zhcn_sub_re, file_item, re.I):
-                        new_file_type = ".chi.zh-cn"
-                    elif re.search(_zhtw_sub_re, file_item,
-                                   re.I):
-                        new_file_type = ".zh-tw"
-                    elif re.search(_eng_sub_re, file_item, re.I):
-                        new_file_type = ".eng"
-                    # 通过对比字幕文件大小  尽量转移所有存在的字幕
-                    file_ext = os.path.splitext(file_item)[-1]
-                    new_sub_tag_dict = {
-                        ".eng": ".英文",
-                        ".chi.zh-cn": ".简体中文",
-                        ".zh-tw": ".繁体中文"
-                    }
-                    new_sub_tag_list = [
-                        new_file_type if t == 0 else "%s%s(%s)" % (new_file_type,
-                                                                   new_sub_tag_dict.get(
-                                                                       new_file_type, ""
-                                                                   ),
-                                                                   t) for t in range(6)
-                    ]
-                    for new_sub_tag in new_sub_tag_list:
-                        new_file = os.path.splitext(new_name)[0] + new_sub_tag + file_ext
-                        # 如果字幕文件不存在, 直接转移字幕, 并跳出循环
-                        try:
-                            if not os.path.exists(new_file):
-                                log.debug("【Rmt】正在处理字幕：%s" % os.path.basename(file_item))
-                                retcode = self.__transfer_command(file_item=file_item,
-                                                                  target_file=new_file,
-                                                                  rmt_mode=rmt_mode)
-                                if retcode == 0:
-                                    log.info("【Rmt】字幕 %s %s完成" % (os.path.basename(file_item), rmt_mode.value))
-                                    break
-                                else:
-                                    log.error(
-                                        "【Rmt】字幕 %s %s失败，错误码 %s" % (file_name, rmt_mode.value, str(retcode)))
-                                    return retcode
-                            # 如果字幕文件的大小与已存在文件相同, 说明已经转移过了, 则跳出循环
-                            elif os.path.getsize(new_file) == os.path.getsize(file_item):
-                                log.info("【Rmt】字幕 %s 已存在" % new_file)
-                                break
-                            # 否则 循环继续 > 通过new_sub_tag_list 获取新的tag附加到字幕文件名, 继续检查是否能转移
-                        except OSError as reason:
-                            log.info("【Rmt】字幕 %s 出错了,原因: %s" % (new_file, str(reason)))
+            return 0
+        for file_item, new_files in sub_index.lookup(file_name, new_name):
+            for new_file in new_files:
+                # 如果字幕文件不存在, 直接转移字幕, 并跳出循环
+                try:
+                    if not os.path.exists(new_file):
+                        log.debug("【Rmt】正在处理字幕：%s" % os.path.basename(file_item))
+                        retcode = self.__transfer_command(file_item=file_item,
+                                                          target_file=new_file,
+                                                          rmt_mode=rmt_mode)
+                        if retcode == 0:
+                            log.info("【Rmt】字幕 %s %s完成" % (os.path.basename(file_item), rmt_mode.value))
+                            break
+                        else:
+                            log.error(
+                                "【Rmt】字幕 %s %s失败，错误码 %s" % (file_name, rmt_mode.value, str(retcode)))
+                            return retcode
+                    # 如果字幕文件的大小与已存在文件相同, 说明已经转移过了, 则跳出循环
+                    elif os.path.getsize(new_file) == os.path.getsize(file_item):
+                        log.info("【Rmt】字幕 %s 已存在" % new_file)
+                        break
+                    # 否则 循环继续 > 获取新的tag附加到字幕文件名, 继续检查是否能转移
+                except OSError as reason:
+                    log.info("【Rmt】字幕 %s 出错了,原因: %s" % (new_file, str(reason)))
         return 0
 
     def __transfer_bluray_dir(self, file_path, new_path, rmt_mode):
@@ -291,11 +491,17 @@ class FileTransfer:
         :param rmt_mode: RmtMode转移方式
         """
         log.info("【Rmt】正在%s目录：%s 到 %s" % (rmt_mode.value, file_path, new_path))
-        # 复制
-        retcode = self.__transfer_dir_files(src_dir=file_path,
-                                            target_dir=new_path,
-                                            rmt_mode=rmt_mode,
-                                            bludir=True)
+        if rmt_mode in [RmtMode.LINK, RmtMode.SOFTLINK, RmtMode.COPY, RmtMode.MOVE]:
+            # 本地转移通过暂存目录整体转移
+            retcode = self.__transfer_disc_dir(src_dir=file_path,
+                                               target_dir=new_path,
+                                               rmt_mode=rmt_mode)
+        else:
+            # 远程存储逐个文件转移
+            retcode = self.__transfer_dir_files(src_dir=file_path,
+                                                target_dir=new_path,
+                                                rmt_mode=rmt_mode,
+                                                bludir=True)
         if retcode == 0:
             log.info("【Rmt】文件 %s %s完成" % (file_path, rmt_mode.value))
         else:
@@ -308,21 +514,16 @@ class FileTransfer:
         :param path: 路径
         :return: True/False
         """
-        if not path:
+        if not path or not self._target_path_trie:
             return False
-        for tv_path in self._tv_path:
-            if PathUtils.is_path_in_path(tv_path, path):
-                return True
-        for movie_path in self._movie_path:
-            if PathUtils.is_path_in_path(movie_path, path):
-                return True
-        for anime_path in self._anime_path:
-            if PathUtils.is_path_in_path(anime_path, path):
-                return True
-        for unknown_path in self._unknown_path:
-            if PathUtils.is_path_in_path(unknown_path, path):
-                return True
-        return False
+        return True if self._target_path_trie.lookup(path) else False
+
+    def get_target_dir_paths(self):
+        """
+        返回所有媒体库目录及未识别目录
+        """
+        return [path for path in (self._movie_path or []) + (self._tv_path or []) +
+                (self._anime_path or []) + (self._unknown_path or []) if path]
 
     def __transfer_dir_files(self, src_dir, target_dir, rmt_mode, bludir=False):
         """
@@ -354,6 +555,109 @@ class FileTransfer:
             self.dbhelper.insert_transfer_blacklist(src_dir)
         return retcode
 
+    def __transfer_disc_dir(self, src_dir, target_dir, rmt_mode):
+        """
+        转移原盘目录：先在暂存目录中建立完整的目录结构，小文件并行转移，大文件依次分块复制并显示进度，
+        全部完成后将暂存目录改名为目的目录，中途失败时不会在目的目录留下不完整的原盘
+        :param src_dir: 原盘目录
+        :param target_dir: 目的目录
+        :param rmt_mode: RmtMode转移方式，仅支持本地转移
+        """
+        src_dir = os.path.normpath(src_dir)
+        target_dir = os.path.normpath(target_dir)
+        parent_dir, target_name = os.path.split(target_dir)
+        staging_dir = os.path.join(parent_dir, ".%s.%s%s" % (target_name, uuid.uuid4().hex[:8], RMT_STAGING_SUFFIX))
+        # 已转移到暂存目录的文件：(原文件, 暂存文件)
+        done_files = []
+        try:
+            # 建立目录结构
+            for root, _, _ in os.walk(src_dir):
+                if PathUtils.is_invalid_path(root + os.sep):
+                    continue
+                os.makedirs(os.path.join(staging_dir, os.path.relpath(root, src_dir)), exist_ok=True)
+            small_files, large_files = [], []
+            for file_item in PathUtils.get_dir_files(src_dir):
+                rel_file = os.path.relpath(file_item, src_dir)
+                if os.path.exists(os.path.join(target_dir, rel_file)):
+                    log.warn("【Rmt】%s 文件已存在" % os.path.join(target_dir, rel_file))
+                    continue
+                staging_file = os.path.join(staging_dir, rel_file)
+                os.makedirs(os.path.dirname(staging_file), exist_ok=True)
+                if os.path.getsize(file_item) < RMT_DISC_SMALL_FILE_SIZE:
+                    small_files.append((file_item, staging_file))
+                else:
+                    large_files.append((file_item, staging_file))
+            log.info("【Rmt】%s 共 %s 个小文件、%s 个大文件" % (src_dir, len(small_files), len(large_files)))
+            retcode = 0
+            # 小文件并行转移，暂存目录中的目标文件互不相同，无需等待设备锁
+            if small_files:
+                with ThreadPoolExecutor(max_workers=max(1, min(RMT_TRANSFER_THREADS, len(small_files)))) as executor:
+                    futures = [(file_item, staging_file,
+                                executor.submit(self.__transfer_command, file_item, staging_file, rmt_mode,
+                                                lock_device=False))
+                               for file_item, staging_file in small_files]
+                    for file_item, staging_file, future in futures:
+                        if future.cancelled():
+                            continue
+                        try:
+                            ret = future.result()
+                        except Exception as err:
+                            ExceptionUtils.exception_traceback(err)
+                            ret = -1
+                        if ret == 0:
+                            done_files.append((file_item, staging_file))
+                        elif retcode == 0:
+                            retcode = ret
+                            # 有文件失败时取消尚未开始的转移
+                            for _, _, pending in futures:
+                                pending.cancel()
+            # 大文件依次转移，复制时分块写入并更新进度
+            if retcode == 0:
+                for file_item, staging_file in large_files:
+                    log.info("【Rmt】正在%s原盘文件：%s" % (rmt_mode.value, file_item))
+                    retcode = self.__transfer_command(file_item=file_item,
+                                                      target_file=staging_file,
+                                                      rmt_mode=rmt_mode)
+                    if retcode != 0:
+                        break
+                    done_files.append((file_item, staging_file))
+            if retcode == 0:
+                self.__commit_staging_dir(staging_dir, target_dir)
+                self.dbhelper.insert_transfer_blacklist(src_dir)
+                return 0
+        except Exception as err:
+            ExceptionUtils.exception_traceback(err)
+            log.error("【Rmt】%s %s出错：%s" % (src_dir, rmt_mode.value, str(err)))
+            retcode = -1
+        # 失败时回滚：移动的文件移回原目录，删除暂存目录
+        if rmt_mode == RmtMode.MOVE:
+            for file_item, staging_file in done_files:
+                if os.path.exists(staging_file) and not os.path.exists(file_item):
+                    SystemUtils.move(staging_file, file_item)
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        return retcode
+
+    @staticmethod
+    def __commit_staging_dir(staging_dir, target_dir):
+        """
+        将暂存目录改名为目的目录，目的目录已有文件时逐项合并
+        """
+        if os.path.isdir(target_dir) and not os.listdir(target_dir):
+            os.rmdir(target_dir)
+        if not os.path.exists(target_dir):
+            os.rename(staging_dir, target_dir)
+            return
+        dirs = [(staging_dir, target_dir)]
+        while dirs:
+            cur_dir, cur_target = dirs.pop()
+            for name in os.listdir(cur_dir):
+                src, dest = os.path.join(cur_dir, name), os.path.join(cur_target, name)
+                if not os.path.exists(dest):
+                    os.rename(src, dest)
+                elif os.path.isdir(src) and os.path.isdir(dest):
+                    dirs.append((src, dest))
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
     def __transfer_origin_file(self, file_item, target_dir, rmt_mode):
         """
         按原文件名link文件到目的目录
@@ -413,7 +717,8 @@ class FileTransfer:
         log.info("【Rmt】正在转移文件：%s 到 %s" % (file_name, new_file))
         retcode = self.__transfer_command(file_item=file_item,
                                           target_file=new_file,
-                                          rmt_mode=rmt_mode)
+                                          rmt_mode=rmt_mode,
+                                          checksum=True)
         if retcode == 0:
             log.info("【Rmt】文件 %s %s完成" % (file_name, rmt_mode.value))
             self.dbhelper.insert_transfer_blacklist(file_item)
@@ -425,75 +730,21 @@ class FileTransfer:
                                          new_name=new_file,
                                          rmt_mode=rmt_mode)
 
-    def transfer_media(self,
-                       in_from: Enum,
-                       in_path,
-                       rmt_mode: RmtMode = None,
-                       files: list = None,
-                       target_dir=None,
-                       unknown_dir=None,
-                       tmdb_info=None,
-                       media_type: MediaType = None,
-                       season=None,
-                       episode: (EpisodeFormat, bool) = None,
-                       min_filesize=None,
-                       udf_flag=False,
-                       root_path=False):
+    def __get_transfer_files(self, in_from, in_path, files, episode_format, min_filesize, udf_flag):
         """
-        识别并转移一个文件、多个文件或者目录
-        :param in_from: 来源，即调用该功能的渠道
-        :param in_path: 转移的路径，可能是一个文件也可以是一个目录
-        :param files: 文件清单，非空时以该文件清单为准，为空时从in_path中按后缀和大小限制检索需要处理的文件清单
-        :param target_dir: 目的文件夹，非空的转移到该文件夹，为空时则按类型转移到配置文件中的媒体库文件夹
-        :param unknown_dir: 未识别文件夹，非空时未识别的媒体文件转移到该文件夹，为空时则使用配置文件中的未识别文件夹
-        :param rmt_mode: 文件转移方式
-        :param tmdb_info: 手动识别转移时传入的TMDB信息对象，如未输入，则按名称笔TMDB实时查询
-        :param media_type: 手动识别转移时传入的文件类型，如未输入，则自动识别
-        :param season: 手动识别目录或文件时传入的的字号，如未输入，则自动识别
-        :param episode: (EpisodeFormat，是否批处理匹配)
-        :param min_filesize: 过滤小文件大小的上限值
-        :param udf_flag: 自定义转移标志，为True时代表是自定义转移，此时很多处理不一样
-        :param root_path: 是否根目录下的文件
-        :return: 处理状态，错误信息
+        查找需要转移的文件清单
+        :return: 文件清单，蓝光原盘目录，处理状态，错误信息；文件清单为空时按处理状态及错误信息结束处理
         """
-
-        def __finish_transfer(status, message):
-            if status:
-                self.progress.update(ptype="filetransfer",
-                                     value=100,
-                                     text=f"{in_path} 转移成功！")
-            else:
-                self.progress.update(ptype="filetransfer",
-                                     value=100,
-                                     text=f"{in_path} 转移失败：{message}！")
-            self.progress.end('filetransfer')
-            return status, message
-
-        # 开始进度
-        self.progress.start('filetransfer')
-
-        episode = (None, False) if not episode else episode
-        if not in_path:
-            log.error("【Rmt】输入路径错误!")
-            return __finish_transfer(False, "输入路径错误")
-
-        if not rmt_mode:
-            rmt_mode = self._default_rmt_mode
-
-        log.info("【Rmt】开始处理：%s，转移方式：%s" % (in_path, rmt_mode.value))
-
-        success_flag = True
-        error_message = ""
         bluray_disk_dir = None
         if not files:
             # 如果传入的是个目录
             if os.path.isdir(in_path):
                 if not os.path.exists(in_path):
                     log.error("【Rmt】文件转移失败，目录不存在 %s" % in_path)
-                    return __finish_transfer(False, "目录不存在")
+                    return [], None, False, "目录不存在"
                 # 回收站及隐藏的文件不处理
                 if PathUtils.is_invalid_path(in_path):
-                    return __finish_transfer(False, "回收站或者隐藏文件夹")
+                    return [], None, False, "回收站或者隐藏文件夹"
                 # 判断是不是原盘文件夹
                 bluray_disk_dir = PathUtils.get_bluray_dir(in_path)
                 if bluray_disk_dir:
@@ -510,24 +761,23 @@ class FileTransfer:
                             min_filesize) * 1024 * 1024
                     # 查找目录下的文件
                     file_list = PathUtils.get_dir_files(in_path=in_path,
-                                                        episode_format=episode[0],
+                                                        episode_format=episode_format,
                                                         exts=RMT_MEDIAEXT,
                                                         filesize=now_filesize)
                     log.debug("【Rmt】文件清单：" + str(file_list))
                     if len(file_list) == 0:
                         log.warn("【Rmt】%s 目录下未找到媒体文件，当前最小文件大小限制为 %s"
                                  % (in_path, StringUtils.str_filesize(now_filesize)))
-                        return __finish_transfer(False,
-                                                 "目录下未找到媒体文件，当前最小文件大小限制为 %s"
-                                                 % StringUtils.str_filesize(now_filesize))
+                        return [], None, False, "目录下未找到媒体文件，当前最小文件大小限制为 %s" \
+                            % StringUtils.str_filesize(now_filesize)
             # 传入的是个文件
             else:
                 if not os.path.exists(in_path):
                     log.error("【Rmt】文件转移失败，文件不存在：%s" % in_path)
-                    return __finish_transfer(False, "文件不存在")
+                    return [], None, False, "文件不存在"
                 if os.path.splitext(in_path)[-1].lower() not in RMT_MEDIAEXT:
                     log.warn("【Rmt】不支持的媒体文件格式，不处理：%s" % in_path)
-                    return __finish_transfer(False, "不支持的媒体文件格式")
+                    return [], None, False, "不支持的媒体文件格式"
                 # 判断是不是原盘文件夹
                 bluray_disk_dir = PathUtils.get_bluray_dir(in_path)
                 if bluray_disk_dir:
@@ -542,23 +792,445 @@ class FileTransfer:
         #  过滤掉文件列表
         file_list, msg = self.check_ignore(file_list=file_list)
         if not file_list:
-            return __finish_transfer(True, msg)
+            return [], None, True, msg
 
         # 目录同步模式下，过滤掉文件列表中已处理过的
         if in_from == SyncType.MON:
             file_list = list(filter(self.dbhelper.is_transfer_notin_blacklist, file_list))
             if not file_list:
                 log.info("【Rmt】所有文件均已成功转移过，没有需要处理的文件！如需重新处理，请清理缓存（服务->清理转移缓存）")
-                return __finish_transfer(True, "没有新文件需要处理")
+                return [], None, True, "没有新文件需要处理"
+        return file_list, bluray_disk_dir, True, ""
+
+    def __iter_plan_media(self,
+                          in_path,
+                          file_list,
+                          bluray_disk_dir,
+                          rmt_mode,
+                          target_dir=None,
+                          unknown_dir=None,
+                          tmdb_info=None,
+                          media_type=None,
+                          season=None,
+                          episode=None,
+                          udf_flag=False,
+                          dir_cache=None):
+        """
+        规划阶段：识别文件并确定每个文件的处理方式、目的路径、是否覆盖及需要转移的字幕，不修改文件系统；
+        每识别出一个文件即返回其规划结果，调用方可在后续文件识别的同时执行转移
+        :param dir_cache: 媒体库目录列表缓存，为空时新建
+        :return: 迭代返回转移计划项，每项的action为：
+                 transfer 转移，unknown 未识别，exists 已存在，error 失败，skip 跳过，abort 中止处理（之后不再返回）
+        """
+        # 媒体库目录列表缓存
+        if not dir_cache:
+            dir_cache = DirListingCache()
+        # 本次已规划的目的文件（不含后缀）
+        planned_files = set()
         # API检索出媒体信息，传入一个文件列表，得出每一个文件的名称，这里是当前目录下所有的文件了
-        Medias = self.media.get_media_info_on_files(file_list, tmdb_info, media_type, season, episode[0])
-        if not Medias:
-            log.error("【Rmt】检索媒体信息出错！")
-            return __finish_transfer(False, "检索媒体信息出错")
+        # 并发识别，按顺序返回
+        Medias = self.media.iter_media_info_on_files(file_list, tmdb_info, media_type, season, episode)
+        file_count = len(file_list)
+        for count, (file_item, media) in enumerate(Medias, start=1):
+            # 数据库记录的路径
+            item = {
+                "file": file_item,
+                "reg_path": bluray_disk_dir if bluray_disk_dir else file_item,
+                "bluray": True if bluray_disk_dir else False,
+                "mode": rmt_mode.value,
+                "media": media
+            }
+            self.progress.update(ptype="filetransfer",
+                                 text="正在识别：%s（%s/%s）..." % (os.path.basename(file_item), count, file_count))
+            self.__plan_media_item(item=item,
+                                   in_path=in_path,
+                                   bluray_disk_dir=bluray_disk_dir,
+                                   rmt_mode=rmt_mode,
+                                   target_dir=target_dir,
+                                   unknown_dir=unknown_dir,
+                                   udf_flag=udf_flag,
+                                   dir_cache=dir_cache,
+                                   planned_files=planned_files)
+            yield item
+            if item.get("action") == "abort":
+                break
+
+    def __plan_media_item(self,
+                          item,
+                          in_path,
+                          bluray_disk_dir,
+                          rmt_mode,
+                          target_dir,
+                          unknown_dir,
+                          udf_flag,
+                          dir_cache,
+                          planned_files):
+        """
+        规划一个已识别的文件，结果写入计划项
+        :param planned_files: 本次已规划的目的文件（不含后缀）
+        """
+        file_item = item.get("file")
+        media = item.get("media")
+        try:
+            if not udf_flag:
+                if re.search(r'[./\s\[]+Sample[/.\s\]]+', file_item, re.IGNORECASE):
+                    log.warn("【Rmt】%s 可能是预告片，跳过..." % file_item)
+                    item.update({"action": "skip", "message": "可能是预告片"})
+                    return
+            # 未识别
+            if not media or not media.tmdb_info or not media.get_title_string():
+                item.update({"action": "abort" if udf_flag else "unknown",
+                             "message": "无法识别媒体信息",
+                             "target_dir": unknown_dir or self.__get_best_unknown_path(in_path)})
+                return
+            # 当前文件大小
+            media.size = os.path.getsize(file_item)
+            # 硬链接、软链接不占用目的目录的空间，无需预占
+            reserve_key = None if rmt_mode in [RmtMode.LINK, RmtMode.SOFTLINK] else file_item
+            # 目的目录，有输入target_dir时，往这个目录放
+            if target_dir:
+                dist_path = target_dir
+                self.freespace.reserve(target_dir, media.size, key=reserve_key)
+            else:
+                dist_path = self.__get_best_target_path(mtype=media.type,
+                                                        in_path=in_path,
+                                                        size=media.size,
+                                                        key=reserve_key)
+            item["dest"] = dist_path
+            if not dist_path:
+                item.update({"action": "abort" if udf_flag else "error",
+                             "message": "目的路径不存在",
+                             "alert": True})
+                return
+            if not os.path.exists(dist_path):
+                item.update({"action": "abort", "message": "目录不存在：%s" % dist_path})
+                return
+            # 判断文件是否已存在，返回：目录存在标志、目录名、文件存在标志、文件名
+            dir_exist_flag, ret_dir_path, file_exist_flag, ret_file_path = self.__is_media_exists(dist_path,
+                                                                                                  media,
+                                                                                                  dir_cache)
+            if ret_file_path and os.path.splitext(ret_file_path)[0] in planned_files:
+                dir_exist_flag = file_exist_flag = True
+            item.update({"target_dir": ret_dir_path, "target_base": ret_file_path})
+            # 新文件后缀
+            file_ext = os.path.splitext(file_item)[-1]
+            # 路径存在
+            if dir_exist_flag:
+                # 蓝光原盘
+                if bluray_disk_dir:
+                    item.update({"action": "abort" if udf_flag else "exists",
+                                 "message": "蓝光原盘目录已存在：%s" % ret_dir_path})
+                    return
+                # 文件存在
+                if file_exist_flag:
+                    if rmt_mode != RmtMode.SOFTLINK \
+                            and os.path.exists(ret_file_path) \
+                            and (media.size > os.path.getsize(ret_file_path) and self._filesize_cover or udf_flag):
+                        ret_file_path = os.path.splitext(ret_file_path)[0]
+                        item.update({"target_base": ret_file_path,
+                                     "target_file": "%s%s" % (ret_file_path, file_ext),
+                                     "overwrite": True,
+                                     "exist": 1})
+                    else:
+                        item.update({"action": "exists", "message": "文件 %s 已存在" % ret_file_path})
+                        return
+            # 路径不存在
+            else:
+                if not ret_dir_path:
+                    item.update({"action": "abort" if udf_flag else "error",
+                                 "message": "识别失败，无法从文件名中识别出季集信息",
+                                 "record_unknown": True})
+                    return
+                item["mkdir"] = True
+            if not bluray_disk_dir and not item.get("overwrite"):
+                if not ret_file_path:
+                    item.update({"action": "abort" if udf_flag else "error",
+                                 "message": "识别失败，无法从文件名中识别出集数",
+                                 "record_unknown": True})
+                    return
+                item["target_file"] = "%s%s" % (ret_file_path, file_ext)
+            # 需要转移的字幕
+            if not bluray_disk_dir:
+                planned_files.add(os.path.splitext(item["target_file"])[0])
+                sub_index = self.__get_subtitle_index(os.path.dirname(file_item))
+                item["subtitles"] = [{"file": sub_file, "target": new_files[0]}
+                                     for sub_file, new_files in (sub_index.lookup(os.path.basename(file_item),
+                                                                                  item["target_file"])
+                                                                 if sub_index else [])]
+            item["action"] = "transfer"
+        except Exception as err:
+            ExceptionUtils.exception_traceback(err)
+            log.error("【Rmt】文件转移时发生错误：%s - %s" % (str(err), traceback.format_exc()))
+            item.update({"action": "skip", "message": str(err)})
+
+    def __execute_plan_item(self, item, rmt_mode, in_from, dir_cache=None):
+        """
+        执行一项转移计划，转移前后记录预写日志
+        :param dir_cache: 规划使用的媒体库目录列表缓存，写入后清除目的目录的缓存
+        :return: 返回码
+        """
+        bluray = item.get("bluray")
+        target = item.get("target_dir") if bluray else item.get("target_file")
+        history = self.dbhelper.build_transfer_history(in_from=in_from,
+                                                       rmt_mode=rmt_mode,
+                                                       in_path=item.get("reg_path"),
+                                                       out_path=None if bluray else target,
+                                                       dest=item.get("dest"),
+                                                       media_info=item.get("media"))
+        jid = item["journal"] = self.journal.begin(src=item.get("file"),
+                                                   target=target,
+                                                   rmt_mode=rmt_mode,
+                                                   bluray=bluray,
+                                                   history=history)
+        ret = None
+        try:
+            ret = self.__transfer_plan_item(item, rmt_mode)
+        except Exception:
+            self.journal.fail(jid)
+            raise
+        finally:
+            # 文件已写入或转移失败，释放预占的空间，在本地写入了数据的同时从剩余空间中扣除
+            written = ret == 0 and bool(self.__get_transfer_devices(item.get("file"), target, rmt_mode))
+            self.freespace.release(item.get("file"), written=written)
+            # 目的目录已变化，后续规划重新列出
+            if dir_cache:
+                dir_cache.invalidate(target)
+        if ret == 0:
+            self.journal.done(jid, checksum=None if bluray else self._transfer_checksums.get(os.path.normpath(target)))
+        else:
+            self.journal.fail(jid)
+        return ret
+
+    def __transfer_plan_item(self, item, rmt_mode):
+        """
+        转移一项转移计划的文件或蓝光原盘目录
+        :return: 返回码
+        """
+        if item.get("mkdir"):
+            log.debug("【Rmt】正在创建目录：%s" % item.get("target_dir"))
+            os.makedirs(item.get("target_dir"), exist_ok=True)
+        if item.get("bluray"):
+            ret = self.__transfer_bluray_dir(item.get("file"), item.get("target_dir"), rmt_mode)
+        else:
+            if item.get("overwrite"):
+                log.info("【Rmt】文件 %s 已存在，覆盖..." % item.get("target_file"))
+            ret = self.__transfer_file(file_item=item.get("file"),
+                                       new_file=item.get("target_file"),
+                                       rmt_mode=rmt_mode,
+                                       over_flag=item.get("overwrite") or False)
+        # 移动模式随机休眠（兼容一些网盘挂载目录）
+        if ret == 0 and rmt_mode == RmtMode.MOVE:
+            sleep(round(random.uniform(0, 1), 1))
+        return ret
+
+    def __execute_plan(self, plan_items, rmt_mode, in_from, dir_cache=None, sequential=False):
+        """
+        执行阶段：逐项接收规划结果，需转移的立即提交到按设备调度的线程池，识别与转移同时进行，同一设备上的复制、移动依次执行
+        :param plan_items: 转移计划项的迭代器
+        :param dir_cache: 规划使用的媒体库目录列表缓存
+        :param sequential: 按计划顺序依次执行，遇到失败即停止
+        :return: 转移计划清单，{计划序号: 返回码或异常}
+        """
+        plan = []
+        results = {}
+        futures = {}
+        pool = None if sequential else DeviceThreadPool(max_workers=RMT_TRANSFER_THREADS)
+        try:
+            for idx, item in enumerate(plan_items):
+                plan.append(item)
+                if item.get("action") != "transfer":
+                    # 不需要转移，释放预占的空间
+                    self.freespace.release(item.get("file"))
+                    continue
+                if sequential:
+                    try:
+                        results[idx] = self.__execute_plan_item(item, rmt_mode, in_from, dir_cache)
+                    except Exception as err:
+                        results[idx] = err
+                    if results[idx] != 0:
+                        break
+                    continue
+                target = item.get("target_file") or item.get("target_dir")
+                paths = [item.get("file"), target] \
+                    if self.__get_transfer_devices(item.get("file"), target, rmt_mode) else []
+                futures[idx] = pool.submit(self.__execute_plan_item, item, rmt_mode, in_from, dir_cache, paths=paths)
+            for done, (idx, future) in enumerate(futures.items(), start=1):
+                try:
+                    results[idx] = future.result()
+                except Exception as err:
+                    results[idx] = err
+                self.progress.update(ptype="filetransfer",
+                                     value=round(done / len(futures) * 100) - (0.5 / len(futures) * 100),
+                                     text="已转移 %s/%s 个文件..." % (done, len(futures)))
+        finally:
+            # 提前结束时停止识别
+            if hasattr(plan_items, "close"):
+                plan_items.close()
+            if pool:
+                pool.shutdown()
+            self.__release_plan(plan)
+        return plan, results
+
+    def __release_plan(self, plan):
+        """
+        释放转移计划预占的空间
+        """
+        for item in plan:
+            self.freespace.release(item.get("file"))
+
+    @staticmethod
+    def __get_plan_preview(plan):
+        """
+        转移计划转为可序列化的预览数据
+        """
+        preview = []
+        for item in plan:
+            media = item.get("media")
+            preview_item = {key: value for key, value in item.items() if key != "media"}
+            if media and media.tmdb_info:
+                preview_item.update({"title": media.get_title_string(),
+                                     "type": media.type.value,
+                                     "season_episode": media.get_season_episode_string(),
+                                     "size": StringUtils.str_filesize(media.size) if media.size else ""})
+            preview.append(preview_item)
+        return preview
+
+    def preview_media(self,
+                      in_from: Enum,
+                      in_path,
+                      rmt_mode: RmtMode = None,
+                      files: list = None,
+                      target_dir=None,
+                      unknown_dir=None,
+                      tmdb_info=None,
+                      media_type: MediaType = None,
+                      season=None,
+                      episode: (EpisodeFormat, bool) = None,
+                      min_filesize=None,
+                      udf_flag=False):
+        """
+        预览转移计划，只识别及规划，不转移文件也不写入数据库，参数同transfer_media
+        :return: 处理状态，错误信息，转移计划
+        """
+        episode = (None, False) if not episode else episode
+        if not in_path:
+            return False, "输入路径错误", []
+        if not rmt_mode:
+            rmt_mode = self._default_rmt_mode
+        file_list, bluray_disk_dir, status, message = self.__get_transfer_files(in_from=in_from,
+                                                                                in_path=in_path,
+                                                                                files=files,
+                                                                                episode_format=episode[0],
+                                                                                min_filesize=min_filesize,
+                                                                                udf_flag=udf_flag)
+        if not file_list:
+            return status, message, []
+        # 预览需要完整的计划，全部识别完成后返回
+        plan = list(self.__iter_plan_media(in_path=in_path,
+                                           file_list=file_list,
+                                           bluray_disk_dir=bluray_disk_dir,
+                                           rmt_mode=rmt_mode,
+                                           target_dir=target_dir,
+                                           unknown_dir=unknown_dir,
+                                           tmdb_info=tmdb_info,
+                                           media_type=media_type,
+                                           season=season,
+                                           episode=episode[0],
+                                           udf_flag=udf_flag))
+        self.__release_plan(plan)
+        aborts = [item.get("message") for item in plan if item.get("action") == "abort"]
+        if aborts:
+            return False, aborts[0], self.__get_plan_preview(plan)
+        return True, "", self.__get_plan_preview(plan)
+
+    def transfer_media(self,
+                       in_from: Enum,
+                       in_path,
+                       rmt_mode: RmtMode = None,
+                       files: list = None,
+                       target_dir=None,
+                       unknown_dir=None,
+                       tmdb_info=None,
+                       media_type: MediaType = None,
+                       season=None,
+                       episode: (EpisodeFormat, bool) = None,
+                       min_filesize=None,
+                       udf_flag=False,
+                       root_path=False):
+        """
+        识别并转移一个文件、多个文件或者目录，每识别一个文件即规划并按设备并行转移，最后批量登记转移记录
+        :param in_from: 来源，即调用该功能的渠道
+        :param in_path: 转移的路径，可能是一个文件也可以是一个目录
+        :param files: 文件清单，非空时以该文件清单为准，为空时从in_path中按后缀和大小限制检索需要处理的文件清单
+        :param target_dir: 目的文件夹，非空的转移到该文件夹，为空时则按类型转移到配置文件中的媒体库文件夹
+        :param unknown_dir: 未识别文件夹，非空时未识别的媒体文件转移到该文件夹，为空时则使用配置文件中的未识别文件夹
+        :param rmt_mode: 文件转移方式
+        :param tmdb_info: 手动识别转移时传入的TMDB信息对象，如未输入，则按名称笔TMDB实时查询
+        :param media_type: 手动识别转移时传入的文件类型，如未输入，则自动识别
+        :param season: 手动识别目录或文件时传入的的字号，如未输入，则自动识别
+        :param episode: (EpisodeFormat，是否批处理匹配)
+        :param min_filesize: 过滤小文件大小的上限值
+        :param udf_flag: 自定义转移标志，为True时代表是自定义转移，此时很多处理不一样
+        :param root_path: 是否根目录下的文件
+        :return: 处理状态，错误信息
+        """
+
+        def __finish_transfer(status, message):
+            if status:
+                self.progress.update(ptype="filetransfer",
+                                     value=100,
+                                     text=f"{in_path} 转移成功！")
+            else:
+                self.progress.update(ptype="filetransfer",
+                                     value=100,
+                                     text=f"{in_path} 转移失败：{message}！")
+            self.progress.end('filetransfer')
+            return status, message
+
+        # 开始进度
+        self.progress.start('filetransfer')
+
+        episode = (None, False) if not episode else episode
+        if not in_path:
+            log.error("【Rmt】输入路径错误!")
+            return __finish_transfer(False, "输入路径错误")
+
+        if not rmt_mode:
+            rmt_mode = self._default_rmt_mode
+
+        log.info("【Rmt】开始处理：%s，转移方式：%s" % (in_path, rmt_mode.value))
+
+        file_list, bluray_disk_dir, status, message = self.__get_transfer_files(in_from=in_from,
+                                                                                in_path=in_path,
+                                                                                files=files,
+                                                                                episode_format=episode[0],
+                                                                                min_filesize=min_filesize,
+                                                                                udf_flag=udf_flag)
+        if not file_list:
+            return __finish_transfer(status, message)
+        file_count = len(file_list)
 
         # 更新进度
-        self.progress.update(ptype="filetransfer", text=f"共 {len(Medias)} 个文件需要处理...")
+        self.progress.update(ptype="filetransfer", text=f"共 {file_count} 个文件需要处理...")
 
+        # 边识别规划边执行，自定义转移时依次执行，失败即停止，规划与执行共用媒体库目录列表缓存
+        dir_cache = DirListingCache()
+        plan_items = self.__iter_plan_media(in_path=in_path,
+                                            file_list=file_list,
+                                            bluray_disk_dir=bluray_disk_dir,
+                                            rmt_mode=rmt_mode,
+                                            target_dir=target_dir,
+                                            unknown_dir=unknown_dir,
+                                            tmdb_info=tmdb_info,
+                                            media_type=media_type,
+                                            season=season,
+                                            episode=episode[0],
+                                            udf_flag=udf_flag,
+                                            dir_cache=dir_cache)
+        plan, results = self.__execute_plan(plan_items, rmt_mode, in_from, dir_cache=dir_cache, sequential=udf_flag)
+
+        success_flag = True
+        error_message = ""
         # 统计总的文件数、失败文件数、需要提醒的失败数
         failed_count = 0
         alert_count = 0
@@ -570,197 +1242,80 @@ class FileTransfer:
         refresh_library_items = []
         # 需要下载字段的清单
         download_subtitle_items = []
-        # 处理识别后的每一个文件或单个文件夹
-        for file_item, media in Medias.items():
+        # 需要登记的转移历史记录及对应的预写日志
+        transfer_histories = []
+        journal_ids = []
+        udf_failed = False
+        # 处理每一个文件或单个文件夹的转移结果
+        for idx, item in enumerate(plan):
             try:
                 # 总数量
                 total_count = total_count + 1
-
-                if not udf_flag:
-                    if re.search(r'[./\s\[]+Sample[/.\s\]]+', file_item, re.IGNORECASE):
-                        log.warn("【Rmt】%s 可能是预告片，跳过..." % file_item)
-                        continue
-
+                action = item.get("action")
+                file_item = item.get("file")
+                reg_path = item.get("reg_path")
+                media = item.get("media")
                 # 文件名
                 file_name = os.path.basename(file_item)
-                # 更新进度
-                self.progress.update(ptype="filetransfer",
-                                     value=round(total_count/len(Medias) * 100) - (0.5/len(Medias) * 100),
-                                     text="正在处理：%s ..." % file_name)
-
-                # 数据库记录的路径
-                if bluray_disk_dir:
-                    reg_path = bluray_disk_dir
-                else:
-                    reg_path = file_item
-                # 未识别
-                if not media or not media.tmdb_info or not media.get_title_string():
-                    log.warn("【Rmt】%s 无法识别媒体信息！" % file_name)
+                if action == "skip":
+                    continue
+                if action == "abort":
+                    log.error("【Rmt】%s 转移失败：%s" % (file_name, item.get("message")))
+                    break
+                if action == "exists":
+                    log.warn("【Rmt】%s" % item.get("message"))
+                    failed_count += 1
+                    continue
+                if action in ["unknown", "error"]:
                     success_flag = False
-                    error_message = "无法识别媒体信息"
+                    error_message = item.get("message")
+                    log.warn("【Rmt】%s %s！" % (file_name, error_message))
                     self.progress.update(ptype="filetransfer", text=error_message)
-                    if udf_flag:
-                        return __finish_transfer(success_flag, error_message)
+                    is_need_insert_unknown = False
                     # 记录未识别
-                    is_need_insert_unknown = self.dbhelper.is_need_insert_transfer_unknown(reg_path)
-                    if is_need_insert_unknown:
-                        self.dbhelper.insert_transfer_unknown(reg_path, target_dir, rmt_mode)
+                    if action == "unknown" or item.get("record_unknown"):
+                        is_need_insert_unknown = self.dbhelper.is_need_insert_transfer_unknown(reg_path)
+                        if is_need_insert_unknown:
+                            self.dbhelper.insert_transfer_unknown(reg_path, target_dir, rmt_mode)
+                            alert_count += 1
+                    elif item.get("alert"):
                         alert_count += 1
                     failed_count += 1
-                    if error_message not in alert_messages and is_need_insert_unknown:
+                    if error_message not in alert_messages and (is_need_insert_unknown or item.get("alert")):
                         alert_messages.append(error_message)
                     # 原样转移过去
-                    if unknown_dir:
-                        log.warn("【Rmt】%s 按原文件名转移到未识别目录：%s" % (file_name, unknown_dir))
-                        self.__transfer_origin_file(file_item=file_item, target_dir=unknown_dir, rmt_mode=rmt_mode)
-                    elif self._unknown_path:
-                        unknown_path = self.__get_best_unknown_path(in_path)
-                        if not unknown_path:
-                            continue
-                        log.warn("【Rmt】%s 按原文件名转移到未识别目录：%s" % (file_name, unknown_path))
-                        self.__transfer_origin_file(file_item=file_item, target_dir=unknown_path, rmt_mode=rmt_mode)
-                    else:
-                        log.error("【Rmt】%s 无法识别媒体信息！" % file_name)
+                    if action == "unknown" and item.get("target_dir"):
+                        log.warn("【Rmt】%s 按原文件名转移到未识别目录：%s" % (file_name, item.get("target_dir")))
+                        self.__transfer_origin_file(file_item=file_item,
+                                                    target_dir=item.get("target_dir"),
+                                                    rmt_mode=rmt_mode)
                     continue
-                # 当前文件大小
-                media.size = os.path.getsize(file_item)
-                # 目的目录，有输入target_dir时，往这个目录放
-                if target_dir:
-                    dist_path = target_dir
-                else:
-                    dist_path = self.__get_best_target_path(mtype=media.type, in_path=in_path, size=media.size)
-                if not dist_path:
-                    log.error("【Rmt】文件转移失败，目的路径不存在！")
+                if idx not in results:
+                    continue
+                ret = results.get(idx)
+                if ret != 0:
                     success_flag = False
-                    error_message = "目的路径不存在"
+                    if isinstance(ret, Exception):
+                        ExceptionUtils.exception_traceback(ret)
+                        error_message = "文件转移时发生错误：%s" % str(ret)
+                        log.error("【Rmt】%s" % error_message)
+                    else:
+                        error_message = "蓝光目录转移失败，错误码：%s" % ret if bluray_disk_dir \
+                            else "文件转移失败，错误码 %s" % ret
+                    self.progress.update(ptype="filetransfer", text=error_message)
+                    if udf_flag:
+                        # 先登记已转移成功的文件再返回
+                        udf_failed = True
+                        break
                     failed_count += 1
                     alert_count += 1
                     if error_message not in alert_messages:
                         alert_messages.append(error_message)
                     continue
-                if dist_path and not os.path.exists(dist_path):
-                    return __finish_transfer(False, "目录不存在：%s" % dist_path)
-
-                # 判断文件是否已存在，返回：目录存在标志、目录名、文件存在标志、文件名
-                dir_exist_flag, ret_dir_path, file_exist_flag, ret_file_path = self.__is_media_exists(dist_path, media)
-                # 新文件后缀
-                file_ext = os.path.splitext(file_item)[-1]
-                new_file = ret_file_path
-                # 已存在的文件数量
-                exist_filenum = 0
-                handler_flag = False
-                # 路径存在
-                if dir_exist_flag:
-                    # 蓝光原盘
-                    if bluray_disk_dir:
-                        log.warn("【Rmt】蓝光原盘目录已存在：%s" % ret_dir_path)
-                        if udf_flag:
-                            return __finish_transfer(False, "蓝光原盘目录已存在：%s" % ret_dir_path)
-                        failed_count += 1
-                        continue
-                    # 文件存在
-                    if file_exist_flag:
-                        exist_filenum = exist_filenum + 1
-                        if rmt_mode != RmtMode.SOFTLINK:
-                            if media.size > os.path.getsize(ret_file_path) and self._filesize_cover or udf_flag:
-                                ret_file_path = os.path.splitext(ret_file_path)[0]
-                                new_file = "%s%s" % (ret_file_path, file_ext)
-                                log.info("【Rmt】文件 %s 已存在，覆盖..." % new_file)
-                                ret = self.__transfer_file(file_item=file_item,
-                                                           new_file=new_file,
-                                                           rmt_mode=rmt_mode,
-                                                           over_flag=True)
-                                if ret != 0:
-                                    success_flag = False
-                                    error_message = "文件转移失败，错误码 %s" % ret
-                                    self.progress.update(ptype="filetransfer", text=error_message)
-                                    if udf_flag:
-                                        return __finish_transfer(success_flag, error_message)
-                                    failed_count += 1
-                                    alert_count += 1
-                                    if error_message not in alert_messages:
-                                        alert_messages.append(error_message)
-                                    continue
-                                handler_flag = True
-                            else:
-                                log.warn("【Rmt】文件 %s 已存在" % ret_file_path)
-                                failed_count += 1
-                                continue
-                        else:
-                            log.warn("【Rmt】文件 %s 已存在" % ret_file_path)
-                            failed_count += 1
-                            continue
-                # 路径不存在
-                else:
-                    if not ret_dir_path:
-                        log.error("【Rmt】拼装目录路径错误，无法从文件名中识别出季集信息：%s" % file_item)
-                        success_flag = False
-                        error_message = "识别失败，无法从文件名中识别出季集信息"
-                        self.progress.update(ptype="filetransfer", text=error_message)
-                        if udf_flag:
-                            return __finish_transfer(success_flag, error_message)
-                        # 记录未识别
-                        is_need_insert_unknown = self.dbhelper.is_need_insert_transfer_unknown(reg_path)
-                        if is_need_insert_unknown:
-                            self.dbhelper.insert_transfer_unknown(reg_path, target_dir, rmt_mode)
-                            alert_count += 1
-                        failed_count += 1
-                        if error_message not in alert_messages and is_need_insert_unknown:
-                            alert_messages.append(error_message)
-                        continue
-                    else:
-                        # 创建电录
-                        log.debug("【Rmt】正在创建目录：%s" % ret_dir_path)
-                        os.makedirs(ret_dir_path)
-                # 转移蓝光原盘
-                if bluray_disk_dir:
-                    ret = self.__transfer_bluray_dir(file_item, ret_dir_path, rmt_mode)
-                    if ret != 0:
-                        success_flag = False
-                        error_message = "蓝光目录转移失败，错误码：%s" % ret
-                        self.progress.update(ptype="filetransfer", text=error_message)
-                        if udf_flag:
-                            return __finish_transfer(success_flag, error_message)
-                        failed_count += 1
-                        alert_count += 1
-                        if error_message not in alert_messages:
-                            alert_messages.append(error_message)
-                        continue
-                else:
-                    # 开始转移文件
-                    if not handler_flag:
-                        if not ret_file_path:
-                            log.error("【Rmt】拼装文件路径错误，无法从文件名中识别出集数：%s" % file_item)
-                            success_flag = False
-                            error_message = "识别失败，无法从文件名中识别出集数"
-                            self.progress.update(ptype="filetransfer", text=error_message)
-                            if udf_flag:
-                                return __finish_transfer(success_flag, error_message)
-                            # 记录未识别
-                            is_need_insert_unknown = self.dbhelper.is_need_insert_transfer_unknown(reg_path)
-                            if is_need_insert_unknown:
-                                self.dbhelper.insert_transfer_unknown(reg_path, target_dir, rmt_mode)
-                                alert_count += 1
-                            failed_count += 1
-                            if error_message not in alert_messages and is_need_insert_unknown:
-                                alert_messages.append(error_message)
-                            continue
-                        new_file = "%s%s" % (ret_file_path, file_ext)
-                        ret = self.__transfer_file(file_item=file_item,
-                                                   new_file=new_file,
-                                                   rmt_mode=rmt_mode,
-                                                   over_flag=False)
-                        if ret != 0:
-                            success_flag = False
-                            error_message = "文件转移失败，错误码 %s" % ret
-                            self.progress.update(ptype="filetransfer", text=error_message)
-                            if udf_flag:
-                                return __finish_transfer(success_flag, error_message)
-                            failed_count += 1
-                            alert_count += 1
-                            if error_message not in alert_messages:
-                                alert_messages.append(error_message)
-                            continue
+                dist_path = item.get("dest")
+                ret_dir_path = item.get("target_dir")
+                ret_file_path = item.get("target_base")
+                new_file = item.get("target_file")
                 # 媒体库刷新条目：类型-类别-标题-年份
                 refresh_item = {"type": media.type, "category": media.category, "title": media.title,
                                 "year": media.year, "target_path": dist_path}
@@ -785,14 +1340,22 @@ class FileTransfer:
                 # 登记字幕下载
                 if subtitle_item not in download_subtitle_items:
                     download_subtitle_items.append(subtitle_item)
-                # 转移历史记录
-                self.dbhelper.insert_transfer_history(
-                    in_from=in_from,
-                    rmt_mode=rmt_mode,
-                    in_path=reg_path,
-                    out_path=new_file if not bluray_disk_dir else None,
-                    dest=dist_path,
-                    media_info=media)
+                # 转移历史记录，批量登记
+                transfer_histories.append({
+                    "in_from": in_from,
+                    "rmt_mode": rmt_mode,
+                    "in_path": reg_path,
+                    "out_path": new_file if not bluray_disk_dir else None,
+                    "dest": dist_path,
+                    "media_info": media,
+                    "checksum": self.pop_transfer_checksum(new_file) if not bluray_disk_dir else None
+                })
+                journal_ids.append(item.get("journal"))
+                if len(transfer_histories) >= self._HISTORY_BATCH_SIZE:
+                    self.dbhelper.insert_transfer_histories(transfer_histories)
+                    self.journal.commit(journal_ids)
+                    transfer_histories = []
+                    journal_ids = []
                 # 未识别手动识别或历史记录重新识别的批处理模式
                 if isinstance(episode[1], bool) and episode[1]:
                     # 未识别手动识别，更改未识别记录为已处理
@@ -801,7 +1364,7 @@ class FileTransfer:
                 if media.type == MediaType.MOVIE:
                     self.message.send_transfer_movie_message(in_from,
                                                              media,
-                                                             exist_filenum,
+                                                             item.get("exist") or 0,
                                                              self._movie_category_flag)
                 # 否则登记汇总发消息
                 else:
@@ -823,16 +1386,26 @@ class FileTransfer:
                                                    file_name=os.path.basename(ret_file_path))
                 # 更新进度
                 self.progress.update(ptype="filetransfer",
-                                     value=round(total_count / len(Medias) * 100),
+                                     value=round(total_count / len(plan) * 100),
                                      text="%s 转移完成" % file_name)
-                # 移动模式随机休眠（兼容一些网盘挂载目录）
-                if rmt_mode == RmtMode.MOVE:
-                    sleep(round(random.uniform(0, 1), 1))
-
             except Exception as err:
                 ExceptionUtils.exception_traceback(err)
                 log.error("【Rmt】文件转移时发生错误：%s - %s" % (str(err), traceback.format_exc()))
+        # 登记剩余的转移历史记录
+        if transfer_histories:
+            self.dbhelper.insert_transfer_histories(transfer_histories)
+            self.journal.commit(journal_ids)
+        # 自定义转移失败即停止
+        if udf_failed:
+            return __finish_transfer(success_flag, error_message)
         # 循环结束
+        if not total_count:
+            log.error("【Rmt】检索媒体信息出错！")
+            return __finish_transfer(False, "检索媒体信息出错")
+        # 中止处理
+        aborts = [item for item in plan if item.get("action") == "abort"]
+        if aborts:
+            return __finish_transfer(False, aborts[0].get("message"))
         # 统计完成情况，发送通知
         if message_medias:
             self.message.send_transfer_tv_message(message_medias, in_from)
@@ -847,13 +1420,16 @@ class FileTransfer:
         if alert_count > 0:
             self.message.send_transfer_fail_message(in_path, alert_count, "、".join(alert_messages))
         elif failed_count == 0:
+            # 整个目录已处理完成，目录未变化时不再重新扫描
+            if not files:
+                self.journal.complete_dir(in_path, target_dir, rmt_mode)
             # 删除空目录
             if rmt_mode == RmtMode.MOVE \
                     and os.path.exists(in_path) \
                     and os.path.isdir(in_path) \
                     and not root_path \
-                    and not PathUtils.get_dir_files(in_path=in_path, exts=RMT_MEDIAEXT) \
-                    and not PathUtils.get_dir_files(in_path=in_path, exts=['.!qb', '.part']):
+                    and not any(PathUtils.iter_dir_files(in_path=in_path, exts=RMT_MEDIAEXT)) \
+                    and not any(PathUtils.iter_dir_files(in_path=in_path, exts=['.!qb', '.part'])):
                 log.info("【Rmt】目录下已无媒体文件及正在下载的文件，移动模式下删除目录：%s" % in_path)
                 shutil.rmtree(in_path)
         return __finish_transfer(success_flag, error_message)
@@ -883,6 +1459,9 @@ class FileTransfer:
         for path in PathUtils.get_dir_level1_medias(s_path, RMT_MEDIAEXT):
             if PathUtils.is_invalid_path(path):
                 continue
+            if self.journal.is_dir_completed(path, t_path, rmt_mode):
+                print("【Rmt】%s 已处理完成且没有变化，跳过" % path)
+                continue
             ret, ret_msg = self.transfer_media(in_from=SyncType.MAN,
                                                in_path=path,
                                                target_dir=t_path,
@@ -892,13 +1471,17 @@ class FileTransfer:
 
     def __is_media_exists(self,
                           media_dest,
-                          media):
+                          media,
+                          dir_cache=None):
         """
         判断媒体文件是否忆存在
         :param media_dest: 媒体文件所在目录
         :param media: 已识别的媒体信息
+        :param dir_cache: 目录列表缓存，为空时新建
         :return: 目录是否存在，目录路径，文件是否存在，文件路径
         """
+        if not dir_cache:
+            dir_cache = DirListingCache()
         # 返回变量
         dir_exist_flag = False
         file_exist_flag = False
@@ -916,25 +1499,23 @@ class FileTransfer:
                 for m_type in [RMT_FAVTYPE, media.category]:
                     type_path = os.path.join(media_dest, m_type, dir_name)
                     # 目录是否存在
-                    if os.path.exists(type_path):
+                    if dir_cache.exists(type_path):
                         file_path = type_path
                         break
             # 返回路径
             ret_dir_path = file_path
             # 路径存在标志
-            if os.path.exists(file_path):
+            if dir_cache.exists(file_path):
                 dir_exist_flag = True
             # 文件路径
             file_dest = os.path.join(file_path, file_name)
             # 返回文件路径
             ret_file_path = file_dest
             # 文件是否存在
-            for ext in RMT_MEDIAEXT:
-                ext_dest = "%s%s" % (file_dest, ext)
-                if os.path.exists(ext_dest):
-                    file_exist_flag = True
-                    ret_file_path = ext_dest
-                    break
+            ext_dest = dir_cache.find_file(file_dest, RMT_MEDIAEXT)
+            if ext_dest:
+                file_exist_flag = True
+                ret_file_path = ext_dest
         # 电视剧或者动漫
         else:
             # 目录名称
@@ -952,7 +1533,7 @@ class FileTransfer:
                 # 返回目录路径
                 ret_dir_path = season_dir
                 # 目录是否存在
-                if os.path.exists(season_dir):
+                if dir_cache.exists(season_dir):
                     dir_exist_flag = True
                 # 处理集
                 episodes = media.get_episode_list()
@@ -962,12 +1543,10 @@ class FileTransfer:
                     # 返回文件路径
                     ret_file_path = file_path
                     # 文件存在标志
-                    for ext in RMT_MEDIAEXT:
-                        ext_dest = "%s%s" % (file_path, ext)
-                        if os.path.exists(ext_dest):
-                            file_exist_flag = True
-                            ret_file_path = ext_dest
-                            break
+                    ext_dest = dir_cache.find_file(file_path, RMT_MEDIAEXT)
+                    if ext_dest:
+                        file_exist_flag = True
+                        ret_file_path = ext_dest
         return dir_exist_flag, ret_dir_path, file_exist_flag, ret_file_path
 
     def transfer_embyfav(self, item_path):
@@ -1042,14 +1621,14 @@ class FileTransfer:
             for dest_path in self._movie_path:
                 # 判断精选
                 fav_path = os.path.join(dest_path, RMT_FAVTYPE, dir_name)
-                fav_files = PathUtils.get_dir_files(fav_path, RMT_MEDIAEXT)
+                if any(PathUtils.iter_dir_files(fav_path, RMT_MEDIAEXT)):
+                    return [{'title': meta_info.title, 'year': meta_info.year}]
                 # 其它分类
                 if self._movie_category_flag:
                     dest_path = os.path.join(dest_path, meta_info.category, dir_name)
                 else:
                     dest_path = os.path.join(dest_path, dir_name)
-                files = PathUtils.get_dir_files(dest_path, RMT_MEDIAEXT)
-                if len(files) > 0 or len(fav_files) > 0:
+                if any(PathUtils.iter_dir_files(dest_path, RMT_MEDIAEXT)):
                     return [{'title': meta_info.title, 'year': meta_info.year}]
             return []
         # 电视剧
@@ -1075,8 +1654,7 @@ class FileTransfer:
                 # 目录不存在
                 if not os.path.exists(dest_path):
                     continue
-                files = PathUtils.get_dir_files(dest_path, RMT_MEDIAEXT)
-                for file in files:
+                for file in PathUtils.iter_dir_files(dest_path, RMT_MEDIAEXT):
                     file_meta_info = MetaInfo(os.path.basename(file))
                     if not file_meta_info.get_season_list() or not file_meta_info.get_episode_list():
                         continue
@@ -1087,12 +1665,22 @@ class FileTransfer:
                     exists_episodes = list(set(exists_episodes).union(set(file_meta_info.get_episode_list())))
             return list(set(total_episodes).difference(set(exists_episodes)))
 
-    def __get_best_target_path(self, mtype, in_path=None, size=0):
+    def __get_best_target_path(self, mtype, in_path=None, size=0, key=None):
         """
         查询一个最好的目录返回，有in_path时找与in_path同路径的，没有in_path时，顺序查找1个符合大小要求的，没有in_path和size时，返回第1个
         :param mtype: 媒体类型：电影、电视剧、动漫
         :param in_path: 源目录
         :param size: 文件大小
+        :param key: 预占标识，有值时在选中的目录预占文件大小的空间，转移结束后按该标识释放
+        """
+        dest_path = self.__select_target_path(mtype, in_path, size, key)
+        if dest_path and key and size:
+            self.freespace.reserve(dest_path, size, key)
+        return dest_path
+
+    def __select_target_path(self, mtype, in_path=None, size=0, key=None):
+        """
+        按类型、源目录及剩余空间选择目的目录
         """
         if not mtype:
             return None
@@ -1124,12 +1712,11 @@ class FileTransfer:
                     continue
             if max_return_path:
                 return max_return_path
-        # 有输入大小的，匹配第1个满足空间存储要求的
+        # 有输入大小的，匹配第1个扣除预占后满足空间存储要求的
         if size:
-            for path in dest_paths:
-                disk_free_size = SystemUtils.get_free_space_gb(path)
-                if float(disk_free_size) > float(size / 1024 / 1024 / 1024):
-                    return path
+            path = self.freespace.select(dest_paths, size, key)
+            if path:
+                return path
         # 默认返回第1个
         return dest_paths[0]
 
@@ -3,7 +3,7 @@ from .indexer_helper import IndexerHelper, IndexerConf
 from .meta_helper import MetaHelper
 from .progress_helper import ProgressHelper
 from .security_helper import SecurityHelper
-from .thread_helper import ThreadHelper
+from .thread_helper import ThreadHelper, DeviceThreadPool
 from .db_helper import DbHelper
 from .dict_helper import DictHelper
 from .display_helper import DisplayHelper
@@ -13,3 +13,10 @@ from .opensubtitles import OpenSubtitles
 from .words_helper import WordsHelper
 from .submodule_helper import SubmoduleHelper
 from .cookiecloud_helper import CookieCloudHelper
+from .sync_index_helper import SyncIndexHelper
+from .sync_manifest_helper import SyncManifestHelper
+from .sync_stats_helper import SyncStatsHelper
+from .transfer_journal_helper import TransferJournalHelper
+from .rclone_helper import RcloneHelper
+from .io_throttle_helper import IoThrottleHelper
+from .free_space_helper import FreeSpaceHelper
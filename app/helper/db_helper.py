@@ -26,19 +26,20 @@ class DbHelper:
                                                      TRANSFERHISTORY.DEST_FILENAME == dest_filename).count()
         return True if ret > 0 else False
 
-    @DbPersist(_db)
-    def insert_transfer_history(self, in_from: Enum, rmt_mode: RmtMode, in_path, out_path, dest, media_info):
+    @staticmethod
+    def build_transfer_history(in_from: Enum, rmt_mode: RmtMode, in_path, out_path, dest, media_info,
+                               checksum=None):
         """
-        插入识别转移记录
+        生成识别转移记录的字段，不检查记录是否已存在
         """
         if not media_info or not media_info.tmdb_info:
-            return
+            return None
         if in_path:
             in_path = os.path.normpath(in_path)
             source_path = os.path.dirname(in_path)
             source_filename = os.path.basename(in_path)
         else:
-            return
+            return None
         if out_path:
             outpath = os.path.normpath(out_path)
             dest_path = os.path.dirname(outpath)
@@ -48,29 +49,68 @@ class DbHelper:
             dest_path = ""
             dest_filename = ""
             season_episode = media_info.get_season_string()
-        title = media_info.title
-        if self.is_transfer_history_exists(source_path, source_filename, dest_path, dest_filename):
+        return {
+            "MODE": str(rmt_mode.value),
+            "TYPE": media_info.type.value,
+            "CATEGORY": media_info.category,
+            "TMDBID": int(media_info.tmdb_id),
+            "TITLE": media_info.title,
+            "YEAR": media_info.year,
+            "SEASON_EPISODE": season_episode,
+            "SOURCE": str(in_from.value),
+            "SOURCE_PATH": source_path,
+            "SOURCE_FILENAME": source_filename,
+            "DEST": dest or "",
+            "DEST_PATH": dest_path,
+            "DEST_FILENAME": dest_filename,
+            "DATE": time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time.time())),
+            "CHECKSUM": checksum
+        }
+
+    def __get_transfer_history(self, row):
+        """
+        生成识别转移记录，记录已存在时返回None
+        """
+        if not row:
+            return None
+        if self.is_transfer_history_exists(row.get("SOURCE_PATH"), row.get("SOURCE_FILENAME"),
+                                           row.get("DEST_PATH"), row.get("DEST_FILENAME")):
+            return None
+        return TRANSFERHISTORY(**row)
+
+    @DbPersist(_db)
+    def insert_transfer_history(self, in_from: Enum, rmt_mode: RmtMode, in_path, out_path, dest, media_info,
+                                checksum=None):
+        """
+        插入识别转移记录
+        :param checksum: 转移时计算的文件校验值
+        """
+        history = self.__get_transfer_history(self.build_transfer_history(in_from, rmt_mode, in_path, out_path, dest,
+                                                                          media_info, checksum))
+        if history:
+            self._db.insert(history)
+
+    @DbPersist(_db)
+    def insert_transfer_histories(self, histories):
+        """
+        批量插入识别转移记录，一次提交
+        :param histories: 记录清单，每项为insert_transfer_history的参数字典
+        """
+        if not histories:
             return
-        dest = dest or ""
-        timestr = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(time.time()))
-        self._db.insert(
-            TRANSFERHISTORY(
-                MODE=str(rmt_mode.value),
-                TYPE=media_info.type.value,
-                CATEGORY=media_info.category,
-                TMDBID=int(media_info.tmdb_id),
-                TITLE=title,
-                YEAR=media_info.year,
-                SEASON_EPISODE=season_episode,
-                SOURCE=str(in_from.value),
-                SOURCE_PATH=source_path,
-                SOURCE_FILENAME=source_filename,
-                DEST=dest,
-                DEST_PATH=dest_path,
-                DEST_FILENAME=dest_filename,
-                DATE=timestr
-            )
-        )
+        rows = [row for row in [self.__get_transfer_history(self.build_transfer_history(**history))
+                                for history in histories] if row]
+        if rows:
+            self._db.insert(rows)
+
+    @DbPersist(_db)
+    def insert_transfer_history_rows(self, rows):
+        """
+        按build_transfer_history生成的字段插入识别转移记录，已存在的跳过
+        """
+        rows = [row for row in [self.__get_transfer_history(row) for row in rows or []] if row]
+        if rows:
+            self._db.insert(rows)
 
     def get_transfer_history(self, search, page, rownum):
         """
@@ -327,6 +367,29 @@ class DbHelper:
                 DEST=os.path.normpath(dest)
             ))
 
+    def get_sync_history_paths(self, src, dest):
+        """
+        查询同步目录下已同步到目的目录的文件路径集合
+        """
+        if not src or not dest:
+            return set()
+        prefix = os.path.join(os.path.normpath(src), "")
+        return set(path for path, in self._db.query(SYNCHISTORY.PATH).filter(
+            SYNCHISTORY.DEST == os.path.normpath(dest)).yield_per(10000) if path and path.startswith(prefix))
+
+    @DbPersist(_db)
+    def insert_sync_histories(self, paths, src, dest):
+        """
+        批量插入同步历史记录，调用方需确保记录不存在
+        """
+        if not paths or not dest:
+            return
+        self._db.insert([SYNCHISTORY(
+            PATH=os.path.normpath(path),
+            SRC=os.path.normpath(src),
+            DEST=os.path.normpath(dest)
+        ) for path in paths])
+
     def get_users(self, ):
         """
         查询用户列表
@@ -0,0 +1,111 @@
+import os
+import shutil
+import threading
+import time
+
+from app.helper.thread_helper import DeviceThreadPool
+from app.utils import ExceptionUtils
+from app.utils.commons import singleton
+from config import FREE_SPACE_REFRESH_INTERVAL
+
+lock = threading.RLock()
+
+
+@singleton
+class FreeSpaceHelper(object):
+    """
+    剩余空间台账：按设备缓存剩余空间，按固定间隔从文件系统刷新；规划转移时预占文件大小，转移完成或失败后释放，
+    并发转移选择目的目录时不会基于同一剩余空间重复选择同一磁盘
+    """
+
+    def __init__(self):
+        # 设备 -> {"free": 剩余空间, "time": 刷新时间, "reserved": 已预占空间}
+        self._devices = {}
+        # 预占标识 -> (设备, 大小)
+        self._reservations = {}
+
+    def __get_device_state(self, device, path):
+        """
+        设备的空间信息，超过刷新间隔时重新查询，调用时需持有锁
+        """
+        state = self._devices.get(device)
+        if not state:
+            state = self._devices[device] = {"free": 0, "time": 0, "reserved": 0, "path": path}
+        if time.time() - state.get("time") >= FREE_SPACE_REFRESH_INTERVAL:
+            try:
+                state["free"] = shutil.disk_usage(path).free
+            except Exception as err:
+                ExceptionUtils.exception_traceback(err)
+                state["free"] = 0
+            state["time"] = time.time()
+        return state
+
+    def get_free(self, path):
+        """
+        目录所在设备扣除预占后的剩余空间，字节
+        """
+        if not path or not os.path.exists(path):
+            return 0
+        device = DeviceThreadPool.get_device(path)
+        with lock:
+            state = self.__get_device_state(device, path)
+            return max(state.get("free") - state.get("reserved"), 0)
+
+    def reserve(self, path, size, key):
+        """
+        预占空间，同一标识重复预占时先释放原预占
+        :param path: 目的目录
+        :param size: 预占大小，字节
+        :param key: 预占标识，释放时使用
+        """
+        if not path or not size or not key or not os.path.exists(path):
+            return
+        device = DeviceThreadPool.get_device(path)
+        with lock:
+            self.release(key)
+            state = self.__get_device_state(device, path)
+            state["reserved"] += size
+            self._reservations[key] = (device, size)
+
+    def select(self, paths, size, key=None):
+        """
+        按顺序选择第1个剩余空间足够的目录，有预占标识时同时预占空间
+        :return: 目录，都不满足时返回None
+        """
+        with lock:
+            for path in paths:
+                if self.get_free(path) > size:
+                    if key:
+                        self.reserve(path, size, key)
+                    return path
+        return None
+
+    def release(self, key, written=False):
+        """
+        释放预占的空间
+        :param written: 是否已写入，已写入时从缓存的剩余空间中扣除预占大小，不必等到下次刷新
+        """
+        if not key:
+            return
+        with lock:
+            reservation = self._reservations.pop(key, None)
+            if not reservation:
+                return
+            device, size = reservation
+            state = self._devices.get(device)
+            if state:
+                state["reserved"] = max(state.get("reserved") - size, 0)
+                if written:
+                    state["free"] = max(state.get("free") - size, 0)
+
+    def get_stats(self):
+        """
+        各设备的剩余空间及预占情况
+        """
+        with lock:
+            return [{"device": device,
+                     "path": state.get("path"),
+                     "free": state.get("free"),
+                     "reserved": state.get("reserved"),
+                     "refresh_time": state.get("time")}
+                    for device, state in self._devices.items()]
@@ -0,0 +1,165 @@
+import datetime
+import os
+import threading
+import time
+
+import log
+from app.helper.thread_helper import DeviceThreadPool
+from app.utils import TokenBucket
+from app.utils.commons import singleton
+from config import Config
+
+lock = threading.RLock()
+
+
+@singleton
+class IoThrottleHelper(object):
+    """
+    转移限速：按目的设备使用令牌桶限制复制、跨盘移动的写入速度，
+    限速取默认限速、当前时间段限速及目的设备限速中的最小值，同时统计各设备的实时速度
+    """
+    # 速度统计周期，秒
+    _METER_INTERVAL = 2
+
+    # 默认限速，字节/秒
+    _default_limit = 0
+    # 时间段限速：[(开始分钟, 结束分钟, 限速)]
+    _schedule_limits = []
+    # 目录限速：[(目录, 限速)]
+    _path_limits = []
+
+    def __init__(self):
+        # 设备 -> 令牌桶
+        self._buckets = {}
+        # 设备 -> 速度统计
+        self._meters = {}
+        self.init_config()
+
+    def init_config(self):
+        limit_conf = (Config().get_config('media') or {}).get('transfer_limit') or {}
+        self._default_limit = self.__parse_limit(limit_conf.get('default'))
+        self._schedule_limits = []
+        for item in self.__split(limit_conf.get('schedule')):
+            try:
+                time_range, limit = item.split("@")
+                begin, end = time_range.split("-")
+                self._schedule_limits.append((self.__parse_minutes(begin),
+                                              self.__parse_minutes(end),
+                                              self.__parse_limit(limit)))
+            except ValueError:
+                log.warn("【Rmt】转移限速时间段配置格式错误：%s" % item)
+        self._path_limits = []
+        for item in self.__split(limit_conf.get('paths')):
+            path, _, limit = item.rpartition("@")
+            if not path or not self.__parse_limit(limit):
+                log.warn("【Rmt】转移限速目录配置格式错误：%s" % item)
+                continue
+            self._path_limits.append((os.path.normpath(path), self.__parse_limit(limit)))
+        with lock:
+            self._buckets = {}
+
+    @staticmethod
+    def __split(value):
+        if not value:
+            return []
+        if isinstance(value, list):
+            return [str(v).strip() for v in value if str(v).strip()]
+        return [v.strip() for v in str(value).split(",") if v.strip()]
+
+    @staticmethod
+    def __parse_limit(value):
+        """
+        限速配置，单位MB/s，转换为字节/秒
+        """
+        try:
+            return int(float(value) * 1024 * 1024) if value else 0
+        except ValueError:
+            return 0
+
+    @staticmethod
+    def __parse_minutes(value):
+        hour, minute = value.strip().split(":")
+        return int(hour) * 60 + int(minute)
+
+    def is_enabled(self):
+        return bool(self._default_limit or self._schedule_limits or self._path_limits)
+
+    def get_limit(self, device):
+        """
+        设备当前的限速，字节/秒，0为不限速
+        """
+        limits = [self._default_limit]
+        now = datetime.datetime.now()
+        minutes = now.hour * 60 + now.minute
+        for begin, end, limit in self._schedule_limits:
+            # 结束时间小于开始时间时跨天
+            if (begin <= minutes < end) if begin <= end else (minutes >= begin or minutes < end):
+                limits.append(limit)
+        for path, limit in self._path_limits:
+            if device is not None and DeviceThreadPool.get_device(path) == device:
+                limits.append(limit)
+        limits = [limit for limit in limits if limit]
+        return min(limits) if limits else 0
+
+    def get_limiter(self, target):
+        """
+        生成目的路径的限速回调，没有配置限速时也返回回调以统计速度
+        :param target: 目的文件
+        """
+        device = DeviceThreadPool.get_device(os.path.dirname(target))
+        target_dir = os.path.dirname(target)
+
+        def __limit(size):
+            self.throttle(device, size, target_dir)
+
+        return __limit
+
+    def throttle(self, device, size, path=None):
+        """
+        写入size字节前调用，超过限速时等待
+        """
+        if not size:
+            return
+        with lock:
+            limit = self.get_limit(device) if self.is_enabled() else 0
+            bucket = self._buckets.get(device)
+            if not bucket:
+                bucket = self._buckets[device] = TokenBucket(limit)
+            elif bucket.rate != limit:
+                bucket.set_rate(limit)
+            meter = self._meters.get(device)
+            if not meter:
+                meter = self._meters[device] = {"path": path, "start": time.time(), "bytes": 0, "speed": 0,
+                                                "limit": limit, "total": 0, "last": 0}
+            now = time.time()
+            meter.update({"path": path or meter.get("path"), "limit": limit, "last": now})
+            meter["bytes"] += size
+            meter["total"] += size
+            if now - meter["start"] >= self._METER_INTERVAL:
+                meter["speed"] = int(meter["bytes"] / (now - meter["start"]))
+                meter["start"] = now
+                meter["bytes"] = 0
+        bucket.consume(size)
+
+    def get_throughput(self):
+        """
+        各设备的实时速度及限速，字节/秒，超过统计周期没有写入的速度为0
+        """
+        now = time.time()
+        with lock:
+            return [{"device": device,
+                     "path": meter.get("path"),
+                     "speed": meter.get("speed") if now - meter.get("last") < self._METER_INTERVAL * 2 else 0,
+                     "limit": meter.get("limit"),
+                     "total": meter.get("total")}
+                    for device, meter in self._meters.items()]
+
+    def get_speed(self, target):
+        """
+        目的路径所在设备的实时速度
+        """
+        device = DeviceThreadPool.get_device(os.path.dirname(target))
+        for item in self.get_throughput():
+            if item.get("device") == device:
+                return item.get("speed"), item.get("limit")
+        return 0, 0
@@ -0,0 +1,276 @@
+import atexit
+import os
+import secrets
+import shutil
+import socket
+import subprocess
+import threading
+import time
+
+import requests
+
+import log
+from app.utils import ExceptionUtils
+from app.utils.commons import singleton
+from config import Config, RMT_REMOTE_TRANSFERS, RMT_REMOTE_JOB_TIMEOUT
+
+lock = threading.RLock()
+
+
+@singleton
+class RcloneHelper(object):
+    """
+    rclone常驻服务：启动rclone rcd，通过本地RC接口提交异步转移任务并轮询任务状态，
+    避免每个文件都启动rclone进程、重新读取配置及认证远程存储；服务不可用时返回None，由调用方回退到命令行。
+    rclone的限速（core/bwlimit）对整个进程生效，并发转移时取各任务限速中的最小值
+    """
+    # 轮询任务状态的最大间隔，秒
+    _MAX_POLL_INTERVAL = 2
+    # 启动等待时间，秒
+    _START_TIMEOUT = 10
+    # 保留的已完成任务数
+    _MAX_FINISHED_JOBS = 100
+    # 查询任务状态连续失败该次数后按失败处理
+    _MAX_STATUS_ERRORS = 10
+    # 单个任务的最长等待时间，秒
+    _JOB_TIMEOUT = RMT_REMOTE_JOB_TIMEOUT
+
+    _enabled = True
+    _minio_remote = None
+    _process = None
+    _url = None
+    _session = None
+    _semaphore = None
+    # 当前限速，字节/秒
+    _bwlimit = 0
+
+    def __init__(self):
+        # 任务ID -> 任务状态
+        self._jobs = {}
+        # 进行中的任务的限速，字节/秒
+        self._job_limits = []
+        self._semaphore = threading.BoundedSemaphore(RMT_REMOTE_TRANSFERS)
+        atexit.register(self.stop)
+        self.init_config()
+
+    def init_config(self):
+        media = Config().get_config('media') or {}
+        self._enabled = media.get("remote_daemon") is not False
+        self._minio_remote = media.get("minio_rclone_remote") or ""
+        if not self._enabled:
+            self.stop()
+
+    @property
+    def minio_remote(self):
+        """
+        Minio对应的rclone远程名称，为空时Minio转移使用mc命令
+        """
+        return self._minio_remote
+
+    def is_running(self):
+        return self._process is not None and self._process.poll() is None
+
+    @staticmethod
+    def __get_free_port():
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            sock.bind(("127.0.0.1", 0))
+            return sock.getsockname()[1]
+
+    def __start(self):
+        """
+        启动rclone rcd，已启动时直接返回
+        """
+        if not self._enabled:
+            return False
+        with lock:
+            if self.is_running():
+                return True
+            if not shutil.which("rclone"):
+                return False
+            port = self.__get_free_port()
+            user, password = secrets.token_hex(8), secrets.token_hex(16)
+            try:
+                self._process = subprocess.Popen(["rclone", "rcd",
+                                                  "--rc-addr", "127.0.0.1:%s" % port,
+                                                  "--rc-user", user,
+                                                  "--rc-pass", password,
+                                                  "--transfers", str(RMT_REMOTE_TRANSFERS)],
+                                                 stdout=subprocess.DEVNULL,
+                                                 stderr=subprocess.DEVNULL)
+            except Exception as err:
+                ExceptionUtils.exception_traceback(err)
+                self._process = None
+                return False
+            self._url = "http://127.0.0.1:%s" % port
+            self._bwlimit = 0
+            self._session = requests.Session()
+            self._session.auth = (user, password)
+            # 等待RC接口可用
+            start_time = time.time()
+            while time.time() - start_time < self._START_TIMEOUT:
+                if self._process.poll() is not None:
+                    break
+                try:
+                    self.__call("rc/noop", timeout=1)
+                    log.info("【Rmt】rclone常驻服务已启动，端口：%s" % port)
+                    return True
+                except requests.RequestException:
+                    time.sleep(0.2)
+            log.warn("【Rmt】rclone常驻服务启动失败，使用rclone命令转移")
+            self.stop()
+            self._enabled = False
+            return False
+
+    def __call(self, command, params=None, timeout=30):
+        """
+        调用RC接口
+        """
+        res = self._session.post("%s/%s" % (self._url, command), json=params or {}, timeout=timeout)
+        result = res.json() if res.content else {}
+        if res.status_code != 200:
+            raise RuntimeError(result.get("error") or "rclone rc %s 返回 %s" % (command, res.status_code))
+        return result
+
+    def __set_bwlimit(self):
+        """
+        调整rclone常驻服务的限速，限速对整个进程生效，取进行中的任务限速的最小值
+        """
+        with lock:
+            limits = [limit for limit in self._job_limits if limit]
+        bwlimit = min(limits) if limits else 0
+        if bwlimit == self._bwlimit:
+            return
+        try:
+            self.__call("core/bwlimit", {"rate": "%sk" % max(int(bwlimit / 1024), 1) if bwlimit else "off"})
+            self._bwlimit = bwlimit
+        except Exception as err:
+            ExceptionUtils.exception_traceback(err)
+
+    def transfer(self, src, dest, move=False, remote="NASTOOL", strip_root=False, bwlimit=0):
+        """
+        提交单个文件的转移任务并等待完成
+        :param src: 源文件
+        :param dest: 远程目的文件路径
+        :param move: 是否移动
+        :param remote: rclone远程名称，为空时为本地路径
+        :param strip_root: 目的路径去掉开头的/（S3类远程的第一级为存储桶）
+        :param bwlimit: 限速，字节/秒，0为不限速；rclone限速对整个进程生效，与其它进行中的任务取最小值
+        :return: (返回码, 错误信息)，服务不可用时返回None
+        """
+        if not self.__start():
+            return None
+        src = os.path.normpath(src)
+        dest = dest.replace("\\", "/")
+        if strip_root:
+            dest = dest.lstrip("/")
+        dest_dir, dest_name = os.path.split(dest)
+        params = {
+            "srcFs": os.path.dirname(src),
+            "srcRemote": os.path.basename(src),
+            "dstFs": "%s:%s" % (remote, dest_dir) if remote else dest_dir,
+            "dstRemote": dest_name,
+            "_async": True
+        }
+        bwlimit = int(bwlimit or 0)
+        with self._semaphore:
+            with lock:
+                self._job_limits.append(bwlimit)
+            try:
+                self.__set_bwlimit()
+                try:
+                    jobid = self.__call("operations/movefile" if move else "operations/copyfile", params).get("jobid")
+                except Exception as err:
+                    ExceptionUtils.exception_traceback(err)
+                    if self.is_running():
+                        return -1, str(err)
+                    return None
+                job = {"id": jobid, "src": src, "dest": dest, "move": move, "start": time.time(),
+                       "finished": False, "success": False, "error": ""}
+                with lock:
+                    self._jobs[jobid] = job
+                return self.__wait_job(job)
+            finally:
+                with lock:
+                    self._job_limits.remove(bwlimit)
+                # 其它任务继续按剩余任务的限速转移
+                if self.is_running():
+                    self.__set_bwlimit()
+
+    def __wait_job(self, job):
+        """
+        轮询任务状态直至完成，查询状态连续失败或超过最长等待时间时停止任务并按失败处理
+        """
+        interval = 0.1
+        errors = 0
+        deadline = time.time() + self._JOB_TIMEOUT
+        while True:
+            time.sleep(interval)
+            interval = min(interval * 2, self._MAX_POLL_INTERVAL)
+            try:
+                status = self.__call("job/status", {"jobid": job.get("id")})
+                errors = 0
+            except Exception as err:
+                errors += 1
+                if not self.is_running():
+                    ExceptionUtils.exception_traceback(err)
+                    status = {"finished": True, "success": False, "error": "rclone常驻服务已退出"}
+                elif errors >= self._MAX_STATUS_ERRORS:
+                    ExceptionUtils.exception_traceback(err)
+                    self.__stop_job(job)
+                    status = {"finished": True, "success": False,
+                              "error": "查询转移任务状态连续失败 %s 次：%s" % (errors, str(err))}
+                else:
+                    status = {}
+            if not status.get("finished") and time.time() > deadline:
+                log.warn("【Rmt】rclone转移任务超时：%s" % job.get("src"))
+                self.__stop_job(job)
+                status = {"finished": True, "success": False,
+                          "error": "转移任务超过 %s 秒未完成" % self._JOB_TIMEOUT}
+            if not status.get("finished"):
+                continue
+            with lock:
+                job.update({"finished": True,
+                            "success": status.get("success"),
+                            "error": status.get("error") or "",
+                            "end": time.time()})
+                self.__clean_jobs()
+            if job.get("success"):
+                return 0, ""
+            return 1, job.get("error")
+
+    def __stop_job(self, job):
+        """
+        停止转移任务，服务不可用时忽略
+        """
+        try:
+            self.__call("job/stop", {"jobid": job.get("id")}, timeout=5)
+        except Exception as err:
+            ExceptionUtils.exception_traceback(err)
+
+    def __clean_jobs(self):
+        finished = [jobid for jobid, job in self._jobs.items() if job.get("finished")]
+        for jobid in finished[:max(len(finished) - self._MAX_FINISHED_JOBS, 0)]:
+            self._jobs.pop(jobid, None)
+
+    def get_jobs(self):
+        """
+        查询转移任务状态
+        """
+        with lock:
+            return {
+                "running": self.is_running(),
+                "jobs": [dict(job) for job in self._jobs.values()]
+            }
+
+    def stop(self):
+        """
+        停止rclone常驻服务
+        """
+        with lock:
+            if self._process and self._process.poll() is None:
+                self._process.terminate()
+                try:
+                    self._process.wait(timeout=5)
+                except subprocess.TimeoutExpired:
+                    self._process.kill()
+            self._process = None
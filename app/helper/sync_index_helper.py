@@ -0,0 +1,136 @@
+import os
+import pickle
+import time
+from collections import OrderedDict
+from threading import RLock
+
+from app.utils import ExceptionUtils
+from app.utils.commons import singleton
+from config import Config, SYNC_INDEX_MAX_SIZE, SYNC_INDEX_EXPIRE_TIME
+
+lock = RLock()
+
+
+@singleton
+class SyncIndexHelper(object):
+    """
+    目录监控已处理文件索引，文件转移成功后才登记，转移失败的文件重启后仍会重新处理
+    {
+        "文件路径": (inode, 文件大小, 修改时间, 登记时间)
+    }
+    """
+    _index = OrderedDict()
+    _index_path = None
+    _index_changed = False
+
+    def __init__(self):
+        self.init_config()
+
+    def init_config(self):
+        index_path = os.path.join(Config().get_config_path(), 'sync_index.dat')
+        if index_path == self._index_path:
+            return
+        with lock:
+            self._index_path = index_path
+            self._index = self.__load_index(self._index_path)
+            self._index_changed = False
+            self.__evict()
+
+    @staticmethod
+    def get_file_key(path):
+        """
+        计算文件的索引键：路径、inode、大小、修改时间，文件不存在时返回None
+        """
+        if not path:
+            return None
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return os.path.normpath(path), stat.st_ino, stat.st_size, int(stat.st_mtime)
+
+    def is_handled(self, path):
+        """
+        判断文件是否已处理过，文件发生变化（inode、大小、修改时间不同）时视为未处理
+        """
+        key = self.get_file_key(path)
+        if not key:
+            return False
+        with lock:
+            item = self._index.get(key[0])
+            return True if item and item[:3] == key[1:] else False
+
+    def add(self, path):
+        """
+        登记已处理成功的文件，文件不存在时不登记
+        """
+        key = self.get_file_key(path)
+        if not key:
+            return
+        with lock:
+            self._index[key[0]] = (*key[1:], int(time.time()))
+            self._index.move_to_end(key[0])
+            self._index_changed = True
+            self.__evict()
+
+    def clear(self):
+        """
+        清空索引
+        """
+        with lock:
+            self._index = OrderedDict()
+            self._index_changed = True
+
+    def get_index_size(self):
+        """
+        返回索引记录数
+        """
+        return len(self._index)
+
+    def __evict(self):
+        """
+        按数量上限及过期时间淘汰最早登记的记录
+        """
+        expire_time = int(time.time()) - SYNC_INDEX_EXPIRE_TIME
+        while self._index:
+            path, item = next(iter(self._index.items()))
+            if len(self._index) <= SYNC_INDEX_MAX_SIZE and item[3] >= expire_time:
+                break
+            self._index.popitem(last=False)
+            self._index_changed = True
+
+    @staticmethod
+    def __load_index(path):
+        """
+        从文件中加载索引
+        """
+        try:
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    data = pickle.load(f)
+                if isinstance(data, OrderedDict):
+                    return data
+            return OrderedDict()
+        except Exception as e:
+            ExceptionUtils.exception_traceback(e)
+            return OrderedDict()
+
+    def save_index(self, force=False):
+        """
+        保存索引到文件
+        """
+        if not self._index_path:
+            return
+        with lock:
+            if not force and not self._index_changed:
+                return
+            self.__evict()
+            data = OrderedDict(self._index)
+            self._index_changed = False
+        try:
+            tmp_path = "%s.tmp" % self._index_path
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(data, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self._index_path)
+        except Exception as e:
+            ExceptionUtils.exception_traceback(e)
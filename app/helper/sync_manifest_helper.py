@@ -0,0 +1,138 @@
+import hashlib
+import os
+import pickle
+from threading import RLock
+
+from app.utils import ExceptionUtils, PathUtils
+from app.utils.commons import singleton
+from config import Config
+
+lock = RLock()
+
+
+@singleton
+class SyncManifestHelper(object):
+    """
+    监控目录文件快照，每个监控目录一个快照文件
+    {
+        "相对路径": (文件大小, 修改时间, inode)
+    }
+    """
+    _manifest_path = None
+
+    def __init__(self):
+        self.init_config()
+
+    def init_config(self):
+        self._manifest_path = os.path.join(Config().get_config_path(), 'sync_manifest')
+
+    def __get_manifest_file(self, root):
+        """
+        监控目录对应的快照文件
+        """
+        root_key = hashlib.md5(os.path.normpath(root).encode("utf-8")).hexdigest()
+        return os.path.join(self._manifest_path, "%s.dat" % root_key)
+
+    @staticmethod
+    def scan(root):
+        """
+        扫描监控目录，生成当前的文件快照，回收站及隐藏目录不扫描
+        """
+        manifest = {}
+        if not root or not os.path.isdir(root):
+            return manifest
+        root = os.path.normpath(root)
+        dirs = [root]
+        while dirs:
+            cur_dir = dirs.pop()
+            try:
+                with os.scandir(cur_dir) as entries:
+                    for entry in entries:
+                        try:
+                            if entry.is_dir(follow_symlinks=False):
+                                if not PathUtils.is_invalid_path(entry.path + os.sep):
+                                    dirs.append(entry.path)
+                            elif entry.is_file():
+                                if PathUtils.is_invalid_path(entry.path):
+                                    continue
+                                stat = entry.stat()
+                                manifest[os.path.relpath(entry.path, root)] = (stat.st_size,
+                                                                              int(stat.st_mtime),
+                                                                              stat.st_ino)
+                        except OSError as err:
+                            ExceptionUtils.exception_traceback(err)
+            except OSError as err:
+                ExceptionUtils.exception_traceback(err)
+        return manifest
+
+    def load(self, root):
+        """
+        读取监控目录的快照，没有快照时返回None
+        """
+        manifest_file = self.__get_manifest_file(root)
+        with lock:
+            try:
+                if os.path.exists(manifest_file):
+                    with open(manifest_file, 'rb') as f:
+                        data = pickle.load(f)
+                    if isinstance(data, dict) and data.get("root") == os.path.normpath(root):
+                        return data.get("files") or {}
+            except Exception as e:
+                ExceptionUtils.exception_traceback(e)
+        return None
+
+    def save(self, root, manifest):
+        """
+        保存监控目录的快照
+        """
+        manifest_file = self.__get_manifest_file(root)
+        with lock:
+            try:
+                if not os.path.exists(self._manifest_path):
+                    os.makedirs(self._manifest_path)
+                tmp_file = "%s.tmp" % manifest_file
+                with open(tmp_file, 'wb') as f:
+                    pickle.dump({"root": os.path.normpath(root), "files": manifest}, f, pickle.HIGHEST_PROTOCOL)
+                os.replace(tmp_file, manifest_file)
+            except Exception as e:
+                ExceptionUtils.exception_traceback(e)
+
+    def update(self, root, entries):
+        """
+        更新快照中的部分文件，文件处理完成后调用
+        :param entries: {相对路径: (文件大小, 修改时间, inode)}
+        """
+        if not entries:
+            return
+        with lock:
+            manifest = self.load(root)
+            if manifest is None:
+                return
+            manifest.update(entries)
+            self.save(root, manifest)
+
+    def delete(self, root):
+        """
+        删除监控目录的快照
+        """
+        manifest_file = self.__get_manifest_file(root)
+        with lock:
+            if os.path.exists(manifest_file):
+                os.remove(manifest_file)
+
+    def clear(self):
+        """
+        删除所有快照，下次同步时全量转移
+        """
+        with lock:
+            for manifest_file in PathUtils.get_dir_level1_files(self._manifest_path, [".dat"]):
+                os.remove(manifest_file)
+
+    @staticmethod
+    def diff(root, old_manifest, new_manifest):
+        """
+        对比快照，返回新增或发生变化的文件完整路径
+        """
+        old_manifest = old_manifest or {}
+        return [os.path.join(root, rel_path) for rel_path, sig in new_manifest.items()
+                if old_manifest.get(rel_path) != sig]
@@ -0,0 +1,182 @@
+import bisect
+import os
+import time
+from collections import OrderedDict
+from threading import RLock
+
+from app.utils import PathTrie
+from app.utils.commons import singleton
+
+lock = RLock()
+
+
+class Histogram(object):
+    """
+    耗时分布统计，单位秒
+    """
+    # 分桶上限
+    BUCKETS = [0.1, 0.5, 1, 5, 10, 30, 60, 300, 600, 1800, 3600]
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS) + 1)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def observe(self, value):
+        if value is None or value < 0:
+            return
+        self.counts[bisect.bisect_left(self.BUCKETS, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def to_dict(self):
+        buckets = {}
+        for i, count in enumerate(self.counts):
+            le = str(self.BUCKETS[i]) if i < len(self.BUCKETS) else "+Inf"
+            buckets[le] = count
+        return {
+            "count": self.count,
+            "avg": round(self.total / self.count, 3) if self.count else 0,
+            "max": round(self.max, 3),
+            "buckets": buckets
+        }
+
+
+@singleton
+class SyncStatsHelper(object):
+    """
+    目录同步处理统计，按监控目录统计事件数、去重数、事件到转移完成的耗时，按转移方式统计转移耗时，
+    只保存在内存中，重启后清零
+    """
+    # 等待转移完成的事件最大记录数
+    _MAX_PENDING_EVENTS = 100000
+
+    def __init__(self):
+        self._roots = {}
+        self._mode_durations = {}
+        self._batch_durations = Histogram()
+        # 文件路径 -> 首次收到事件的时间
+        self._event_times = OrderedDict()
+        # 有事件记录的文件，按目录转移时查找目录下的文件
+        self._event_trie = PathTrie()
+        self._start_time = time.time()
+
+    def __get_root(self, root):
+        root_stat = self._roots.get(root)
+        if not root_stat:
+            root_stat = self._roots[root] = {
+                "events": 0,
+                "deduped": 0,
+                "transferred": 0,
+                "failed": 0,
+                "last_event": 0,
+                "last_transfer": 0,
+                "latency": Histogram()
+            }
+        return root_stat
+
+    def event(self, root, path):
+        """
+        收到文件事件，记录首次收到事件的时间
+        """
+        if not root:
+            return
+        path = os.path.normpath(path)
+        with lock:
+            root_stat = self.__get_root(root)
+            root_stat["events"] += 1
+            root_stat["last_event"] = time.time()
+            if path not in self._event_times:
+                self._event_times[path] = time.time()
+                self._event_trie.add(path)
+                if len(self._event_times) > self._MAX_PENDING_EVENTS:
+                    self._event_trie.remove(self._event_times.popitem(last=False)[0])
+
+    def __pop_event(self, path):
+        """
+        移除事件记录，返回首次收到事件的时间
+        """
+        path = os.path.normpath(path)
+        event_time = self._event_times.pop(path, None)
+        if event_time:
+            self._event_trie.remove(path)
+        return event_time
+
+    def dedup(self, root, path=None):
+        """
+        事件被去重（合并或已处理过）
+        """
+        if not root:
+            return
+        with lock:
+            self.__get_root(root)["deduped"] += 1
+            if path:
+                self.__pop_event(path)
+
+    def discard(self, path):
+        """
+        不需要转移的文件，移除事件记录
+        """
+        with lock:
+            self.__pop_event(path)
+
+    def transferred(self, root, paths, mode, duration, success=True):
+        """
+        转移完成，记录转移耗时及各文件从事件到完成的耗时
+        :param root: 监控目录
+        :param paths: 本次转移的文件或目录，目录时统计目录下所有有事件记录的文件
+        :param mode: 转移方式RmtMode
+        :param duration: 转移耗时
+        :param success: 是否成功
+        """
+        if not root:
+            return
+        now = time.time()
+        with lock:
+            root_stat = self.__get_root(root)
+            root_stat["transferred" if success else "failed"] += 1
+            root_stat["last_transfer"] = now
+            mode_name = mode.value if mode else ""
+            if mode_name not in self._mode_durations:
+                self._mode_durations[mode_name] = Histogram()
+            self._mode_durations[mode_name].observe(duration)
+            for path in paths or []:
+                event_time = self.__pop_event(path)
+                if event_time:
+                    root_stat["latency"].observe(now - event_time)
+                    continue
+                # 按目录转移时，目录下的文件均视为完成
+                for file_path, _ in self._event_trie.find_under(path):
+                    event_time = self.__pop_event(file_path)
+                    if event_time:
+                        root_stat["latency"].observe(now - event_time)
+
+    def batch(self, duration):
+        """
+        批量转移调度耗时
+        """
+        with lock:
+            self._batch_durations.observe(duration)
+
+    def get_stats(self, roots=None):
+        """
+        查询统计信息
+        :param roots: 需要包含的监控目录，没有统计数据的显示为0
+        """
+        with lock:
+            for root in roots or []:
+                self.__get_root(root)
+            return {
+                "since": self._start_time,
+                "roots": {root: dict(root_stat, latency=root_stat["latency"].to_dict())
+                          for root, root_stat in self._roots.items()},
+                "modes": {mode: hist.to_dict() for mode, hist in self._mode_durations.items()},
+                "batch": self._batch_durations.to_dict(),
+                "waiting_events": len(self._event_times)
+            }
+
+    def clear(self):
+        with lock:
+            self.__init__()
@@ -1,4 +1,7 @@
-from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future
 
 from app.utils.commons import singleton
 
@@ -16,3 +19,95 @@ class ThreadHelper:
 
     def start_thread(self, func, kwargs):
         self.executor.submit(func, *kwargs)
+
+
+class DeviceThreadPool:
+    """
+    按设备调度的线程池：不同设备上的任务并行执行，涉及同一设备的任务串行执行
+    """
+
+    def __init__(self, max_workers=4):
+        self._max_workers = max(int(max_workers), 1)
+        self._executor = ThreadPoolExecutor(max_workers=self._max_workers)
+        self._cond = threading.Condition()
+        # 等待中的任务：(设备集合, Future, 方法, 参数)
+        self._queue = deque()
+        # 正在使用的设备
+        self._busy_devices = set()
+        self._running = 0
+
+    @staticmethod
+    def get_device(path):
+        """
+        获取路径所在的设备号，路径不存在时向上查找已存在的目录
+        """
+        if not path:
+            return None
+        path = os.path.normpath(path)
+        while True:
+            try:
+                return os.stat(path).st_dev
+            except OSError:
+                parent = os.path.dirname(path)
+                if parent == path:
+                    return None
+                path = parent
+
+    def submit(self, func, *args, paths=None, **kwargs):
+        """
+        提交任务
+        :param func: 任务方法
+        :param paths: 任务涉及的路径，按所在设备排队
+        :return: Future
+        """
+        devices = frozenset(device for device in map(self.get_device, paths or []) if device is not None)
+        future = Future()
+        with self._cond:
+            self._queue.append((devices, future, func, args, kwargs))
+            self.__dispatch()
+        return future
+
+    def get_queue_size(self):
+        """
+        等待中及执行中的任务数
+        """
+        with self._cond:
+            return len(self._queue) + self._running
+
+    def shutdown(self, wait=True):
+        """
+        关闭线程池，未开始的任务取消
+        """
+        with self._cond:
+            while self._queue:
+                self._queue.popleft()[1].cancel()
+        self._executor.shutdown(wait=wait)
+
+    def __dispatch(self):
+        """
+        按提交顺序启动设备空闲的任务，调用时需持有锁
+        """
+        for task in list(self._queue):
+            if self._running >= self._max_workers:
+                break
+            devices = task[0]
+            if devices & self._busy_devices:
+                continue
+            self._queue.remove(task)
+            self._busy_devices |= devices
+            self._running += 1
+            self._executor.submit(self.__run, task)
+
+    def __run(self, task):
+        devices, future, func, args, kwargs = task
+        try:
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(func(*args, **kwargs))
+                except Exception as err:
+                    future.set_exception(err)
+        finally:
+            with self._cond:
+                self._busy_devices -= devices
+                self._running -= 1
+                self.__dispatch()
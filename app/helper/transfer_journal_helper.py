@@ -0,0 +1,340 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+from collections import OrderedDict
+from threading import RLock
+
+import log
+from app.helper.db_helper import DbHelper
+from app.utils import CopyEngine, ExceptionUtils
+from app.utils.commons import singleton
+from app.utils.types import RmtMode
+from config import Config, RMT_STAGING_SUFFIX
+
+lock = RLock()
+
+
+@singleton
+class TransferJournalHelper(object):
+    """
+    文件转移预写日志：转移前追加记录意图，转移完成、登记转移记录后追加状态，
+    启动时对未完成的记录按文件实际状态继续完成或回滚；同时记录已完整处理的目录，未发生变化时不再重新扫描
+    每行一条JSON记录，state为：
+    intent 准备转移，done 文件已转移，committed 转移记录已登记，failed 失败或已回滚，dir 目录已完整处理
+    已完整处理的目录按(源目录, 目的目录, 转移方式)记录，同一目录转移到其它位置或换转移方式时仍需处理
+    """
+    # 日志记录数超过该值时压缩
+    _MAX_RECORDS = 10000
+    # 最多记录的已完整处理目录数，超过时淘汰最早完成的
+    _MAX_COMPLETED_DIRS = 5000
+    _journal_file = None
+
+    def __init__(self):
+        # 未完成的记录：id -> 记录
+        self._entries = {}
+        # 已完整处理的目录：(路径, 目的目录, 转移方式) -> 目录签名
+        self._completed_dirs = OrderedDict()
+        self._records = 0
+        self.init_config()
+
+    def init_config(self):
+        journal_path = os.path.join(Config().get_config_path(), 'transfer_journal')
+        with lock:
+            self._journal_file = os.path.join(journal_path, "journal.log")
+            self.__load()
+
+    def __load(self):
+        """
+        读取日志，合并出未完成的记录及已完成的目录
+        """
+        self._entries = {}
+        self._completed_dirs = OrderedDict()
+        self._records = 0
+        if not os.path.exists(self._journal_file):
+            return
+        try:
+            with open(self._journal_file, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # 写入中断的最后一行
+                        continue
+                    self._records += 1
+                    self.__apply(record)
+        except Exception as e:
+            ExceptionUtils.exception_traceback(e)
+
+    def __apply(self, record):
+        state = record.get("state")
+        if state == "dir":
+            key = (record.get("path"), record.get("target") or "", record.get("mode"))
+            self._completed_dirs.pop(key, None)
+            if record.get("signature"):
+                self._completed_dirs[key] = record.get("signature")
+                while len(self._completed_dirs) > self._MAX_COMPLETED_DIRS:
+                    self._completed_dirs.popitem(last=False)
+            return
+        jid = record.get("id")
+        if not jid:
+            return
+        if state in ["committed", "failed"]:
+            self._entries.pop(jid, None)
+        elif state == "intent":
+            self._entries[jid] = record
+        elif jid in self._entries:
+            self._entries[jid].update(record)
+
+    def __append(self, records):
+        """
+        追加记录并落盘
+        """
+        with lock:
+            try:
+                journal_path = os.path.dirname(self._journal_file)
+                if not os.path.exists(journal_path):
+                    os.makedirs(journal_path)
+                with open(self._journal_file, "a", encoding="utf-8") as f:
+                    for record in records:
+                        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+            except Exception as e:
+                ExceptionUtils.exception_traceback(e)
+                return
+            for record in records:
+                self._records += 1
+                self.__apply(record)
+            if self._records > self._MAX_RECORDS:
+                self.__compact()
+
+    def __compact(self):
+        """
+        只保留未完成的记录及已完成的目录，重写日志
+        """
+        with lock:
+            records = list(self._entries.values())
+            records += [{"state": "dir", "path": path, "target": target, "mode": mode, "signature": signature}
+                        for (path, target, mode), signature in self._completed_dirs.items()]
+            tmp_file = "%s.tmp" % self._journal_file
+            try:
+                with open(tmp_file, "w", encoding="utf-8") as f:
+                    for record in records:
+                        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp_file, self._journal_file)
+                self._records = len(records)
+            except Exception as e:
+                ExceptionUtils.exception_traceback(e)
+
+    def begin(self, src, target, rmt_mode, bluray=False, history=None):
+        """
+        记录转移意图，转移前调用
+        :param src: 源文件或目录
+        :param target: 目的文件，蓝光原盘时为目的目录
+        :param rmt_mode: 转移方式
+        :param bluray: 是否蓝光原盘目录
+        :param history: 转移完成后需登记的转移记录
+        :return: 记录ID
+        """
+        jid = uuid.uuid4().hex
+        self.__append([{"id": jid,
+                        "state": "intent",
+                        "time": time.time(),
+                        "src": os.path.normpath(src),
+                        "target": os.path.normpath(target),
+                        "mode": rmt_mode.name,
+                        "bluray": bluray,
+                        "history": history}])
+        return jid
+
+    def done(self, jid, checksum=None):
+        """
+        文件已转移完成
+        """
+        if jid:
+            self.__append([{"id": jid, "state": "done", "checksum": checksum}])
+
+    def commit(self, jids):
+        """
+        转移记录已登记
+        """
+        jids = [jid for jid in jids or [] if jid]
+        if jids:
+            self.__append([{"id": jid, "state": "committed"} for jid in jids])
+
+    def fail(self, jid):
+        """
+        转移失败
+        """
+        if jid:
+            self.__append([{"id": jid, "state": "failed"}])
+
+    @staticmethod
+    def get_dir_signature(path):
+        """
+        目录签名：目录树中所有目录的修改时间，文件为大小及修改时间，不读取目录下文件的属性
+        """
+        try:
+            if not os.path.isdir(path):
+                stat = os.stat(path)
+                return "%s-%s" % (stat.st_size, stat.st_mtime_ns)
+            mtimes = []
+            dirs = [path]
+            while dirs:
+                cur_dir = dirs.pop()
+                mtimes.append("%s:%s" % (os.path.relpath(cur_dir, path), os.stat(cur_dir).st_mtime_ns))
+                with os.scandir(cur_dir) as entries:
+                    dirs.extend(entry.path for entry in entries if entry.is_dir(follow_symlinks=False))
+            return hashlib.md5("|".join(sorted(mtimes)).encode("utf-8")).hexdigest()
+        except OSError:
+            return None
+
+    @staticmethod
+    def __get_dir_key(path, target, rmt_mode):
+        """
+        已完整处理目录的键：(源目录, 目的目录, 转移方式)，目的目录为空时表示按配置的媒体库目录
+        """
+        return os.path.normpath(path), os.path.normpath(target) if target else "", rmt_mode.name if rmt_mode else None
+
+    def complete_dir(self, path, target, rmt_mode):
+        """
+        目录已完整处理
+        :param path: 源目录
+        :param target: 目的目录
+        :param rmt_mode: 转移方式
+        """
+        if not path:
+            return
+        signature = self.get_dir_signature(path)
+        if signature:
+            path, target, mode = self.__get_dir_key(path, target, rmt_mode)
+            self.__append([{"state": "dir", "path": path, "target": target, "mode": mode, "signature": signature}])
+
+    def is_dir_completed(self, path, target, rmt_mode):
+        """
+        目录是否已按相同的目的目录及转移方式完整处理且之后没有变化
+        """
+        if not path:
+            return False
+        signature = self._completed_dirs.get(self.__get_dir_key(path, target, rmt_mode))
+        return bool(signature) and signature == self.get_dir_signature(path)
+
+    def get_unfinished(self):
+        """
+        未完成的记录
+        """
+        with lock:
+            return [dict(entry) for entry in self._entries.values()]
+
+    @staticmethod
+    def __remove_temp_files(target, bluray=False):
+        """
+        删除复制中断残留的临时文件
+        """
+        if bluray:
+            temp_files = [os.path.join(root, name) for root, _, names in os.walk(target)
+                          for name in names if name.endswith(CopyEngine.TEMP_SUFFIX)]
+        else:
+            target_dir, target_name = os.path.split(target)
+            if not os.path.isdir(target_dir):
+                return
+            temp_files = [os.path.join(target_dir, name) for name in os.listdir(target_dir)
+                          if name.startswith(".%s." % target_name) and name.endswith(CopyEngine.TEMP_SUFFIX)]
+        for temp_file in temp_files:
+            log.info("【Rmt】删除转移中断残留的临时文件：%s" % temp_file)
+            os.remove(temp_file)
+
+    @staticmethod
+    def __remove_staging_dirs(entry):
+        """
+        删除原盘目录转移中断残留的暂存目录，移动时先将已移动的文件移回原目录
+        :return: 是否有残留的暂存目录
+        """
+        src = entry.get("src")
+        target_dir, target_name = os.path.split(entry.get("target"))
+        if not os.path.isdir(target_dir):
+            return False
+        staging_dirs = [os.path.join(target_dir, name) for name in os.listdir(target_dir)
+                        if name.startswith(".%s." % target_name) and name.endswith(RMT_STAGING_SUFFIX)]
+        for staging_dir in staging_dirs:
+            if entry.get("mode") == RmtMode.MOVE.name:
+                for root, _, names in os.walk(staging_dir):
+                    for name in names:
+                        staging_file = os.path.join(root, name)
+                        src_file = os.path.join(src, os.path.relpath(staging_file, staging_dir))
+                        if name.endswith(CopyEngine.TEMP_SUFFIX) or os.path.exists(src_file):
+                            continue
+                        log.info("【Rmt】移回转移中断的文件：%s" % src_file)
+                        os.makedirs(os.path.dirname(src_file), exist_ok=True)
+                        shutil.move(staging_file, src_file)
+            log.info("【Rmt】删除转移中断残留的暂存目录：%s" % staging_dir)
+            shutil.rmtree(staging_dir, ignore_errors=True)
+        return bool(staging_dirs)
+
+    @staticmethod
+    def __finish_file(entry):
+        """
+        判断文件是否已转移完成，移动时复制已完成但源文件未删除的删除源文件
+        硬链接需与源文件为同一文件，软链接需指向源文件
+        """
+        src = entry.get("src")
+        target = entry.get("target")
+        if not os.path.lexists(target):
+            return False
+        if not os.path.exists(src):
+            return True
+        if entry.get("mode") == RmtMode.LINK.name:
+            return os.path.exists(target) and os.path.samefile(src, target)
+        if entry.get("mode") == RmtMode.SOFTLINK.name:
+            return os.path.islink(target) and os.path.realpath(target) == os.path.realpath(src)
+        if os.path.getsize(src) != os.path.getsize(target):
+            return False
+        if entry.get("mode") == RmtMode.MOVE.name and not os.path.samefile(src, target):
+            log.info("【Rmt】继续完成移动，删除源文件：%s" % src)
+            os.remove(src)
+        return True
+
+    def recover(self):
+        """
+        启动时处理未完成的记录：文件已转移完成的继续登记转移记录，未完成的清理临时文件及暂存目录后回滚
+        """
+        entries = self.get_unfinished()
+        if not entries:
+            return
+        log.info("【Rmt】发现 %s 条未完成的转移记录，开始恢复..." % len(entries))
+        dbhelper = DbHelper()
+        for entry in entries:
+            jid = entry.get("id")
+            try:
+                if entry.get("state") == "intent":
+                    if entry.get("bluray"):
+                        # 原盘目录完成后才由暂存目录改名为目的目录，没有残留暂存目录且目的目录不为空时已完成
+                        finished = not self.__remove_staging_dirs(entry) \
+                            and os.path.isdir(entry.get("target")) and bool(os.listdir(entry.get("target")))
+                        self.__remove_temp_files(entry.get("target"), True)
+                    else:
+                        self.__remove_temp_files(entry.get("target"))
+                        finished = self.__finish_file(entry)
+                    if not finished:
+                        log.warn("【Rmt】%s 转移未完成，已回滚，需重新转移" % entry.get("src"))
+                        self.fail(jid)
+                        continue
+                    entry["state"] = "done"
+                # 文件已转移，补登记转移记录
+                history = entry.get("history")
+                if history:
+                    if entry.get("checksum"):
+                        history["CHECKSUM"] = entry.get("checksum")
+                    dbhelper.insert_transfer_history_rows([history])
+                dbhelper.insert_transfer_blacklist(entry.get("src"))
+                log.info("【Rmt】%s 转移已完成，已补登记转移记录" % entry.get("src"))
+                self.commit([jid])
+            except Exception as e:
+                ExceptionUtils.exception_traceback(e)
+                log.error("【Rmt】恢复转移记录 %s 出错：%s" % (entry.get("src"), str(e)))
+        self.__compact()
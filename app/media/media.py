@@ -1,8 +1,13 @@
 import difflib
+import itertools
 import os
 import random
 import re
+import threading
 import traceback
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from functools import lru_cache
 
 import zhconv
@@ -14,9 +19,10 @@ from app.media.meta.metainfo import MetaInfo
 from app.media.tmdbv3api import TMDb, Search, Movie, TV, Person, Find, TMDbException, Discover, Trending, Episode, Genre
 from app.utils import PathUtils, EpisodeFormat, RequestUtils, NumberUtils, StringUtils, cacheman
 from app.utils.types import MediaType, MatchMode
-from config import Config, KEYWORD_BLACKLIST, KEYWORD_SEARCH_WEIGHT_3, KEYWORD_SEARCH_WEIGHT_2, KEYWORD_SEARCH_WEIGHT_1, \
+from config import Config, RMT_RECOGNIZE_THREADS, KEYWORD_BLACKLIST, KEYWORD_SEARCH_WEIGHT_3, KEYWORD_SEARCH_WEIGHT_2, KEYWORD_SEARCH_WEIGHT_1, \
     KEYWORD_STR_SIMILARITY_THRESHOLD, KEYWORD_DIFF_SCORE_THRESHOLD, TMDB_IMAGE_ORIGINAL_URL, DEFAULT_TMDB_PROXY, \
-    TMDB_IMAGE_FACE_URL, TMDB_PEOPLE_PROFILE_URL, TMDB_IMAGE_W500_URL
+    TMDB_IMAGE_FACE_URL, TMDB_PEOPLE_PROFILE_URL, TMDB_IMAGE_W500_URL, TMDB_CACHE_TTLS, TMDB_CACHE_MAX_SIZE, \
+    TMDB_CONNECT_TIMEOUT, TMDB_READ_TIMEOUT, TMDB_RATE_LIMIT
 
 
 class Media:
@@ -35,6 +41,9 @@ class Media:
     _rmt_match_mode = None
     _search_keyword = None
     _search_tmdbweb = None
+    # 媒体缓存键 -> [查询锁, 等待数]，所有实例共用
+    _search_locks = {}
+    _search_locks_guard = threading.Lock()
 
     def __init__(self):
         self.init_config()
@@ -50,9 +59,14 @@ class Media:
                 else:
                     self.tmdb.domain = app.get("tmdb_domain")
                 self.tmdb.cache = True
+                self.tmdb.set_http_cache(os.path.join(Config().get_config_path(), "tmdb_cache.db"),
+                                         ttls=TMDB_CACHE_TTLS,
+                                         max_size=TMDB_CACHE_MAX_SIZE)
                 self.tmdb.api_key = app.get('rmt_tmdbkey')
-                self.tmdb.language = 'zh'
+                self.tmdb.default_language = 'zh'
                 self.tmdb.proxies = Config().get_proxies()
+                self.tmdb.timeout = (TMDB_CONNECT_TIMEOUT, TMDB_READ_TIMEOUT)
+                self.tmdb.limiter.set_max_rate(TMDB_RATE_LIMIT)
                 self.tmdb.debug = True
                 self.search = Search()
                 self.movie = Movie()
@@ -776,51 +790,126 @@ class Media:
             file_list = [file_list]
         # 遍历每个文件，看得出来的名称是不是不一样，不一样的先搜索媒体信息
         for file_path in file_list:
-            try:
-                if not os.path.exists(file_path):
-                    log.warn("【Meta】%s 不存在" % file_path)
-                    continue
-                # 解析媒体名称
-                # 先用自己的名称
-                file_name = os.path.basename(file_path)
-                parent_name = os.path.basename(os.path.dirname(file_path))
-                parent_parent_name = os.path.basename(PathUtils.get_parent_paths(file_path, 2))
-                # 过滤掉蓝光原盘目录下的子文件
-                if not os.path.isdir(file_path) \
-                        and PathUtils.get_bluray_dir(file_path):
-                    log.info("【Meta】%s 跳过蓝光原盘文件：" % file_path)
-                    continue
-                # 没有自带TMDB信息
-                if not tmdb_info:
-                    # 识别名称
-                    meta_info = MetaInfo(title=file_name)
-                    # 识别不到则使用上级的名称
-                    if not meta_info.get_name() or not meta_info.year:
-                        parent_info = MetaInfo(parent_name)
-                        if not parent_info.get_name() or not parent_info.year:
-                            parent_parent_info = MetaInfo(parent_parent_name)
-                            parent_info.type = parent_parent_info.type if parent_parent_info.type and parent_info.type != MediaType.TV else parent_info.type
-                            parent_info.cn_name = parent_parent_info.cn_name if parent_parent_info.cn_name else parent_info.cn_name
-                            parent_info.en_name = parent_parent_info.en_name if parent_parent_info.en_name else parent_info.en_name
-                            parent_info.year = parent_parent_info.year if parent_parent_info.year else parent_info.year
-                            parent_info.begin_season = NumberUtils.max_ele(parent_info.begin_season,
-                                                                           parent_parent_info.begin_season)
-                        if not meta_info.get_name():
-                            meta_info.cn_name = parent_info.cn_name
-                            meta_info.en_name = parent_info.en_name
-                        if not meta_info.year:
-                            meta_info.year = parent_info.year
-                        if parent_info.type and parent_info.type == MediaType.TV \
-                                and meta_info.type != MediaType.TV:
-                            meta_info.type = parent_info.type
-                        if meta_info.type == MediaType.TV:
-                            meta_info.begin_season = NumberUtils.max_ele(parent_info.begin_season,
-                                                                         meta_info.begin_season)
-                    if not meta_info.get_name() or not meta_info.type:
-                        log.warn("【Rmt】%s 未识别出有效信息！" % meta_info.org_string)
-                        continue
-                    # 区配缓存及TMDB
-                    media_key = self.__make_cache_key(meta_info)
+            meta_info = self.get_media_info_on_file(file_path=file_path,
+                                                    tmdb_info=tmdb_info,
+                                                    media_type=media_type,
+                                                    season=season,
+                                                    episode_format=episode_format,
+                                                    chinese=chinese)
+            if meta_info:
+                # 按文件路程存储
+                return_media_infos[file_path] = meta_info
+        # 循环结束
+        return return_media_infos
+
+    def iter_media_info_on_files(self,
+                                 file_list,
+                                 tmdb_info=None,
+                                 media_type=None,
+                                 season=None,
+                                 episode_format: EpisodeFormat = None,
+                                 chinese=True,
+                                 max_workers=RMT_RECOGNIZE_THREADS):
+        """
+        并发识别文件清单，按文件清单顺序逐个返回识别结果，调用方可在后续文件识别的同时处理已识别的文件
+        参数同get_media_info_on_files
+        :param max_workers: 并发识别数
+        :return: 迭代返回(文件路径, MetaInfo)，未识别出有效信息的文件不返回
+        """
+        if not self.tmdb:
+            log.error("【Meta】TMDB API Key 未设置！")
+            return
+        if not isinstance(file_list, list):
+            file_list = [file_list]
+        if not file_list:
+            return
+        executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(file_list))))
+        futures = deque()
+        file_iter = iter(file_list)
+        # 批量识别的TMDB请求排在交互请求之后，调用方已指定时沿用
+        priority, caller = self.tmdb.limiter.get_context()
+        priority = max(priority, self.tmdb.limiter.PRIORITY_BACKGROUND)
+        caller = caller or "recognize"
+
+        def __recognize(path):
+            with self.tmdb.limiter.priority(priority, caller):
+                return self.get_media_info_on_file(path, tmdb_info, media_type,
+                                                   season, episode_format, chinese)
+
+        try:
+            # 最多提前识别并发数的两倍，避免调用方处理慢时占用过多
+            for file_path in itertools.islice(file_iter, max_workers * 2):
+                futures.append((file_path, executor.submit(__recognize, file_path)))
+            while futures:
+                file_path, future = futures.popleft()
+                next_path = next(file_iter, None)
+                if next_path:
+                    futures.append((next_path, executor.submit(__recognize, next_path)))
+                meta_info = future.result()
+                if meta_info:
+                    yield file_path, meta_info
+        finally:
+            # 调用方提前结束时取消未开始的识别
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def get_media_info_on_file(self,
+                               file_path,
+                               tmdb_info=None,
+                               media_type=None,
+                               season=None,
+                               episode_format: EpisodeFormat = None,
+                               chinese=True):
+        """
+        识别单个文件，参数同get_media_info_on_files
+        :return: 带有TMDB信息的MetaInfo对象，未识别出有效信息时返回None
+        """
+        try:
+            if not os.path.exists(file_path):
+                log.warn("【Meta】%s 不存在" % file_path)
+                return None
+            # 解析媒体名称
+            # 先用自己的名称
+            file_name = os.path.basename(file_path)
+            parent_name = os.path.basename(os.path.dirname(file_path))
+            parent_parent_name = os.path.basename(PathUtils.get_parent_paths(file_path, 2))
+            # 过滤掉蓝光原盘目录下的子文件
+            if not os.path.isdir(file_path) \
+                    and PathUtils.get_bluray_dir(file_path):
+                log.info("【Meta】%s 跳过蓝光原盘文件：" % file_path)
+                return None
+            # 没有自带TMDB信息
+            if not tmdb_info:
+                # 识别名称
+                meta_info = MetaInfo(title=file_name)
+                # 识别不到则使用上级的名称
+                if not meta_info.get_name() or not meta_info.year:
+                    parent_info = MetaInfo(parent_name)
+                    if not parent_info.get_name() or not parent_info.year:
+                        parent_parent_info = MetaInfo(parent_parent_name)
+                        parent_info.type = parent_parent_info.type if parent_parent_info.type and parent_info.type != MediaType.TV else parent_info.type
+                        parent_info.cn_name = parent_parent_info.cn_name if parent_parent_info.cn_name else parent_info.cn_name
+                        parent_info.en_name = parent_parent_info.en_name if parent_parent_info.en_name else parent_info.en_name
+                        parent_info.year = parent_parent_info.year if parent_parent_info.year else parent_info.year
+                        parent_info.begin_season = NumberUtils.max_ele(parent_info.begin_season,
+                                                                       parent_parent_info.begin_season)
+                    if not meta_info.get_name():
+                        meta_info.cn_name = parent_info.cn_name
+                        meta_info.en_name = parent_info.en_name
+                    if not meta_info.year:
+                        meta_info.year = parent_info.year
+                    if parent_info.type and parent_info.type == MediaType.TV \
+                            and meta_info.type != MediaType.TV:
+                        meta_info.type = parent_info.type
+                    if meta_info.type == MediaType.TV:
+                        meta_info.begin_season = NumberUtils.max_ele(parent_info.begin_season,
+                                                                     meta_info.begin_season)
+                if not meta_info.get_name() or not meta_info.type:
+                    log.warn("【Rmt】%s 未识别出有效信息！" % meta_info.org_string)
+                    return None
+                # 区配缓存及TMDB
+                media_key = self.__make_cache_key(meta_info)
+                # 同一媒体并发识别时只查询一次，其余等待缓存
+                with self.__search_lock(media_key):
                     if not self.meta.get_meta_data_by_key(media_key):
                         # 没有缓存数据
                         file_media_info = self.__search_tmdb(file_media_name=meta_info.get_name(),
@@ -869,29 +958,45 @@ class Media:
                         else:
                             # 缓存为未识别
                             file_media_info = None
-                    # 赋值TMDB信息
-                    meta_info.set_tmdb_info(file_media_info)
-                # 自带TMDB信息
-                else:
-                    meta_info = MetaInfo(title=file_name, mtype=media_type)
-                    meta_info.set_tmdb_info(tmdb_info)
-                    if season and meta_info.type != MediaType.MOVIE:
-                        meta_info.begin_season = int(season)
-                    if episode_format:
-                        begin_ep, end_ep = episode_format.split_episode(file_name)
-                        if begin_ep is not None:
-                            meta_info.begin_episode = begin_ep
-                        if end_ep is not None:
-                            meta_info.end_episode = end_ep
-                    # 加入缓存
-                    self.save_rename_cache(file_name, tmdb_info)
-                # 按文件路程存储
-                return_media_infos[file_path] = meta_info
-            except Exception as err:
-                print(str(err))
-                log.error("【Rmt】发生错误：%s - %s" % (str(err), traceback.format_exc()))
-        # 循环结束
-        return return_media_infos
+                # 赋值TMDB信息
+                meta_info.set_tmdb_info(file_media_info)
+            # 自带TMDB信息
+            else:
+                meta_info = MetaInfo(title=file_name, mtype=media_type)
+                meta_info.set_tmdb_info(tmdb_info)
+                if season and meta_info.type != MediaType.MOVIE:
+                    meta_info.begin_season = int(season)
+                if episode_format:
+                    begin_ep, end_ep = episode_format.split_episode(file_name)
+                    if begin_ep is not None:
+                        meta_info.begin_episode = begin_ep
+                    if end_ep is not None:
+                        meta_info.end_episode = end_ep
+                # 加入缓存
+                self.save_rename_cache(file_name, tmdb_info)
+            return meta_info
+        except Exception as err:
+            log.error("【Rmt】发生错误：%s - %s" % (str(err), traceback.format_exc()))
+        return None
+
+    @contextmanager
+    def __search_lock(self, media_key):
+        """
+        按媒体缓存键加锁，同一媒体同时只有一个线程查询TMDB
+        """
+        with self._search_locks_guard:
+            key_lock = self._search_locks.get(media_key)
+            if not key_lock:
+                key_lock = self._search_locks[media_key] = [threading.Lock(), 0]
+            key_lock[1] += 1
+        try:
+            with key_lock[0]:
+                yield
+        finally:
+            with self._search_locks_guard:
+                key_lock[1] -= 1
+                if not key_lock[1]:
+                    self._search_locks.pop(media_key, None)
 
     @staticmethod
     def __dict_tmdbinfos(infos, mtype=None):
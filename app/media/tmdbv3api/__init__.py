@@ -1,5 +1,6 @@
 from .tmdb import TMDb
 from .exceptions import TMDbException
+from .limiter import TMDbRateLimiter
 from .objs.movie import Movie
 from .objs.search import Search
 from .objs.tv import TV
@@ -0,0 +1,218 @@
+# -*- coding: utf-8 -*-
+
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from urllib.parse import urlsplit, parse_qsl, urlencode
+
+logger = logging.getLogger(__name__)
+
+
+class TMDbCache(object):
+    """
+    TMDB响应的本地持久化缓存：以规范化后的URL及参数为键，按接口类别设置过期时间，
+    响应以zlib压缩后保存在SQLite中，超过容量时淘汰最久未使用的条目，并统计命中率
+    """
+    # 各类接口的缓存时间，秒
+    DEFAULT_TTLS = {
+        "search": 24 * 3600,
+        "details": 7 * 24 * 3600,
+        "season": 24 * 3600,
+        "trending": 3600
+    }
+    # 默认容量，字节
+    DEFAULT_MAX_SIZE = 256 * 1024 * 1024
+    # 不参与缓存键的参数
+    _IGNORE_PARAMS = {"api_key"}
+    # 接口类别：(类别, 路径规则)，按顺序匹配，均不匹配时为details
+    _ENDPOINTS = [
+        ("trending", re.compile(r"^/(trending|discover)/|"
+                                r"^/movie/(popular|now_playing|upcoming|top_rated)$|"
+                                r"^/tv/(popular|on_the_air|airing_today|top_rated)$")),
+        ("search", re.compile(r"^/(search|find)/")),
+        ("season", re.compile(r"/season/"))
+    ]
+    # 访问时间的更新间隔，秒，避免每次命中都写库
+    _TOUCH_INTERVAL = 3600
+
+    def __init__(self, path, ttls=None, max_size=None):
+        self._path = path
+        self._ttls = dict(self.DEFAULT_TTLS)
+        self._ttls.update(ttls or {})
+        self._max_size = max_size or self.DEFAULT_MAX_SIZE
+        self._lock = threading.Lock()
+        self._conn = None
+        self._size = 0
+        # 类别 -> [命中数, 未命中数]
+        self._stats = {endpoint: [0, 0] for endpoint in self._ttls}
+        self.__open()
+
+    @property
+    def path(self):
+        return self._path
+
+    def __open(self):
+        try:
+            cache_dir = os.path.dirname(self._path)
+            if cache_dir and not os.path.exists(cache_dir):
+                os.makedirs(cache_dir)
+            self._conn = sqlite3.connect(self._path, check_same_thread=False, timeout=10)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS RESPONSES ("
+                               "KEY TEXT PRIMARY KEY, "
+                               "ENDPOINT TEXT, "
+                               "EXPIRES REAL, "
+                               "ACCESSED REAL, "
+                               "SIZE INTEGER, "
+                               "BODY BLOB)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS IDX_RESPONSES_ACCESSED ON RESPONSES (ACCESSED)")
+            self._conn.execute("DELETE FROM RESPONSES WHERE EXPIRES < ?", (time.time(),))
+            self._conn.commit()
+            self._size = self._conn.execute("SELECT IFNULL(SUM(SIZE), 0) FROM RESPONSES").fetchone()[0]
+        except sqlite3.Error as err:
+            logger.warning("TMDB cache unavailable: %s" % err)
+            self._conn = None
+
+    @classmethod
+    def get_endpoint(cls, action):
+        """
+        接口路径对应的缓存类别
+        """
+        for endpoint, pattern in cls._ENDPOINTS:
+            if pattern.search(action):
+                return endpoint
+        return "details"
+
+    @classmethod
+    def get_key(cls, method, url, data=None):
+        """
+        规范化缓存键：不含域名，去掉api_key及空参数，参数按名称排序
+        """
+        parts = urlsplit(url)
+        params = sorted((key, value) for key, value in parse_qsl(parts.query, keep_blank_values=False)
+                        if key not in cls._IGNORE_PARAMS)
+        key = "%s %s?%s" % (method.upper(), parts.path.rstrip("/"), urlencode(params))
+        if data:
+            key = "%s %s" % (key, data)
+        return key
+
+    def get(self, key, endpoint):
+        """
+        查询未过期的缓存，未命中时返回None
+        """
+        if not self._conn:
+            return None
+        now = time.time()
+        with self._lock:
+            stats = self._stats.setdefault(endpoint, [0, 0])
+            try:
+                row = self._conn.execute("SELECT EXPIRES, ACCESSED, BODY FROM RESPONSES WHERE KEY = ?",
+                                         (key,)).fetchone()
+                if not row or row[0] < now:
+                    stats[1] += 1
+                    return None
+                if now - row[1] > self._TOUCH_INTERVAL:
+                    self._conn.execute("UPDATE RESPONSES SET ACCESSED = ? WHERE KEY = ?", (now, key))
+                    self._conn.commit()
+                result = json.loads(zlib.decompress(row[2]).decode("utf-8"))
+            except (sqlite3.Error, zlib.error, ValueError) as err:
+                logger.warning("TMDB cache read failed: %s" % err)
+                stats[1] += 1
+                return None
+            stats[0] += 1
+            return result
+
+    def set(self, key, endpoint, result):
+        """
+        保存响应
+        """
+        if not self._conn:
+            return
+        ttl = self._ttls.get(endpoint)
+        if not ttl:
+            return
+        now = time.time()
+        body = zlib.compress(json.dumps(result, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+        with self._lock:
+            try:
+                row = self._conn.execute("SELECT SIZE FROM RESPONSES WHERE KEY = ?", (key,)).fetchone()
+                self._conn.execute("REPLACE INTO RESPONSES (KEY, ENDPOINT, EXPIRES, ACCESSED, SIZE, BODY) "
+                                   "VALUES (?, ?, ?, ?, ?, ?)",
+                                   (key, endpoint, now + ttl, now, len(body), body))
+                self._size += len(body) - (row[0] if row else 0)
+                if self._size > self._max_size:
+                    self.__evict()
+                self._conn.commit()
+            except sqlite3.Error as err:
+                logger.warning("TMDB cache write failed: %s" % err)
+
+    def __evict(self):
+        """
+        删除过期条目，仍超过容量时按访问时间淘汰至容量的90%
+        """
+        self._conn.execute("DELETE FROM RESPONSES WHERE EXPIRES < ?", (time.time(),))
+        self._size = self._conn.execute("SELECT IFNULL(SUM(SIZE), 0) FROM RESPONSES").fetchone()[0]
+        target_size = self._max_size * 0.9
+        if self._size <= target_size:
+            return
+        evict_keys = []
+        for key, size in self._conn.execute("SELECT KEY, SIZE FROM RESPONSES ORDER BY ACCESSED"):
+            if self._size <= target_size:
+                break
+            evict_keys.append((key,))
+            self._size -= size
+        self._conn.executemany("DELETE FROM RESPONSES WHERE KEY = ?", evict_keys)
+
+    def clear(self):
+        """
+        清空缓存
+        """
+        if not self._conn:
+            return
+        with self._lock:
+            try:
+                self._conn.execute("DELETE FROM RESPONSES")
+                self._conn.commit()
+                self._conn.execute("VACUUM")
+                self._size = 0
+            except sqlite3.Error as err:
+                logger.warning("TMDB cache clear failed: %s" % err)
+
+    def get_stats(self):
+        """
+        缓存统计：条目数、占用空间及各类接口的命中数、未命中数
+        """
+        with self._lock:
+            count = 0
+            if self._conn:
+                try:
+                    count = self._conn.execute("SELECT COUNT(1) FROM RESPONSES").fetchone()[0]
+                except sqlite3.Error:
+                    pass
+            endpoints = {endpoint: {"hits": hits,
+                                    "misses": misses,
+                                    "ttl": self._ttls.get(endpoint),
+                                    "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0}
+                         for endpoint, (hits, misses) in self._stats.items()}
+            hits = sum(item.get("hits") for item in endpoints.values())
+            misses = sum(item.get("misses") for item in endpoints.values())
+            return {"path": self._path,
+                    "count": count,
+                    "size": self._size,
+                    "max_size": self._max_size,
+                    "hits": hits,
+                    "misses": misses,
+                    "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0,
+                    "endpoints": endpoints}
+
+    def close(self):
+        with self._lock:
+            if self._conn:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+from app.utils.token_bucket import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+class TMDbRateLimiter(object):
+    """
+    TMDB请求限速：所有请求共用一个令牌桶，等待中的请求按优先级依次取令牌，交互请求可排在后台批量识别之前；
+    收到429时按Retry-After暂停并降低速率，之后持续成功时逐步恢复；按调用方统计等待时间
+    """
+    # 优先级，数值越小越优先
+    PRIORITY_INTERACTIVE = 0
+    PRIORITY_NORMAL = 1
+    PRIORITY_BACKGROUND = 2
+    # 默认速率，请求数/秒
+    DEFAULT_RATE = 40
+    # 降速后的最低速率
+    MIN_RATE = 1
+    # 连续成功该数量的请求后恢复一次速率
+    _RECOVER_REQUESTS = 50
+    # 没有Retry-After时429的暂停时间，秒
+    _DEFAULT_RETRY_AFTER = 1
+
+    def __init__(self, rate=DEFAULT_RATE):
+        self._max_rate = float(rate)
+        self._bucket = TokenBucket(self._max_rate)
+        self._cond = threading.Condition()
+        # 等待取令牌的请求：(优先级, 序号)
+        self._waiters = []
+        self._seq = itertools.count()
+        # 是否有请求正在取令牌
+        self._busy = False
+        # 暂停到该时间（monotonic）
+        self._pause_until = 0
+        self._successes = 0
+        self._rate_limited = 0
+        # 调用方 -> 等待统计
+        self._metrics = {}
+        self._local = threading.local()
+
+    @property
+    def rate(self):
+        return self._bucket.rate
+
+    def set_max_rate(self, rate):
+        """
+        设置最大速率，当前速率同时调整
+        """
+        with self._cond:
+            self._max_rate = max(float(rate or self.DEFAULT_RATE), self.MIN_RATE)
+            self._bucket.set_rate(self._max_rate)
+
+    @contextmanager
+    def priority(self, priority, caller=None):
+        """
+        在当前线程内设置请求的优先级及调用方名称
+        """
+        saved = getattr(self._local, "context", None)
+        self._local.context = (priority, caller or (saved[1] if saved else None))
+        try:
+            yield
+        finally:
+            self._local.context = saved
+
+    def get_context(self):
+        """
+        当前线程的(优先级, 调用方)，供提交到其它线程的任务沿用
+        """
+        return getattr(self._local, "context", None) or (self.PRIORITY_NORMAL, None)
+
+    def acquire(self):
+        """
+        取一个令牌，按优先级排队，不足时等待
+        :return: 等待的秒数
+        """
+        priority, caller = self.get_context()
+        start = time.monotonic()
+        waiter = (priority, next(self._seq))
+        with self._cond:
+            heapq.heappush(self._waiters, waiter)
+            while self._busy or self._waiters[0] != waiter:
+                self._cond.wait()
+            heapq.heappop(self._waiters)
+            self._busy = True
+        try:
+            pause = self._pause_until - time.monotonic()
+            if pause > 0:
+                time.sleep(pause)
+            self._bucket.consume(1)
+        finally:
+            with self._cond:
+                self._busy = False
+                self._cond.notify_all()
+        wait = time.monotonic() - start
+        self.__record(caller or "other", priority, wait)
+        return wait
+
+    def __record(self, caller, priority, wait):
+        with self._cond:
+            metric = self._metrics.get(caller)
+            if not metric:
+                metric = self._metrics[caller] = {"priority": priority, "requests": 0,
+                                                  "wait_total": 0.0, "wait_max": 0.0}
+            metric["priority"] = priority
+            metric["requests"] += 1
+            metric["wait_total"] += wait
+            metric["wait_max"] = max(metric["wait_max"], wait)
+
+    def on_success(self):
+        """
+        请求成功，降速后连续成功时逐步恢复速率
+        """
+        with self._cond:
+            self._successes += 1
+            if self._successes < self._RECOVER_REQUESTS or self.rate >= self._max_rate:
+                return
+            self._successes = 0
+            self._bucket.set_rate(min(self.rate * 1.5, self._max_rate))
+
+    def on_rate_limited(self, retry_after=None):
+        """
+        收到429或剩余请求数为0，按Retry-After暂停并将速率减半
+        :param retry_after: 需等待的秒数
+        """
+        retry_after = max(float(retry_after or self._DEFAULT_RETRY_AFTER), 0)
+        with self._cond:
+            self._rate_limited += 1
+            self._successes = 0
+            self._pause_until = max(self._pause_until, time.monotonic() + retry_after)
+            new_rate = max(self.rate / 2, self.MIN_RATE)
+            self._bucket.set_rate(new_rate)
+        logger.warning("Rate limit reached, pause %.1fs, rate %.1f/s" % (retry_after, new_rate))
+
+    def get_stats(self):
+        """
+        限速统计：当前速率、排队数、触发限速次数及各调用方的请求数、平均及最大等待时间
+        """
+        with self._cond:
+            return {
+                "rate": self.rate,
+                "max_rate": self._max_rate,
+                "waiting": len(self._waiters),
+                "rate_limited": self._rate_limited,
+                "paused": round(max(self._pause_until - time.monotonic(), 0), 2),
+                "callers": {caller: {"priority": metric.get("priority"),
+                                     "requests": metric.get("requests"),
+                                     "wait_avg": round(metric.get("wait_total") / metric.get("requests"), 4),
+                                     "wait_max": round(metric.get("wait_max"), 4)}
+                            for caller, metric in self._metrics.items()}
+            }
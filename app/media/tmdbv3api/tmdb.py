@@ -1,14 +1,19 @@
 # -*- coding: utf-8 -*-
 
+import ast
 import logging
 import os
+import threading
 import time
-from functools import lru_cache
+from email.utils import parsedate_to_datetime
 
 import requests
 import requests.exceptions
+from requests.adapters import HTTPAdapter
 
 from .as_obj import AsObj
+from .cache import TMDbCache
+from .limiter import TMDbRateLimiter
 from .exceptions import TMDbException
 
 logger = logging.getLogger(__name__)
@@ -22,10 +27,27 @@ class TMDb(object):
     TMDB_CACHE_ENABLED = "TMDB_CACHE_ENABLED"
     TMDB_PROXIES = "TMDB_PROXIES"
     TMDB_DOMAIN = "TMDB_DOMAIN"
-    REQUEST_CACHE_MAXSIZE = 256
+    TMDB_CONNECT_TIMEOUT = "TMDB_CONNECT_TIMEOUT"
+    TMDB_READ_TIMEOUT = "TMDB_READ_TIMEOUT"
+    # 默认连接、读取超时，秒
+    DEFAULT_CONNECT_TIMEOUT = 5
+    DEFAULT_READ_TIMEOUT = 10
+    # 共用会话的连接池大小
+    POOL_SIZE = 20
+    # 429时的最大重试次数
+    MAX_RETRIES = 3
+    # 所有请求共用的限速
+    limiter = TMDbRateLimiter()
+    # 所有实例共用的响应缓存
+    _http_cache = None
+    # 所有实例共用的会话：((代理, 域名), 会话, 代理)
+    _shared_session = None
+    _shared_session_lock = threading.Lock()
+    # 按线程保存的语言及分页信息，并发请求互不影响
+    _local = threading.local()
 
     def __init__(self, obj_cached=True, session=None):
-        self._session = requests.Session() if session is None else session
+        self._session = session
         self._remaining = 40
         self._reset = None
         self.obj_cached = obj_cached
@@ -36,15 +58,15 @@ class TMDb(object):
 
     @property
     def page(self):
-        return os.environ["page"]
+        return getattr(self._local, "page", None)
 
     @property
     def total_results(self):
-        return os.environ["total_results"]
+        return getattr(self._local, "total_results", None)
 
     @property
     def total_pages(self):
-        return os.environ["total_pages"]
+        return getattr(self._local, "total_pages", None)
 
     @property
     def api_key(self):
@@ -82,16 +104,81 @@ class TMDb(object):
             else:
                 os.environ[self.TMDB_PROXIES] = 'None'
 
+    @property
+    def timeout(self):
+        """
+        (连接超时, 读取超时)
+        """
+        return (float(os.environ.get(self.TMDB_CONNECT_TIMEOUT) or self.DEFAULT_CONNECT_TIMEOUT),
+                float(os.environ.get(self.TMDB_READ_TIMEOUT) or self.DEFAULT_READ_TIMEOUT))
+
+    @timeout.setter
+    def timeout(self, timeout):
+        connect_timeout, read_timeout = timeout if isinstance(timeout, (tuple, list)) else (timeout, timeout)
+        os.environ[self.TMDB_CONNECT_TIMEOUT] = str(connect_timeout or '')
+        os.environ[self.TMDB_READ_TIMEOUT] = str(read_timeout or '')
+
+    @staticmethod
+    def __parse_proxies(proxies):
+        if not proxies or proxies == 'None':
+            return None
+        try:
+            return ast.literal_eval(proxies)
+        except (ValueError, SyntaxError):
+            logger.warning("Invalid proxies: %s" % proxies)
+            return None
+
+    @classmethod
+    def __build_session(cls):
+        """
+        保持连接的会话，按连接池大小复用连接
+        """
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=cls.POOL_SIZE)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.verify = False
+        return session
+
+    def _get_session(self):
+        """
+        请求使用的会话及代理：未指定会话时所有实例共用一个线程安全的连接池会话，代理或域名变化时才重建
+        """
+        proxies = self.proxies
+        if self._session is not None:
+            return self._session, self.__parse_proxies(proxies)
+        key = (proxies, self.domain)
+        shared = TMDb._shared_session
+        if shared and shared[0] == key:
+            return shared[1], shared[2]
+        with TMDb._shared_session_lock:
+            shared = TMDb._shared_session
+            if not shared or shared[0] != key:
+                # 旧会话可能仍有请求在使用，不主动关闭
+                shared = TMDb._shared_session = (key, self.__build_session(), self.__parse_proxies(proxies))
+            return shared[1], shared[2]
+
     @api_key.setter
     def api_key(self, api_key):
         os.environ[self.TMDB_API_KEY] = str(api_key)
 
     @property
     def language(self):
-        return os.environ.get(self.TMDB_LANGUAGE)
+        """
+        当前线程请求使用的语言，没有设置时使用默认语言
+        """
+        return getattr(self._local, "language", None) or os.environ.get(self.TMDB_LANGUAGE)
 
     @language.setter
     def language(self, language):
+        self._local.language = language
+
+    @property
+    def default_language(self):
+        return os.environ.get(self.TMDB_LANGUAGE)
+
+    @default_language.setter
+    def default_language(self, language):
         os.environ[self.TMDB_LANGUAGE] = language
 
     @property
@@ -136,13 +223,42 @@ class TMDb(object):
         else:
             return [AsObj(**res) for res in result[key]]
 
-    @staticmethod
-    @lru_cache(maxsize=REQUEST_CACHE_MAXSIZE)
-    def cached_request(method, url, data, proxies):
-        return requests.request(method, url, data=data, proxies=eval(proxies), verify=False, timeout=10)
+    @classmethod
+    def set_http_cache(cls, path, ttls=None, max_size=None):
+        """
+        启用持久化响应缓存，缓存文件变化时重新打开
+        """
+        if cls._http_cache and cls._http_cache.path == path:
+            return cls._http_cache
+        if cls._http_cache:
+            cls._http_cache.close()
+        cls._http_cache = TMDbCache(path, ttls=ttls, max_size=max_size) if path else None
+        return cls._http_cache
+
+    @classmethod
+    def get_http_cache_stats(cls):
+        return cls._http_cache.get_stats() if cls._http_cache else {}
 
     def cache_clear(self):
-        return self.cached_request.cache_clear()
+        if self._http_cache:
+            self._http_cache.clear()
+
+    @staticmethod
+    def _get_retry_after(headers):
+        """
+        429响应需等待的秒数，Retry-After为秒数或HTTP日期
+        """
+        retry_after = headers.get("Retry-After")
+        if not retry_after:
+            return 1
+        try:
+            return max(float(retry_after), 0)
+        except ValueError:
+            pass
+        try:
+            return max(parsedate_to_datetime(retry_after).timestamp() - time.time(), 0)
+        except (TypeError, ValueError):
+            return 1
 
     def _call(
             self, action, append_to_response, call_cached=True, method="GET", data=None
@@ -158,46 +274,69 @@ class TMDb(object):
             self.language,
         )
 
-        if self.cache and self.obj_cached and call_cached and method != "POST":
-            req = self.cached_request(method, url, data, self.proxies)
-        else:
-            req = self._session.request(method, url, data=data, proxies=eval(self.proxies), timeout=10, verify=False)
-
-        headers = req.headers
-
-        if "X-RateLimit-Remaining" in headers:
-            self._remaining = int(headers["X-RateLimit-Remaining"])
-
-        if "X-RateLimit-Reset" in headers:
-            self._reset = int(headers["X-RateLimit-Reset"])
-
-        if self._remaining < 1:
-            current_time = int(time.time())
-            sleep_time = self._reset - current_time
-
-            if self.wait_on_rate_limit:
-                logger.warning("Rate limit reached. Sleeping for: %d" % sleep_time)
-                time.sleep(abs(sleep_time))
-                self._call(action, append_to_response, call_cached, method, data)
-            else:
+        http_cache = self._http_cache \
+            if self.cache and self.obj_cached and call_cached and method != "POST" else None
+        cache_key = endpoint = None
+        if http_cache:
+            cache_key = http_cache.get_key(method, url, data)
+            endpoint = http_cache.get_endpoint(action)
+            json = http_cache.get(cache_key, endpoint)
+            if json is not None:
+                return self._handle_json(json)
+
+        session, proxies = self._get_session()
+        retries = 0
+        while True:
+            self.limiter.acquire()
+            req = session.request(method, url, data=data, proxies=proxies, timeout=self.timeout, verify=False)
+
+            headers = req.headers
+
+            if "X-RateLimit-Remaining" in headers:
+                self._remaining = int(headers["X-RateLimit-Remaining"])
+
+            if "X-RateLimit-Reset" in headers:
+                self._reset = int(headers["X-RateLimit-Reset"])
+
+            if req.status_code != 429:
+                if "X-RateLimit-Remaining" in headers and self._remaining < 1 and self._reset:
+                    # 剩余请求数为0，后续请求等待到重置时间
+                    self.limiter.on_rate_limited(self._reset - time.time())
+                else:
+                    self.limiter.on_success()
+                break
+
+            retry_after = self._get_retry_after(headers)
+            self.limiter.on_rate_limited(retry_after)
+            if not self.wait_on_rate_limit or retries >= self.MAX_RETRIES:
                 raise TMDbException(
-                    "Rate limit reached. Try again in %d seconds." % sleep_time
+                    "Rate limit reached. Try again in %d seconds." % retry_after
                 )
+            retries += 1
+            logger.warning("Rate limit reached. Retry after: %.1f" % retry_after)
 
         json = req.json()
 
+        # 只缓存成功的响应
+        if http_cache and req.status_code == 200 and "errors" not in json \
+                and json.get("success") is not False:
+            http_cache.set(cache_key, endpoint, json)
+
+        return self._handle_json(json)
+
+    def _handle_json(self, json):
         if "page" in json:
-            os.environ["page"] = str(json["page"])
+            self._local.page = str(json["page"])
 
         if "total_results" in json:
-            os.environ["total_results"] = str(json["total_results"])
+            self._local.total_results = str(json["total_results"])
 
         if "total_pages" in json:
-            os.environ["total_pages"] = str(json["total_pages"])
+            self._local.total_pages = str(json["total_pages"])
 
         if self.debug:
             logger.info(json)
-            logger.info(self.cached_request.cache_info())
+            logger.info(self.get_http_cache_stats())
 
         if "errors" in json:
             raise TMDbException(json["errors"])
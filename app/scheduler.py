@@ -5,13 +5,12 @@ from apscheduler.executors.pool import ThreadPoolExecutor
 from apscheduler.schedulers.background import BackgroundScheduler
 
 import log
-from app.helper import MetaHelper
+from app.helper import MetaHelper, SyncIndexHelper
 from app.mediaserver import MediaServer
-from app.sync import Sync
 from app.utils import ExceptionUtils
 from app.utils.commons import singleton
-from config import METAINFO_SAVE_INTERVAL, \
-    SYNC_TRANSFER_INTERVAL, META_DELETE_UNKNOWN_INTERVAL, REFRESH_WALLPAPER_INTERVAL, Config
+from config import METAINFO_SAVE_INTERVAL, SYNC_INDEX_SAVE_INTERVAL, \
+    META_DELETE_UNKNOWN_INTERVAL, REFRESH_WALLPAPER_INTERVAL, Config
 from web.backend.wallpaper import get_login_wallpaper
 
 
@@ -56,8 +55,8 @@ class Scheduler:
         # 元数据定时保存
         self.SCHEDULER.add_job(MetaHelper().save_meta_data, 'interval', seconds=METAINFO_SAVE_INTERVAL)
 
-        # 定时把队列中的监控文件转移走
-        self.SCHEDULER.add_job(Sync().transfer_mon_files, 'interval', seconds=SYNC_TRANSFER_INTERVAL)
+        # 监控已处理文件索引定时保存
+        self.SCHEDULER.add_job(SyncIndexHelper().save_index, 'interval', seconds=SYNC_INDEX_SAVE_INTERVAL)
 
         # 定时清除未识别的缓存
         self.SCHEDULER.add_job(MetaHelper().delete_unknown_meta, 'interval', hours=META_DELETE_UNKNOWN_INTERVAL)
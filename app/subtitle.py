@@ -145,7 +145,7 @@ class Subtitle:
                     # 解压文件
                     shutil.unpack_archive(zip_file, zip_path, format='zip')
                     # 遍历转移文件
-                    for sub_file in PathUtils.get_dir_files(in_path=zip_path, exts=RMT_SUBEXT):
+                    for sub_file in PathUtils.iter_dir_files(in_path=zip_path, exts=RMT_SUBEXT):
                         self.__transfer_subtitle(sub_file, Media_File)
                     # 删除临时文件
                     try:
@@ -313,7 +313,7 @@ class Subtitle:
                         # 解压文件
                         shutil.unpack_archive(zip_file, zip_path, format='zip')
                         # 遍历转移文件
-                        for sub_file in PathUtils.get_dir_files(in_path=zip_path, exts=RMT_SUBEXT):
+                        for sub_file in PathUtils.iter_dir_files(in_path=zip_path, exts=RMT_SUBEXT):
                             target_sub_file = os.path.join(download_dir,
                                                            os.path.splitext(os.path.basename(sub_file))[0])
                             log.info(f"【Subtitle】转移字幕 {sub_file} 到 {target_sub_file}")
@@ -1,18 +1,21 @@
 import os
 import threading
+import time
 import traceback
 
 from watchdog.events import FileSystemEventHandler
+from watchdog.observers.api import ObservedWatch
 from watchdog.observers import Observer
-from watchdog.observers.polling import PollingObserver
 
 import log
 from app.conf import ModuleConf
-from app.helper import DbHelper
-from config import RMT_MEDIAEXT, Config
+from app.helper import DbHelper, SyncIndexHelper, SyncManifestHelper, SyncStatsHelper, DeviceThreadPool, \
+    ThreadHelper, IoThrottleHelper
+from config import RMT_MEDIAEXT, SYNC_STABLE_WINDOW, SYNC_TRANSFER_THREADS, SYNC_INOTIFY_BUDGET_RATIO, \
+    SYNC_POLLING_INTERVAL, SYNC_POLLING_MAX_WATCHES, SYNC_POLLING_BUDGET, SYNC_POLLING_COLD_INTERVAL, Config
 from app.filetransfer import FileTransfer
 from app.utils.commons import singleton
-from app.utils import PathUtils, ExceptionUtils
+from app.utils import PathUtils, ExceptionUtils, FileDebouncer, PathTrie, MtimePollingObserver, SystemUtils
 from app.utils.types import SyncType, OsType
 
 lock = threading.Lock()
@@ -34,31 +37,378 @@ class FileMonitorHandler(FileSystemEventHandler):
     def on_moved(self, event):
         self.sync.file_change_handler(event, "移动", event.dest_path)
 
-    """
     def on_modified(self, event):
         self.sync.file_change_handler(event, "修改", event.src_path)
+
+
+class SyncObserver(object):
     """
+    目录监控观察者，所有监控目录共用一个观察者；
+    inotify watch数超出预算时，将最冷、最深的子目录转为低频轮询；
+    Windows及网络共享目录按目录修改时间轮询
+    """
+    # inotify watch系统上限
+    _INOTIFY_LIMIT_FILE = "/proc/sys/fs/inotify/max_user_watches"
+    # Windows及网络共享目录的轮询间隔
+    _SHARE_POLLING_INTERVAL = 10
+
+    def __init__(self, sync, polling=False, stat_budget=SYNC_POLLING_BUDGET):
+        """
+        :param sync: Sync实例，用于生成事件处理器
+        :param polling: 是否全部使用轮询（Windows）
+        :param stat_budget: 轮询时每个目录每秒最多stat次数
+        """
+        self.sync = sync
+        self._polling = polling
+        self._stat_budget = stat_budget
+        self._observer = None
+        # 轮询间隔 -> 轮询观察者
+        self._poll_observers = {}
+        self._lock = threading.Lock()
+        # 监控目录 -> 事件处理器
+        self._handlers = {}
+        # 只监控本级的目录（下级有轮询目录） -> 监控目录
+        self._split_dirs = {}
+        # 原生监控的目录及是否递归
+        self._native_paths = {}
+        # 轮询的目录
+        self._polling_paths = set()
+        self._limit = 0
+        self._budget = 0
+        self._planned = 0
+
+    @staticmethod
+    def is_inotify():
+        """
+        原生监控是否为inotify
+        """
+        return Observer.__name__ == "InotifyObserver"
+
+    @classmethod
+    def get_inotify_limit(cls):
+        """
+        系统inotify watch上限，非Linux返回0
+        """
+        try:
+            with open(cls._INOTIFY_LIMIT_FILE) as f:
+                return int(f.read().strip())
+        except (OSError, ValueError):
+            return 0
+
+    @staticmethod
+    def get_inotify_used():
+        """
+        当前进程已占用的inotify watch数
+        """
+        used = 0
+        try:
+            for fd in os.listdir("/proc/self/fd"):
+                try:
+                    if os.readlink("/proc/self/fd/%s" % fd) != "anon_inode:inotify":
+                        continue
+                    with open("/proc/self/fdinfo/%s" % fd) as f:
+                        used += sum(1 for line in f if line.startswith("inotify"))
+                except OSError:
+                    continue
+        except OSError:
+            pass
+        return used
+
+    @staticmethod
+    def __scan_tree(root, nodes):
+        """
+        统计目录树，每个目录占用一个inotify watch，与watchdog一致不进入链接的目录
+        :param nodes: 目录 -> {'count': 子树目录数, 'mtime': 子树最新修改时间, 'depth': 深度,
+                      'parent': 上级目录, 'children': 下级目录, 'covered': 子树中已轮询的目录数}
+        """
+        try:
+            nodes[root] = {'count': 1, 'mtime': os.stat(root).st_mtime, 'depth': 0,
+                           'parent': None, 'children': [], 'covered': 0}
+        except OSError:
+            return
+        order = [root]
+        stack = [root]
+        while stack:
+            cur_dir = stack.pop()
+            node = nodes[cur_dir]
+            try:
+                with os.scandir(cur_dir) as entries:
+                    for entry in entries:
+                        try:
+                            if not entry.is_dir(follow_symlinks=False) or entry.path in nodes:
+                                continue
+                            nodes[entry.path] = {'count': 1,
+                                                 'mtime': entry.stat(follow_symlinks=False).st_mtime,
+                                                 'depth': node['depth'] + 1,
+                                                 'parent': cur_dir,
+                                                 'children': [],
+                                                 'covered': 0}
+                        except OSError:
+                            continue
+                        node['children'].append(entry.path)
+                        order.append(entry.path)
+                        stack.append(entry.path)
+            except OSError:
+                continue
+        # 由深到浅汇总子树目录数及最新修改时间
+        for path in reversed(order):
+            node = nodes[path]
+            parent = nodes.get(node['parent']) if node['parent'] else None
+            if parent:
+                parent['count'] += node['count']
+                parent['mtime'] = max(parent['mtime'], node['mtime'])
+
+    @staticmethod
+    def __plan_polling(nodes, roots, excess):
+        """
+        选择转为轮询的子目录，优先最冷（子树最近无变化）、最深的目录，
+        单个目录过小时轮询线程数会过多，因此只选择足够大的子树
+        :return: 轮询目录集合
+        """
+        polled = set()
+        if excess <= 0:
+            return polled
+        min_count = max(1, -(-excess // SYNC_POLLING_MAX_WATCHES))
+
+        def __add(_path):
+            _node = nodes[_path]
+            gain = _node['count'] - _node['covered']
+            if gain <= 0:
+                return 0
+            # 下级已轮询的目录合并到本目录
+            prefix = _path + os.sep
+            for _sub in [p for p in polled if p.startswith(prefix)]:
+                polled.remove(_sub)
+            polled.add(_path)
+            _node['covered'] = _node['count']
+            parent = _node['parent']
+            while parent:
+                nodes[parent]['covered'] += gain
+                parent = nodes[parent]['parent']
+            return gain
+
+        def __polled_parent(_path):
+            parent = nodes[_path]['parent']
+            while parent:
+                if parent in polled:
+                    return True
+                parent = nodes[parent]['parent']
+            return False
+
+        candidates = sorted([path for path, node in nodes.items() if node['count'] >= min_count],
+                            key=lambda p: (nodes[p]['mtime'], -nodes[p]['depth']))
+        for path in candidates:
+            if excess <= 0:
+                break
+            if __polled_parent(path):
+                continue
+            excess -= __add(path)
+        # 仍然超出时，整个监控目录转为轮询
+        for root in sorted(roots, key=lambda p: nodes[p]['mtime']):
+            if excess <= 0:
+                break
+            excess -= __add(root)
+        return polled
+
+    def start(self, monpaths):
+        """
+        启动监控
+        :param monpaths: 监控目录列表
+        """
+        monpaths = [monpath for monpath in monpaths if monpath and os.path.exists(monpath)]
+        if not monpaths:
+            return
+        self._handlers = {monpath: FileMonitorHandler(monpath, self.sync) for monpath in monpaths}
+        # 考虑到windows的docker需要直接指定才能生效(修改配置文件为windows)，网络共享目录原生监控无法感知远端变化
+        share_paths = monpaths if self._polling else [m for m in monpaths if SystemUtils.is_network_path(m)]
+        for monpath in share_paths:
+            self.__schedule_polling(monpath, monpath, interval=self._SHARE_POLLING_INTERVAL)
+            log.info("%s 的监控服务启动（轮询）" % monpath)
+        monpaths = [monpath for monpath in monpaths if monpath not in share_paths]
+        if not monpaths:
+            return
+        # 内部处理系统操作类型选择最优解
+        self._observer = Observer(timeout=10)
+        self._observer.daemon = True
+        self._observer.start()
+        # 规划inotify watch
+        polled = set()
+        nodes = {}
+        if self.is_inotify():
+            self._limit = self.get_inotify_limit()
+            if self._limit:
+                self._budget = max(int(self._limit * SYNC_INOTIFY_BUDGET_RATIO) - self.get_inotify_used(), 0)
+                for monpath in monpaths:
+                    self.__scan_tree(monpath, nodes)
+                total = sum(nodes[monpath]['count'] for monpath in monpaths if monpath in nodes)
+                polled = self.__plan_polling(nodes, [m for m in monpaths if m in nodes], total - self._budget)
+                self._planned = total - sum(nodes[path]['count'] for path in polled)
+                log.info("【Sync】监控目录共 %s 个目录，inotify watch 预算：%s，系统上限：%s" % (
+                    total, self._budget, self._limit))
+                if polled:
+                    log.warn("【Sync】inotify watch 预算不足，以下目录转为每 %s 秒轮询：%s" % (
+                        SYNC_POLLING_INTERVAL, "，".join(sorted(polled))))
+        for monpath in monpaths:
+            if polled and monpath in nodes:
+                stack = [monpath]
+                while stack:
+                    path = stack.pop()
+                    node = nodes[path]
+                    if path in polled:
+                        self.__schedule_polling(monpath, path)
+                    elif not node['covered']:
+                        self.__schedule_native(monpath, path, recursive=True)
+                    elif self.__schedule_native(monpath, path, recursive=False):
+                        # 下级有轮询目录，本级只监控当前目录，下级目录分别监控
+                        self._split_dirs[os.path.normpath(path)] = monpath
+                        stack.extend(node['children'])
+            else:
+                self.__schedule_native(monpath, monpath, recursive=True)
+            log.info("%s 的监控服务启动" % monpath)
+
+    def __schedule_native(self, monpath, path, recursive=True):
+        """
+        原生监控目录，watch耗尽时整个目录（含下级）转为轮询
+        :return: 是否原生监控成功
+        """
+        handler = self._handlers.get(monpath)
+        try:
+            self._observer.schedule(handler, path=path, recursive=recursive)
+            with self._lock:
+                self._native_paths[path] = recursive
+            return True
+        except OSError as e:
+            # 启动失败时watchdog已登记处理器，需移除
+            self._observer.remove_handler_for_watch(handler, ObservedWatch(path, recursive))
+            log.warn("【Sync】%s 原生监控失败：%s，转为轮询" % (path, str(e)))
+            self.__schedule_polling(monpath, path)
+            return False
+
+    def __schedule_polling(self, monpath, path, interval=SYNC_POLLING_INTERVAL):
+        """
+        轮询监控目录
+        """
+        poll_observer = self._poll_observers.get(interval)
+        if not poll_observer:
+            poll_observer = MtimePollingObserver(timeout=interval,
+                                                 stat_budget=self._stat_budget,
+                                                 cold_interval=max(SYNC_POLLING_COLD_INTERVAL, interval))
+            poll_observer.daemon = True
+            poll_observer.start()
+            self._poll_observers[interval] = poll_observer
+        try:
+            poll_observer.schedule(self._handlers.get(monpath), path=path, recursive=True)
+            with self._lock:
+                self._polling_paths.add(path)
+        except Exception as e:
+            ExceptionUtils.exception_traceback(e)
+            log.error("%s 启动目录监控失败：%s" % (path, str(e)))
+
+    def on_dir_created(self, path):
+        """
+        只监控本级的目录下新建了子目录，需单独监控该子目录，并登记其中已有的文件
+        """
+        monpath = self._split_dirs.get(os.path.normpath(os.path.dirname(path)))
+        if not monpath or not os.path.isdir(path):
+            return False
+        with self._lock:
+            if path in self._native_paths or path in self._polling_paths:
+                return False
+        self.__schedule_native(monpath, path, recursive=True)
+        return True
+
+    def get_state(self):
+        """
+        监控状态：inotify watch上限、预算、规划数、实际占用数，原生及轮询的目录
+        """
+        with self._lock:
+            return {
+                "limit": self._limit,
+                "budget": self._budget,
+                "planned": self._planned,
+                "used": self.get_inotify_used() if self.is_inotify() else 0,
+                "native": len(self._native_paths),
+                "polling": sorted(self._polling_paths)
+            }
+
+    def stop(self):
+        """
+        停止监控
+        """
+        for observer in [self._observer] + list(self._poll_observers.values()):
+            if not observer:
+                continue
+            try:
+                observer.stop()
+            except Exception as e:
+                ExceptionUtils.exception_traceback(e)
+        self._observer = None
+        self._poll_observers = {}
+        self._handlers = {}
+        self._split_dirs = {}
+        self._native_paths = {}
+        self._polling_paths = set()
 
 
 @singleton
 class Sync(object):
     filetransfer = None
     dbhelper = None
+    syncindex = None
+    syncmanifest = None
+    syncstats = None
 
     sync_dir_config = {}
-    _observer = []
+    _observer = None
     _sync_paths = []
     _sync_sys = OsType.LINUX
-    _synced_files = []
     _need_sync_paths = {}
+    _debouncer = None
+    _path_router = None
+    _transfer_pool = None
+    _polling_budget = SYNC_POLLING_BUDGET
+
+    # 路径路由标签：监控目录（标签为(monitor, 监控目录)）、不处理的目录
+    _ROUTE_MONITOR = "monitor"
+    _ROUTE_IGNORE = "ignore"
+    # 同步历史批量写入条数
+    _HISTORY_BATCH_SIZE = 1000
+    # 对账快照批量更新条数
+    _MANIFEST_BATCH_SIZE = 100
 
     def __init__(self):
+        # 对账发现变化、尚未处理完成的文件：文件路径 -> (监控目录, 相对路径, 快照签名)
+        self._manifest_pending = {}
+        self._manifest_pending_trie = PathTrie()
+        # 监控目录 -> 待处理的文件数
+        self._manifest_pending_count = {}
+        # 已处理完成、待写入快照的文件：监控目录 -> {相对路径: 快照签名}
+        self._manifest_done = {}
         self.init_config()
 
     def init_config(self):
         self.dbhelper = DbHelper()
         self.filetransfer = FileTransfer()
+        self.syncindex = SyncIndexHelper()
+        self.syncmanifest = SyncManifestHelper()
+        self.syncstats = SyncStatsHelper()
         sync = Config().get_config('sync')
+        # 文件稳定窗口
+        stable_window = sync.get('stable_window') if sync else None
+        if not str(stable_window).isdigit():
+            stable_window = SYNC_STABLE_WINDOW
+        if not self._debouncer:
+            self._debouncer = FileDebouncer(callback=self.__stable_file_handler)
+        self._debouncer.set_window(int(stable_window))
+        # 转移线程池，线程数调整需重启生效
+        if not self._transfer_pool:
+            transfer_threads = sync.get('transfer_threads') if sync else None
+            if not str(transfer_threads).isdigit() or not int(transfer_threads):
+                transfer_threads = SYNC_TRANSFER_THREADS
+            self._transfer_pool = DeviceThreadPool(max_workers=int(transfer_threads))
+        # 轮询监控每秒stat次数预算
+        polling_budget = sync.get('polling_budget') if sync else None
+        self._polling_budget = int(polling_budget) if str(polling_budget).isdigit() else SYNC_POLLING_BUDGET
         sync_paths = self.dbhelper.get_config_sync_paths()
         if sync and sync_paths:
             if sync.get('nas_sys') == "windows":
@@ -71,6 +421,7 @@ class Sync(object):
         初始化监控文件配置
         """
         self.sync_dir_config = {}
+        path_router = PathTrie()
         if self._sync_paths:
             for sync_item in self._sync_paths:
                 if not sync_item:
@@ -108,8 +459,15 @@ class Sync(object):
                 if os.path.exists(monpath):
                     self.sync_dir_config[monpath] = {'target': target_path, 'unknown': unknown_path,
                                                      'onlylink': only_link, 'syncmod': path_syncmode}
+                    path_router.add(monpath, (self._ROUTE_MONITOR, monpath))
+                    path_router.add(target_path, self._ROUTE_IGNORE)
+                    path_router.add(unknown_path, self._ROUTE_IGNORE)
                 else:
                     log.error("【Sync】%s 目录不存在！" % monpath)
+        # 媒体库目录及子目录不处理
+        for library_path in self.filetransfer.get_target_dir_paths():
+            path_router.add(library_path, self._ROUTE_IGNORE)
+        self._path_router = path_router
 
     def get_sync_dirs(self):
         """
@@ -119,240 +477,416 @@ class Sync(object):
             return []
         return [os.path.normpath(key) for key in self.sync_dir_config.keys()]
 
+    def get_monitor_dir(self, path):
+        """
+        按路径前缀树查找路径所在的监控目录，不在监控目录下或在目的目录、未识别目录、媒体库目录下时返回None
+        """
+        if not self._path_router:
+            return None
+        monitor_dir = None
+        for _, tags in self._path_router.lookup(path):
+            if self._ROUTE_IGNORE in tags:
+                return None
+            for tag in tags:
+                if isinstance(tag, tuple) and tag[0] == self._ROUTE_MONITOR:
+                    monitor_dir = tag[1]
+        return monitor_dir
+
     def file_change_handler(self, event, text, event_path):
         """
-        处理文件变化
+        处理文件变化，登记到防抖队列，文件稳定后再处理
         :param event: 事件
         :param text: 事件描述
         :param event_path: 事件文件路径
         """
         if not event.is_directory:
-            # 文件发生变化
-            try:
-                if not os.path.exists(event_path):
-                    return
-                log.debug("【Sync】文件%s：%s" % (text, event_path))
-                # 判断是否处理过了
-                need_handler_flag = False
-                try:
-                    lock.acquire()
-                    if event_path not in self._synced_files:
-                        self._synced_files.append(event_path)
-                        need_handler_flag = True
-                finally:
-                    lock.release()
-                if not need_handler_flag:
-                    log.debug("【Sync】文件已处理过：%s" % event_path)
-                    return
-                # 不是监控目录下的文件不处理
-                is_monitor_file = False
-                for tpath in self.sync_dir_config.keys():
-                    if PathUtils.is_path_in_path(tpath, event_path):
-                        is_monitor_file = True
-                        break
-                if not is_monitor_file:
-                    return
-                # 目的目录的子文件不处理
-                for tpath in self.sync_dir_config.values():
-                    if not tpath:
-                        continue
-                    if PathUtils.is_path_in_path(tpath.get('target'), event_path):
-                        return
-                    if PathUtils.is_path_in_path(tpath.get('unknown'), event_path):
-                        return
-                # 媒体库目录及子目录不处理
-                if self.filetransfer.is_target_dir_path(event_path):
+            monitor_dir = self.get_monitor_dir(event_path)
+            self.syncstats.event(monitor_dir, event_path)
+            if not self._debouncer.touch(event_path, text):
+                self.syncstats.dedup(monitor_dir)
+        elif self._observer and self._observer.on_dir_created(event_path):
+            # 新目录单独监控前已写入的文件
+            for file in PathUtils.iter_dir_files(event_path):
+                self._debouncer.touch(file, text)
+
+    def get_observer_state(self):
+        """
+        目录监控状态
+        """
+        return self._observer.get_state() if self._observer else {}
+
+    def get_sync_stats(self):
+        """
+        目录同步统计：各监控目录的事件数、去重数、队列深度、事件到转移完成耗时，各转移方式的转移耗时
+        """
+        stats = self.syncstats.get_stats(roots=list(self.sync_dir_config.keys()))
+        roots = stats.get("roots")
+        for root_stat in roots.values():
+            root_stat.update({"pending": 0, "queued": 0})
+        # 等待文件稳定的文件数
+        for path in self._debouncer.get_pending_paths():
+            monitor_dir = self.get_monitor_dir(path)
+            if monitor_dir in roots:
+                roots[monitor_dir]["pending"] += 1
+        # 等待目录下文件均稳定后批量转移的文件数
+        with lock:
+            need_sync_paths = [(path, len(item.get('files') or [])) for path, item in self._need_sync_paths.items()]
+        for path, count in need_sync_paths:
+            monitor_dir = self.get_monitor_dir(path)
+            if monitor_dir in roots:
+                roots[monitor_dir]["queued"] += count
+        stats.update({
+            "transfer_queue": self._transfer_pool.get_queue_size() if self._transfer_pool else 0,
+            "transfer_locks": self.filetransfer.get_transfer_lock_stats(),
+            "throughput": IoThrottleHelper().get_throughput(),
+            "observer": self.get_observer_state()
+        })
+        return stats
+
+    def __stable_file_handler(self, event_path, text):
+        """
+        处理大小及修改时间已稳定的文件
+        :param event_path: 事件文件路径
+        :param text: 事件描述
+        """
+        try:
+            if not os.path.exists(event_path):
+                self.__manifest_handled([event_path])
+                return
+            log.debug("【Sync】文件%s：%s" % (text, event_path))
+            # 找到是哪个监控目录下的，不是监控目录下的文件，以及目的目录、未识别目录、媒体库目录下的文件不处理
+            monitor_dir = self.get_monitor_dir(event_path)
+            if not monitor_dir:
+                return
+            # 回收站及隐藏的文件不处理
+            if PathUtils.is_invalid_path(event_path):
+                self.syncstats.discard(event_path)
+                self.__manifest_handled([event_path])
+                return
+            # 判断是否处理过了
+            if self.syncindex.is_handled(event_path):
+                log.debug("【Sync】文件已处理过：%s" % event_path)
+                self.syncstats.dedup(monitor_dir, event_path)
+                self.__manifest_handled([event_path])
+                return
+            # 上级目录
+            from_dir = os.path.dirname(event_path)
+            # 是否监控根目录下的文件
+            is_root_path = os.path.normpath(monitor_dir) == os.path.normpath(from_dir)
+
+            # 查找目的目录
+            target_dirs = self.sync_dir_config.get(monitor_dir)
+            target_path = target_dirs.get('target')
+            unknown_path = target_dirs.get('unknown')
+            onlylink = target_dirs.get('onlylink')
+            sync_mode = target_dirs.get('syncmod')
+
+            # 只做硬链接，不做识别重命名
+            if onlylink:
+                if self.dbhelper.is_sync_in_history(event_path, target_path):
+                    self.syncstats.dedup(monitor_dir, event_path)
+                    self.__manifest_handled([event_path])
                     return
-                # 回收站及隐藏的文件不处理
-                if PathUtils.is_invalid_path(event_path):
+                self._transfer_pool.submit(self.__link_sync_file,
+                                           monitor_dir, event_path, target_path, sync_mode,
+                                           paths=[event_path, target_path])
+            # 识别转移
+            else:
+                # 不是媒体文件不处理
+                name = os.path.basename(event_path)
+                if not name:
                     return
-                # 上级目录
-                from_dir = os.path.dirname(event_path)
-                # 找到是哪个监控目录下的
-                monitor_dir = event_path
-                is_root_path = False
-                for m_path in self.sync_dir_config.keys():
-                    if PathUtils.is_path_in_path(m_path, event_path):
-                        monitor_dir = m_path
-                    if os.path.normpath(m_path) == os.path.normpath(from_dir):
-                        is_root_path = True
-
-                # 查找目的目录
-                target_dirs = self.sync_dir_config.get(monitor_dir)
-                target_path = target_dirs.get('target')
-                unknown_path = target_dirs.get('unknown')
-                onlylink = target_dirs.get('onlylink')
-                sync_mode = target_dirs.get('syncmod')
-
-                # 只做硬链接，不做识别重命名
-                if onlylink:
-                    if self.dbhelper.is_sync_in_history(event_path, target_path):
+                if name.lower() != "index.bdmv":
+                    ext = os.path.splitext(name)[-1]
+                    if ext.lower() not in RMT_MEDIAEXT:
+                        self.syncstats.discard(event_path)
+                        self.__manifest_handled([event_path])
                         return
-                    log.info("【Sync】开始同步 %s" % event_path)
-                    ret, msg = self.filetransfer.link_sync_file(src_path=monitor_dir,
-                                                                in_file=event_path,
-                                                                target_dir=target_path,
-                                                                sync_transfer_mode=sync_mode)
-                    if ret != 0:
-                        log.warn("【Sync】%s 同步失败，错误码：%s" % (event_path, ret))
-                    elif not msg:
-                        self.dbhelper.insert_sync_history(event_path, monitor_dir, target_path)
-                        log.info("【Sync】%s 同步完成" % event_path)
-                # 识别转移
+                # 监控根目录下的文件发生变化时直接发走
+                if is_root_path:
+                    self._transfer_pool.submit(self.__transfer_mon_path,
+                                               in_path=event_path,
+                                               target_info=target_dirs,
+                                               paths=[event_path, target_path])
                 else:
-                    # 不是媒体文件不处理
-                    name = os.path.basename(event_path)
-                    if not name:
-                        return
-                    if name.lower() != "index.bdmv":
-                        ext = os.path.splitext(name)[-1]
-                        if ext.lower() not in RMT_MEDIAEXT:
-                            return
-                    # 监控根目录下的文件发生变化时直接发走
-                    if is_root_path:
-                        ret, ret_msg = self.filetransfer.transfer_media(in_from=SyncType.MON,
-                                                                        in_path=event_path,
-                                                                        target_dir=target_path,
-                                                                        unknown_dir=unknown_path,
-                                                                        rmt_mode=sync_mode)
-                        if not ret:
-                            log.warn("【Sync】%s 转移失败：%s" % (event_path, ret_msg))
-                    else:
-                        try:
-                            lock.acquire()
-                            if self._need_sync_paths.get(from_dir):
-                                files = self._need_sync_paths[from_dir].get('files')
-                                if not files:
-                                    files = [event_path]
-                                else:
-                                    if event_path not in files:
-                                        files.append(event_path)
-                                    else:
-                                        return
-                                self._need_sync_paths[from_dir].update({'files': files})
+                    try:
+                        lock.acquire()
+                        if self._need_sync_paths.get(from_dir):
+                            files = self._need_sync_paths[from_dir].get('files')
+                            if not files:
+                                files = [event_path]
                             else:
-                                self._need_sync_paths[from_dir] = {'target': target_path,
-                                                                   'unknown': unknown_path,
-                                                                   'syncmod': sync_mode,
-                                                                   'files': [event_path]}
-                        finally:
-                            lock.release()
-            except Exception as e:
-                ExceptionUtils.exception_traceback(e)
-                log.error("【Sync】发生错误：%s - %s" % (str(e), traceback.format_exc()))
+                                if event_path not in files:
+                                    files.append(event_path)
+                                else:
+                                    self.syncstats.dedup(monitor_dir)
+                                    return
+                            self._need_sync_paths[from_dir].update({'files': files})
+                        else:
+                            self._need_sync_paths[from_dir] = {'target': target_path,
+                                                               'unknown': unknown_path,
+                                                               'syncmod': sync_mode,
+                                                               'files': [event_path]}
+                    finally:
+                        lock.release()
+                    # 目录下的文件均已稳定，立即转移
+                    if not self._debouncer.has_pending(from_dir):
+                        self.transfer_mon_files()
+        except Exception as e:
+            ExceptionUtils.exception_traceback(e)
+            log.error("【Sync】发生错误：%s - %s" % (str(e), traceback.format_exc()))
 
     def transfer_mon_files(self):
         """
-        批量转移文件，由定时服务定期调用执行
+        批量转移文件，目录下的文件均稳定后调用执行，队列取出后按设备提交到转移线程池
         """
-        try:
-            lock.acquire()
-            finished_paths = []
+        start_time = time.time()
+        with lock:
+            sync_items = []
             for path in list(self._need_sync_paths):
-                if not PathUtils.is_invalid_path(path) and os.path.exists(path):
-                    log.info("【Sync】开始转移监控目录文件...")
-                    target_info = self._need_sync_paths.get(path)
-                    bluray_dir = PathUtils.get_bluray_dir(path)
-                    if not bluray_dir:
-                        src_path = path
-                        files = target_info.get('files')
-                    else:
-                        src_path = bluray_dir
-                        files = []
-                    if src_path not in finished_paths:
-                        finished_paths.append(src_path)
-                    else:
-                        continue
-                    target_path = target_info.get('target')
-                    unknown_path = target_info.get('unknown')
-                    sync_mode = target_info.get('syncmod')
-                    # 判断是否根目录
-                    is_root_path = False
-                    for m_path in self.sync_dir_config.keys():
-                        if os.path.normpath(m_path) == os.path.normpath(src_path):
-                            is_root_path = True
-                    ret, ret_msg = self.filetransfer.transfer_media(in_from=SyncType.MON,
-                                                                    in_path=src_path,
-                                                                    files=files,
-                                                                    target_dir=target_path,
-                                                                    unknown_dir=unknown_path,
-                                                                    rmt_mode=sync_mode,
-                                                                    root_path=is_root_path)
-                    if not ret:
-                        log.warn("【Sync】%s转移失败：%s" % (path, ret_msg))
-                self._need_sync_paths.pop(path)
+                # 目录下还有文件在写入的，等待稳定后再转移
+                if self._debouncer.has_pending(path):
+                    continue
+                sync_items.append((path, self._need_sync_paths.pop(path)))
+        finished_paths = []
+        for path, target_info in sync_items:
+            if PathUtils.is_invalid_path(path) or not os.path.exists(path):
+                continue
+            bluray_dir = PathUtils.get_bluray_dir(path)
+            if not bluray_dir:
+                src_path = path
+                files = target_info.get('files')
+            else:
+                src_path = bluray_dir
+                files = []
+            if src_path in finished_paths:
+                continue
+            finished_paths.append(src_path)
+            # 判断是否根目录
+            monitor_dir = self.get_monitor_dir(src_path)
+            is_root_path = True if monitor_dir \
+                and os.path.normpath(monitor_dir) == os.path.normpath(src_path) else False
+            self._transfer_pool.submit(self.__transfer_mon_path,
+                                       in_path=src_path,
+                                       target_info=target_info,
+                                       files=files,
+                                       root_path=is_root_path,
+                                       paths=[src_path, target_info.get('target')])
+        if sync_items:
+            self.syncstats.batch(time.time() - start_time)
+
+    def __transfer_mon_path(self, in_path, target_info, files=None, root_path=False):
+        """
+        识别转移监控目录下的文件或目录，在转移线程池中执行
+        """
+        start_time = time.time()
+        ret = False
+        try:
+            log.info("【Sync】开始转移监控目录文件：%s" % in_path)
+            ret, ret_msg = self.filetransfer.transfer_media(in_from=SyncType.MON,
+                                                            in_path=in_path,
+                                                            files=files,
+                                                            target_dir=target_info.get('target'),
+                                                            unknown_dir=target_info.get('unknown'),
+                                                            rmt_mode=target_info.get('syncmod'),
+                                                            root_path=root_path)
+            if not ret:
+                log.warn("【Sync】%s 转移失败：%s" % (in_path, ret_msg))
+        except Exception as e:
+            ExceptionUtils.exception_traceback(e)
+            log.error("【Sync】发生错误：%s - %s" % (str(e), traceback.format_exc()))
+        finally:
+            self.syncstats.transferred(root=self.get_monitor_dir(in_path),
+                                       paths=files or [in_path],
+                                       mode=target_info.get('syncmod'),
+                                       duration=time.time() - start_time,
+                                       success=ret)
+            if ret:
+                for path in files or [in_path]:
+                    self.syncindex.add(path)
+                self.__manifest_handled(files or [in_path])
+
+    def __link_sync_file(self, monitor_dir, event_path, target_path, sync_mode):
+        """
+        硬链接同步单个文件，在转移线程池中执行
+        """
+        start_time = time.time()
+        ret = -1
+        try:
+            log.info("【Sync】开始同步 %s" % event_path)
+            ret, msg = self.filetransfer.link_sync_file(src_path=monitor_dir,
+                                                        in_file=event_path,
+                                                        target_dir=target_path,
+                                                        sync_transfer_mode=sync_mode)
+            if ret != 0:
+                log.warn("【Sync】%s 同步失败，错误码：%s" % (event_path, ret))
+            elif not msg:
+                self.dbhelper.insert_sync_history(event_path, monitor_dir, target_path)
+                log.info("【Sync】%s 同步完成" % event_path)
+        except Exception as e:
+            ExceptionUtils.exception_traceback(e)
+            log.error("【Sync】发生错误：%s - %s" % (str(e), traceback.format_exc()))
         finally:
-            lock.release()
+            self.syncstats.transferred(root=monitor_dir,
+                                       paths=[event_path],
+                                       mode=sync_mode,
+                                       duration=time.time() - start_time,
+                                       success=ret == 0)
+            if ret == 0:
+                self.syncindex.add(event_path)
+                self.__manifest_handled([event_path])
 
     def run_service(self):
         """
         启动监控服务
         """
-        self._observer = []
-        for monpath in self.sync_dir_config.keys():
-            if monpath and os.path.exists(monpath):
-                try:
-                    if self._sync_sys == OsType.WINDOWS:
-                        # 考虑到windows的docker需要直接指定才能生效(修改配置文件为windows)
-                        observer = PollingObserver(timeout=10)
-                    else:
-                        # 内部处理系统操作类型选择最优解
-                        observer = Observer(timeout=10)
-                    self._observer.append(observer)
-                    observer.schedule(FileMonitorHandler(monpath, self), path=monpath, recursive=True)
-                    observer.setDaemon(True)
-                    observer.start()
-                    log.info("%s 的监控服务启动" % monpath)
-                except Exception as e:
-                    ExceptionUtils.exception_traceback(e)
-                    log.error("%s 启动目录监控失败：%s" % (monpath, str(e)))
+        self._debouncer.start()
+        self._observer = SyncObserver(self,
+                                      polling=self._sync_sys == OsType.WINDOWS,
+                                      stat_budget=self._polling_budget)
+        try:
+            self._observer.start(list(self.sync_dir_config.keys()))
+        except Exception as e:
+            ExceptionUtils.exception_traceback(e)
+            log.error("【Sync】启动目录监控失败：%s" % str(e))
+        # 对账监控停止期间发生变化的文件
+        if self.sync_dir_config:
+            ThreadHelper().start_thread(self.reconcile_sync_dirs, ())
 
     def stop_service(self):
         """
         关闭监控服务
         """
         if self._observer:
-            for observer in self._observer:
-                observer.stop()
-        self._observer = []
+            self._observer.stop()
+        self._observer = None
+        self._debouncer.stop()
+        # 保存已处理文件索引
+        self.syncindex.save_index()
 
     def transfer_all_sync(self):
         """
-        全量转移Sync目录下的文件，WEB界面点击目录同步时获发
+        全量转移Sync目录下的文件，WEB界面点击目录同步时触发，完成后刷新目录快照
         """
         for monpath, target_dirs in self.sync_dir_config.items():
             if not monpath:
                 continue
-            target_path = target_dirs.get('target')
-            unknown_path = target_dirs.get('unknown')
-            onlylink = target_dirs.get('onlylink')
-            sync_mode = target_dirs.get('syncmod')
-            # 只做硬链接，不做识别重命名
-            if onlylink:
-                for link_file in PathUtils.get_dir_files(monpath):
-                    if self.dbhelper.is_sync_in_history(link_file, target_path):
-                        continue
-                    log.info("【Sync】开始同步 %s" % link_file)
-                    ret, msg = self.filetransfer.link_sync_file(src_path=monpath,
-                                                                in_file=link_file,
+            try:
+                # 先扫描快照，转移期间新增的文件留给下次对账处理
+                manifest = self.syncmanifest.scan(monpath)
+                self.__transfer_sync_dir(monpath, target_dirs)
+                self.syncmanifest.save(monpath, manifest)
+            except Exception as e:
+                ExceptionUtils.exception_traceback(e)
+                log.error("【Sync】%s 全量同步出错：%s" % (monpath, str(e)))
+
+    def reconcile_sync_dirs(self):
+        """
+        按目录快照增量对账Sync目录，启动监控时触发：
+        新增或发生变化的文件进入防抖队列按监控事件处理，没有快照的目录全量转移
+        """
+        for monpath, target_dirs in self.sync_dir_config.items():
+            if not monpath:
+                continue
+            try:
+                manifest = self.syncmanifest.scan(monpath)
+                old_manifest = self.syncmanifest.load(monpath)
+                if old_manifest is None:
+                    log.info("【Sync】%s 没有目录快照，开始全量同步..." % monpath)
+                    self.__transfer_sync_dir(monpath, target_dirs)
+                    self.syncmanifest.save(monpath, manifest)
+                else:
+                    changed_files = self.syncmanifest.diff(monpath, old_manifest, manifest)
+                    log.info("【Sync】%s 目录对账完成，新增或变化的文件数：%s" % (monpath, len(changed_files)))
+                    # 变化的文件在快照中保持原状，处理完成后再更新，中途退出时下次对账会重新处理
+                    committed = dict(manifest)
+                    with lock:
+                        for changed_file in changed_files:
+                            rel_path = os.path.relpath(changed_file, monpath)
+                            if rel_path in old_manifest:
+                                committed[rel_path] = old_manifest[rel_path]
+                            else:
+                                committed.pop(rel_path, None)
+                            changed_file = os.path.normpath(changed_file)
+                            if changed_file not in self._manifest_pending:
+                                self._manifest_pending_count[monpath] = \
+                                    self._manifest_pending_count.get(monpath, 0) + 1
+                            self._manifest_pending[changed_file] = (monpath, rel_path, manifest.get(rel_path))
+                            self._manifest_pending_trie.add(changed_file)
+                    self.syncmanifest.save(monpath, committed)
+                    for changed_file in changed_files:
+                        self._debouncer.touch(changed_file, "同步")
+            except Exception as e:
+                ExceptionUtils.exception_traceback(e)
+                log.error("【Sync】%s 目录对账出错：%s" % (monpath, str(e)))
+
+    def __manifest_handled(self, paths):
+        """
+        对账发现变化的文件已处理完成，更新快照；目录时目录下的文件均视为完成
+        """
+        if not paths or not self._manifest_pending:
+            return
+        updates = {}
+        with lock:
+            for path in paths:
+                for pending_path, _ in self._manifest_pending_trie.find_under(path):
+                    self._manifest_pending_trie.remove(pending_path)
+                    root, rel_path, sig = self._manifest_pending.pop(pending_path)
+                    self._manifest_pending_count[root] -= 1
+                    self._manifest_done.setdefault(root, {})[rel_path] = sig
+            for root in list(self._manifest_done):
+                # 监控目录下没有待处理的文件或积累到一定数量时写入
+                if len(self._manifest_done[root]) >= self._MANIFEST_BATCH_SIZE \
+                        or not self._manifest_pending_count.get(root):
+                    updates[root] = self._manifest_done.pop(root)
+        for root, entries in updates.items():
+            self.syncmanifest.update(root, entries)
+
+    def __transfer_sync_dir(self, monpath, target_dirs):
+        """
+        全量转移一个Sync目录下的文件
+        """
+        target_path = target_dirs.get('target')
+        unknown_path = target_dirs.get('unknown')
+        onlylink = target_dirs.get('onlylink')
+        sync_mode = target_dirs.get('syncmod')
+        # 只做硬链接，不做识别重命名
+        if onlylink:
+            # 一次查出已同步的文件，与目录文件求差集，同步历史分批写入
+            synced_files = self.dbhelper.get_sync_history_paths(monpath, target_path)
+            new_files = []
+            for link_file in PathUtils.iter_dir_files(monpath):
+                if os.path.normpath(link_file) in synced_files:
+                    continue
+                log.info("【Sync】开始同步 %s" % link_file)
+                ret, msg = self.filetransfer.link_sync_file(src_path=monpath,
+                                                            in_file=link_file,
+                                                            target_dir=target_path,
+                                                            sync_transfer_mode=sync_mode)
+                if ret != 0:
+                    log.warn("【Sync】%s 同步失败，错误码：%s" % (link_file, ret))
+                elif not msg:
+                    new_files.append(link_file)
+                    log.info("【Sync】%s 同步完成" % link_file)
+                    if len(new_files) >= self._HISTORY_BATCH_SIZE:
+                        self.dbhelper.insert_sync_histories(new_files, monpath, target_path)
+                        new_files = []
+            self.dbhelper.insert_sync_histories(new_files, monpath, target_path)
+        else:
+            for path in PathUtils.get_dir_level1_medias(monpath, RMT_MEDIAEXT):
+                if PathUtils.is_invalid_path(path):
+                    continue
+                # 预写日志中已完整处理且没有变化的目录不再重新扫描
+                if self.filetransfer.journal.is_dir_completed(path, target_path, sync_mode):
+                    log.debug("【Sync】%s 已处理完成且没有变化，跳过" % path)
+                    continue
+                ret, ret_msg = self.filetransfer.transfer_media(in_from=SyncType.MON,
+                                                                in_path=path,
                                                                 target_dir=target_path,
-                                                                sync_transfer_mode=sync_mode)
-                    if ret != 0:
-                        log.warn("【Sync】%s 同步失败，错误码：%s" % (link_file, ret))
-                    elif not msg:
-                        self.dbhelper.insert_sync_history(link_file, monpath, target_path)
-                        log.info("【Sync】%s 同步完成" % link_file)
-            else:
-                for path in PathUtils.get_dir_level1_medias(monpath, RMT_MEDIAEXT):
-                    if PathUtils.is_invalid_path(path):
-                        continue
-                    ret, ret_msg = self.filetransfer.transfer_media(in_from=SyncType.MON,
-                                                                    in_path=path,
-                                                                    target_dir=target_path,
-                                                                    unknown_dir=unknown_path,
-                                                                    rmt_mode=sync_mode)
-                    if not ret:
-                        log.error("【Sync】%s 处理失败：%s" % (monpath, ret_msg))
+                                                                unknown_dir=unknown_path,
+                                                                rmt_mode=sync_mode)
+                if not ret:
+                    log.error("【Sync】%s 处理失败：%s" % (monpath, ret_msg))
 
 
 def run_monitor():
@@ -11,3 +11,10 @@ from .torrent import Torrent
 from .cache_manager import cacheman, TokenCache, ConfigLoadCache
 from .exception_utils import ExceptionUtils
 from .rsstitle_utils import RssTitleUtils
+from .file_debouncer import FileDebouncer
+from .path_trie import PathTrie
+from .copy_engine import CopyEngine, FileChecksum
+from .dir_listing_cache import DirListingCache
+from .mtime_polling_observer import MtimePollingObserver
+from .striped_lock import StripedLock
+from .token_bucket import TokenBucket
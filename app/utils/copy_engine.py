@@ -0,0 +1,174 @@
+import errno
+import hashlib
+import os
+import shutil
+import sys
+import uuid
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class FileChecksum:
+    """
+    复制时计算的文件校验值：需要计算时按块读写复制并同时计算，不再使用内核复制，reflink不读取数据，不计算
+    """
+
+    def __init__(self, algorithm="blake2b", digest_size=16):
+        self.algorithm = algorithm
+        self._hasher = hashlib.blake2b(digest_size=digest_size) if algorithm == "blake2b" \
+            else hashlib.new(algorithm)
+        # 是否已计算
+        self.computed = False
+
+    def update(self, data):
+        self._hasher.update(data)
+
+    def get_value(self):
+        """
+        校验值，格式为 算法:十六进制值，没有计算时返回None
+        """
+        return "%s:%s" % (self.algorithm, self._hasher.hexdigest()) if self.computed else None
+
+
+class CopyEngine:
+    """
+    文件复制：优先使用reflink（FICLONE），其次copy_file_range、sendfile，最后按块读写；
+    先写入同目录下的临时文件，完成后原子重命名为目标文件，复制中断时不会留下不完整的文件
+    """
+    # ioctl FICLONE
+    _FICLONE = 0x40049409
+    # 每次复制的块大小
+    CHUNK_SIZE = 8 * 1024 * 1024
+    # 临时文件后缀
+    TEMP_SUFFIX = ".nt-part"
+    # 内核不支持时需回退的错误，macOS等系统sendfile只支持socket，返回ENOTSOCK
+    _FALLBACK_ERRNOS = {errno.ENOSYS, errno.EXDEV, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP,
+                        errno.ENOTTY, errno.EBADF, errno.ETXTBSY, errno.EPERM, errno.ENOTSOCK}
+    # 仅Linux支持文件到文件的sendfile
+    _SENDFILE_FILE = sys.platform.startswith("linux")
+
+    @staticmethod
+    def get_temp_file(dest):
+        """
+        目标文件对应的临时文件
+        """
+        return os.path.join(os.path.dirname(dest),
+                            ".%s.%s%s" % (os.path.basename(dest), uuid.uuid4().hex[:8], CopyEngine.TEMP_SUFFIX))
+
+    @staticmethod
+    def copy(src, dest, callback=None, hasher=None, limiter=None):
+        """
+        复制文件
+        :param src: 源文件
+        :param dest: 目标文件
+        :param callback: 进度回调，参数为(已复制字节数, 总字节数)，返回False时取消复制
+        :param hasher: FileChecksum，传入时跳过内核复制，按块读写并同时计算，只读取一次源文件；reflink时不计算
+        :param limiter: 限速回调，每块数据复制前以块大小调用，可阻塞等待；reflink不实际复制数据，不调用
+        :return: 使用的复制方式
+        """
+        src = os.path.normpath(src)
+        dest = os.path.normpath(dest)
+        tmp_file = CopyEngine.get_temp_file(dest)
+        try:
+            with open(src, "rb") as fsrc, open(tmp_file, "wb") as fdst:
+                total = os.fstat(fsrc.fileno()).st_size
+                method = CopyEngine.__copy_fileobj(fsrc, fdst, total, callback, limiter,
+                                                   chunk_callback=hasher.update if hasher else None)
+                fdst.flush()
+                os.fsync(fdst.fileno())
+            if hasher and method == "chunk":
+                hasher.computed = True
+            shutil.copystat(src, tmp_file)
+            os.replace(tmp_file, dest)
+            return method
+        except BaseException:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+            raise
+
+    @staticmethod
+    def __progress(callback, copied, total):
+        if callback and callback(copied, total) is False:
+            raise InterruptedError("复制已取消")
+
+    @staticmethod
+    def __copy_fileobj(fsrc, fdst, total, callback, limiter=None, chunk_callback=None):
+        """
+        依次尝试各复制方式
+        :param chunk_callback: 按块读写时每块数据的回调，传入时不使用内核复制，避免复制后再读取一次文件
+        """
+        # reflink，写时复制，不实际复制数据
+        if fcntl and total:
+            try:
+                fcntl.ioctl(fdst.fileno(), CopyEngine._FICLONE, fsrc.fileno())
+                CopyEngine.__progress(callback, total, total)
+                return "reflink"
+            except OSError as err:
+                if err.errno not in CopyEngine._FALLBACK_ERRNOS:
+                    raise
+        # 内核态复制，需要每块数据时跳过
+        for method, func in [] if chunk_callback else [("copy_file_range", CopyEngine.__copy_file_range),
+                             ("sendfile", CopyEngine.__sendfile)]:
+            if not hasattr(os, method) \
+                    or (method == "sendfile" and not CopyEngine._SENDFILE_FILE):
+                continue
+            try:
+                func(fsrc.fileno(), fdst.fileno(), total, callback, limiter)
+                return method
+            except OSError as err:
+                # 尚未写入数据时才可回退
+                if err.errno not in CopyEngine._FALLBACK_ERRNOS \
+                        or os.lseek(fdst.fileno(), 0, os.SEEK_CUR):
+                    raise
+        # 按块读写
+        CopyEngine.copy_chunks(fsrc, fdst, total, callback, chunk_callback=chunk_callback, limiter=limiter)
+        return "chunk"
+
+    @staticmethod
+    def __copy_file_range(src_fd, dst_fd, total, callback, limiter=None):
+        copied = 0
+        while True:
+            if limiter:
+                limiter(min(CopyEngine.CHUNK_SIZE, max(total - copied, 0)))
+            sent = os.copy_file_range(src_fd, dst_fd, CopyEngine.CHUNK_SIZE)
+            if not sent:
+                break
+            copied += sent
+            CopyEngine.__progress(callback, copied, total)
+
+    @staticmethod
+    def __sendfile(src_fd, dst_fd, total, callback, limiter=None):
+        copied = 0
+        while True:
+            if limiter:
+                limiter(min(CopyEngine.CHUNK_SIZE, max(total - copied, 0)))
+            sent = os.sendfile(dst_fd, src_fd, copied, CopyEngine.CHUNK_SIZE)
+            if not sent:
+                break
+            copied += sent
+            CopyEngine.__progress(callback, copied, total)
+
+    @staticmethod
+    def copy_chunks(fsrc, fdst, total, callback=None, chunk_callback=None, limiter=None):
+        """
+        按块读写复制
+        :param chunk_callback: 每块数据的回调，可用于计算校验值
+        :param limiter: 限速回调，写入前以块大小调用
+        """
+        copied = 0
+        buf = bytearray(CopyEngine.CHUNK_SIZE)
+        view = memoryview(buf)
+        while True:
+            size = fsrc.readinto(buf)
+            if not size:
+                break
+            if limiter:
+                limiter(size)
+            fdst.write(view[:size])
+            if chunk_callback:
+                chunk_callback(view[:size])
+            copied += size
+            CopyEngine.__progress(callback, copied, total)
@@ -0,0 +1,89 @@
+import os
+import threading
+
+
+class DirListingCache:
+    """
+    目录列表缓存：每个目录只列出一次，按文件名（不含后缀）建立索引，批量判断文件是否存在时不再逐个访问文件系统；
+    缓存只在一次处理过程中使用，处理过程中写入的目录需调用invalidate，可在转移线程中调用
+    """
+
+    def __init__(self):
+        # 目录 -> (文件名集合, 文件名（不含后缀） -> 后缀集合)，目录不存在时为None
+        self._listings = {}
+        self._lock = threading.Lock()
+        # 每次invalidate加1，列目录期间有失效时不缓存该结果
+        self._version = 0
+
+    def __get_listing(self, dir_path):
+        dir_path = os.path.normpath(dir_path)
+        with self._lock:
+            if dir_path in self._listings:
+                return self._listings[dir_path]
+            version = self._version
+        listing = None
+        try:
+            names = set()
+            stems = {}
+            with os.scandir(dir_path) as entries:
+                for entry in entries:
+                    names.add(entry.name)
+                    stem, ext = os.path.splitext(entry.name)
+                    stems.setdefault(stem, set()).add(ext)
+            listing = (names, stems)
+        except OSError:
+            pass
+        with self._lock:
+            if version == self._version:
+                self._listings[dir_path] = listing
+        return listing
+
+    def exists(self, path):
+        """
+        文件或目录是否存在
+        """
+        if not path:
+            return False
+        path = os.path.normpath(path)
+        dir_path, name = os.path.split(path)
+        if not name:
+            return os.path.exists(path)
+        listing = self.__get_listing(dir_path)
+        return bool(listing) and name in listing[0]
+
+    def find_file(self, file_path, exts):
+        """
+        按后缀顺序查找已存在的文件
+        :param file_path: 不含后缀的文件路径
+        :param exts: 后缀列表
+        :return: 第一个存在的文件路径，都不存在时返回None
+        """
+        if not file_path:
+            return None
+        dir_path, stem = os.path.split(os.path.normpath(file_path))
+        listing = self.__get_listing(dir_path)
+        if not listing:
+            return None
+        exist_exts = listing[1].get(stem)
+        if not exist_exts:
+            return None
+        for ext in exts:
+            if ext in exist_exts:
+                return "%s%s" % (file_path, ext)
+        return None
+
+    def invalidate(self, path):
+        """
+        目录内容发生变化，清除该目录及上级目录的缓存
+        """
+        if not path:
+            return
+        path = os.path.normpath(path)
+        with self._lock:
+            self._version += 1
+            while True:
+                self._listings.pop(path, None)
+                parent = os.path.dirname(path)
+                if parent == path:
+                    break
+                path = parent
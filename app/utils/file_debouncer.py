@@ -0,0 +1,138 @@
+import os
+import threading
+import time
+
+from app.utils.exception_utils import ExceptionUtils
+
+
+class FileDebouncer:
+    """
+    文件变化防抖，合并同一文件的多次创建/移动/修改事件，
+    文件大小及修改时间在稳定窗口内不再变化后才回调处理
+    """
+
+    def __init__(self, callback, window=10, interval=1):
+        """
+        :param callback: 文件稳定后的回调，参数为文件路径及登记时传入的参数
+        :param window: 稳定窗口，单位秒
+        :param interval: 检查间隔，单位秒
+        """
+        self._callback = callback
+        self._window = window
+        self._interval = interval
+        # 路径 -> {'stat': (大小, 修改时间), 'last': 最后变化时间, 'args': 回调参数}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def set_window(self, window):
+        """
+        设置稳定窗口
+        """
+        if window is not None and window >= 0:
+            self._window = window
+
+    def start(self):
+        """
+        启动检查线程
+        """
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self.__run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        停止检查线程，未稳定的文件保留，再次启动后继续检查
+        """
+        self._stop_event.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout=self._interval * 5)
+        self._thread = None
+
+    def touch(self, path, *args):
+        """
+        登记文件变化，重置该文件的稳定计时
+        :return: 是否新登记的文件，已在队列中的返回False
+        """
+        if not path:
+            return False
+        with self._lock:
+            item = self._pending.get(path)
+            self._pending[path] = {'stat': item['stat'] if item else None, 'last': time.time(), 'args': args}
+        return not item
+
+    def has_pending(self, dir_path):
+        """
+        目录下（仅一级）是否还有未稳定的文件
+        """
+        if not dir_path:
+            return False
+        dir_path = os.path.normpath(dir_path)
+        with self._lock:
+            for path in self._pending:
+                if os.path.normpath(os.path.dirname(path)) == dir_path:
+                    return True
+        return False
+
+    def get_pending_paths(self):
+        """
+        未稳定的文件列表
+        """
+        with self._lock:
+            return list(self._pending)
+
+    def get_pending_count(self):
+        """
+        未稳定的文件数
+        """
+        return len(self._pending)
+
+    def __run(self):
+        while not self._stop_event.wait(self._interval):
+            try:
+                self.__check()
+            except Exception as err:
+                ExceptionUtils.exception_traceback(err)
+
+    def __check(self):
+        """
+        检查所有登记的文件，回调已稳定的文件
+        """
+        with self._lock:
+            items = list(self._pending.items())
+        if not items:
+            return
+        released = []
+        for path, item in items:
+            try:
+                stat = os.stat(path)
+                sig = (stat.st_size, stat.st_mtime_ns)
+            except OSError:
+                sig = None
+            now = time.time()
+            with self._lock:
+                if self._pending.get(path) is not item:
+                    continue
+                # 文件已不存在
+                if not sig:
+                    self._pending.pop(path)
+                    continue
+                # 大小或修改时间仍在变化
+                if item['stat'] and item['stat'] != sig:
+                    item['last'] = now
+                item['stat'] = sig
+                if now - item['last'] >= self._window:
+                    released.append((path, item))
+        # 逐个移出队列后回调，保证回调时同目录下尚未回调的文件仍视为未稳定
+        for path, item in released:
+            with self._lock:
+                if self._pending.get(path) is not item:
+                    continue
+                self._pending.pop(path)
+            try:
+                self._callback(path, *item['args'])
+            except Exception as err:
+                ExceptionUtils.exception_traceback(err)
@@ -0,0 +1,216 @@
+import heapq
+import os
+import random
+import time
+from functools import partial
+
+from watchdog.events import FileCreatedEvent, DirCreatedEvent, FileDeletedEvent, DirDeletedEvent, \
+    FileModifiedEvent, FileMovedEvent
+from watchdog.observers.api import BaseObserver, EventEmitter, DEFAULT_EMITTER_TIMEOUT, DEFAULT_OBSERVER_TIMEOUT
+
+from app.utils.exception_utils import ExceptionUtils
+
+
+class MtimePollingEmitter(EventEmitter):
+    """
+    低开销轮询：记录每个目录的修改时间，目录修改时间未变化时不重新列出该目录；
+    长时间未变化的目录逐步降低检查频率并错开检查时间，按每秒stat次数预算限速
+    """
+
+    def __init__(self, event_queue, watch, timeout=DEFAULT_EMITTER_TIMEOUT, stat_budget=0, cold_interval=600):
+        """
+        :param stat_budget: 每秒最多stat次数，0为不限制
+        :param cold_interval: 长时间未变化的目录最长检查间隔，单位秒
+        """
+        super().__init__(event_queue, watch, timeout)
+        self._stat_budget = stat_budget
+        self._cold_interval = max(cold_interval, timeout)
+        # 目录 -> {'mtime': 目录修改时间, 'entries': {名称: (是否目录, 大小, 修改时间, inode)},
+        #         'idle': 连续未变化次数, 'due': 下次检查时间}
+        self._dirs = {}
+        # 待检查目录 (检查时间, 目录)
+        self._queue = []
+        self._ready = False
+        self._root_lost = False
+        self._window_start = 0
+        self._window_stats = 0
+
+    def __throttle(self, count=1):
+        """
+        按预算限速，超出本秒预算时等待到下一秒
+        """
+        if not self._stat_budget:
+            return
+        now = time.time()
+        if now - self._window_start >= 1:
+            self._window_start = now
+            self._window_stats = 0
+        self._window_stats += count
+        if self._window_stats >= self._stat_budget:
+            self.stopped_event.wait(max(1 - (now - self._window_start), 0))
+            self._window_start = time.time()
+            self._window_stats = 0
+
+    def __list_dir(self, path):
+        """
+        列出目录，返回目录修改时间及目录项，目录不存在时返回None
+        """
+        try:
+            mtime = os.stat(path).st_mtime_ns
+            entries = {}
+            with os.scandir(path) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            entries[entry.name] = (True, 0, 0, 0)
+                        else:
+                            stat = entry.stat()
+                            entries[entry.name] = (False, stat.st_size, stat.st_mtime_ns, stat.st_ino)
+                    except OSError:
+                        continue
+        except OSError:
+            return None, None
+        self.__throttle(len(entries) + 1)
+        return mtime, entries
+
+    def __schedule(self, path, idle=0):
+        """
+        登记目录下次检查时间，未变化的次数越多间隔越长
+        """
+        delay = min(self.timeout * (2 ** min(idle, 16)), self._cold_interval)
+        if idle:
+            # 错开冷目录的检查时间
+            delay *= random.uniform(0.75, 1.25)
+        due = time.time() + delay
+        self._dirs[path]['due'] = due
+        heapq.heappush(self._queue, (due, path))
+
+    def __add_tree(self, path, emit=True):
+        """
+        登记目录及其下级目录，emit时为目录中已有的文件生成创建事件
+        """
+        dirs = [path]
+        while dirs and not self.stopped_event.is_set():
+            cur_dir = dirs.pop()
+            mtime, entries = self.__list_dir(cur_dir)
+            if entries is None:
+                continue
+            self._dirs[cur_dir] = {'mtime': mtime, 'entries': entries, 'idle': 0, 'due': 0}
+            self.__schedule(cur_dir)
+            for name, (is_dir, _, _, _) in entries.items():
+                sub_path = os.path.join(cur_dir, name)
+                if is_dir:
+                    if self.watch.is_recursive:
+                        dirs.append(sub_path)
+                    if emit:
+                        self.queue_event(DirCreatedEvent(sub_path))
+                elif emit:
+                    self.queue_event(FileCreatedEvent(sub_path))
+
+    def __remove_tree(self, path):
+        """
+        移除目录及其下级目录的登记
+        """
+        prefix = os.path.join(path, "")
+        for dir_path in [p for p in self._dirs if p == path or p.startswith(prefix)]:
+            self._dirs.pop(dir_path, None)
+
+    def __check_dir(self, path, due):
+        """
+        检查目录修改时间，变化时重新列出目录并生成事件
+        """
+        state = self._dirs.get(path)
+        # 目录已移除或已重新登记
+        if not state or state['due'] != due:
+            return
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            # 目录已删除，由上级目录生成删除事件，监控根目录删除时等待重建
+            self.__remove_tree(path)
+            if path == self.watch.path:
+                self.queue_event(DirDeletedEvent(path))
+                self._ready = False
+                self._root_lost = True
+            return
+        finally:
+            self.__throttle()
+        if mtime == state['mtime']:
+            state['idle'] += 1
+            self.__schedule(path, state['idle'])
+            return
+        new_mtime, entries = self.__list_dir(path)
+        if entries is None:
+            return
+        old_entries = state['entries']
+        state.update({'mtime': new_mtime, 'entries': entries, 'idle': 0})
+        self.__schedule(path)
+        deleted = {name: old_entries[name] for name in old_entries.keys() - entries.keys()}
+        created = {name: entries[name] for name in entries.keys() - old_entries.keys()}
+        # 同一目录内的重命名
+        deleted_inodes = {item[3]: name for name, item in deleted.items() if not item[0] and item[3]}
+        for name, item in list(created.items()):
+            src_name = deleted_inodes.get(item[3]) if not item[0] and item[3] else None
+            if src_name:
+                self.queue_event(FileMovedEvent(os.path.join(path, src_name), os.path.join(path, name)))
+                deleted.pop(src_name, None)
+                created.pop(name)
+        for name, item in old_entries.items():
+            new_item = entries.get(name)
+            if not new_item or name in created:
+                continue
+            if item[0] != new_item[0]:
+                deleted[name] = item
+                created[name] = new_item
+            elif not item[0] and item != new_item:
+                self.queue_event(FileModifiedEvent(os.path.join(path, name)))
+        for name, item in deleted.items():
+            sub_path = os.path.join(path, name)
+            if item[0]:
+                self.__remove_tree(sub_path)
+                self.queue_event(DirDeletedEvent(sub_path))
+            else:
+                self.queue_event(FileDeletedEvent(sub_path))
+        for name, item in created.items():
+            sub_path = os.path.join(path, name)
+            if item[0]:
+                self.queue_event(DirCreatedEvent(sub_path))
+                if self.watch.is_recursive:
+                    # 新目录下已有的文件也生成创建事件
+                    self.__add_tree(sub_path, emit=True)
+            else:
+                self.queue_event(FileCreatedEvent(sub_path))
+
+    def queue_events(self, timeout):
+        if self.stopped_event.wait(timeout):
+            return
+        try:
+            if not self._ready:
+                if os.path.isdir(self.watch.path):
+                    self.__add_tree(self.watch.path, emit=self._root_lost)
+                    self._ready = True
+                    self._root_lost = False
+                return
+            now = time.time()
+            while self._queue and self._queue[0][0] <= now and not self.stopped_event.is_set():
+                due, path = heapq.heappop(self._queue)
+                self.__check_dir(path, due)
+        except Exception as err:
+            ExceptionUtils.exception_traceback(err)
+
+
+class MtimePollingObserver(BaseObserver):
+    """
+    低开销轮询观察者，适用于网络共享目录及Windows
+    """
+
+    def __init__(self, timeout=DEFAULT_OBSERVER_TIMEOUT, stat_budget=0, cold_interval=600):
+        """
+        :param timeout: 检查间隔，单位秒
+        :param stat_budget: 每个监控目录每秒最多stat次数，0为不限制
+        :param cold_interval: 长时间未变化的目录最长检查间隔，单位秒
+        """
+        super().__init__(emitter_class=partial(MtimePollingEmitter,
+                                               stat_budget=stat_budget,
+                                               cold_interval=cold_interval),
+                         timeout=timeout)
@@ -0,0 +1,124 @@
+import os
+
+
+class PathTrie:
+    """
+    路径前缀树，按路径层级登记根目录及其标签，一次查找即可得到路径所在的全部根目录
+    """
+    # 节点上登记根目录信息的键，不会与路径名冲突
+    _ROOT_KEY = None
+
+    def __init__(self):
+        self._tree = {}
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    @staticmethod
+    def split_path(path):
+        """
+        将路径拆分为各级名称
+        """
+        return [part for part in os.path.normpath(path).split(os.sep) if part]
+
+    def add(self, path, tag=None):
+        """
+        登记根目录
+        :param path: 根目录
+        :param tag: 标签，同一目录可登记多个标签
+        """
+        if not path:
+            return
+        node = self._tree
+        for part in self.split_path(path):
+            node = node.setdefault(part, {})
+        root = node.get(self._ROOT_KEY)
+        if not root:
+            root = node[self._ROOT_KEY] = (os.path.normpath(path), set())
+            self._count += 1
+        if tag is not None:
+            root[1].add(tag)
+
+    def lookup(self, path):
+        """
+        查找路径所在的全部根目录（包括路径本身），按层级由浅到深返回
+        :return: [(根目录, 标签集合)]
+        """
+        if not path or not self._tree:
+            return []
+        ret = []
+        node = self._tree
+        root = node.get(self._ROOT_KEY)
+        if root:
+            ret.append(root)
+        for part in self.split_path(path):
+            node = node.get(part)
+            if node is None:
+                break
+            root = node.get(self._ROOT_KEY)
+            if root:
+                ret.append(root)
+        return ret
+
+    def match(self, path, tag=None):
+        """
+        查找路径所在的最深一级根目录
+        :param path: 路径
+        :param tag: 只匹配带该标签的根目录
+        :return: 根目录，未匹配时返回None
+        """
+        for root, tags in reversed(self.lookup(path)):
+            if tag is None or tag in tags:
+                return root
+        return None
+
+    def find_under(self, path):
+        """
+        查找路径下（包括路径本身）登记的全部根目录
+        :return: [(根目录, 标签集合)]
+        """
+        if not path:
+            return []
+        node = self._tree
+        for part in self.split_path(path):
+            node = node.get(part)
+            if node is None:
+                return []
+        ret = []
+        nodes = [node]
+        while nodes:
+            node = nodes.pop()
+            for key, child in node.items():
+                if key is self._ROOT_KEY:
+                    ret.append(child)
+                else:
+                    nodes.append(child)
+        return ret
+
+    def remove(self, path):
+        """
+        删除登记的根目录，同时删除不再使用的节点
+        :return: 是否登记过
+        """
+        if not path:
+            return False
+        parts = self.split_path(path)
+        nodes = [self._tree]
+        for part in parts:
+            node = nodes[-1].get(part)
+            if node is None:
+                return False
+            nodes.append(node)
+        if nodes[-1].pop(self._ROOT_KEY, None) is None:
+            return False
+        self._count -= 1
+        for i in range(len(parts), 0, -1):
+            if nodes[i]:
+                break
+            del nodes[i - 1][parts[i - 1]]
+        return True
+
+    def clear(self):
+        self._tree = {}
+        self._count = 0
@@ -8,45 +8,69 @@ class PathUtils:
         """
         获得目录下的媒体文件列表List ，按后缀、大小、格式过滤
         """
+        return list(PathUtils.iter_dir_files(in_path=in_path,
+                                             exts=exts,
+                                             filesize=filesize,
+                                             episode_format=episode_format))
+
+    @staticmethod
+    def iter_dir_files(in_path, exts="", filesize=0, episode_format=None):
+        """
+        遍历目录下的媒体文件，按后缀、大小、格式过滤，逐个返回文件路径，
+        回收站及隐藏目录不进入遍历
+        """
         if not in_path:
-            return []
+            return
         if not os.path.exists(in_path):
-            return []
-        ret_list = []
+            return
         if os.path.isdir(in_path):
-            for root, dirs, files in os.walk(in_path):
-                for file in files:
-                    cur_path = os.path.join(root, file)
-                    # 检查路径是否合法
-                    if PathUtils.is_invalid_path(cur_path):
-                        continue
-                    # 检查格式匹配
-                    if episode_format and not episode_format.match(file):
-                        continue
-                    # 检查后缀
-                    if exts and os.path.splitext(file)[-1].lower() not in exts:
-                        continue
-                    # 检查文件大小
-                    if filesize and os.path.getsize(cur_path) < filesize:
-                        continue
-                    # 命中
-                    if cur_path not in ret_list:
-                        ret_list.append(cur_path)
+            dirs = [in_path]
+            while dirs:
+                sub_dirs = []
+                try:
+                    with os.scandir(dirs.pop()) as entries:
+                        for entry in entries:
+                            try:
+                                if entry.is_dir():
+                                    # 与os.walk一致，不进入链接的目录；回收站及隐藏目录不进入
+                                    if not entry.is_symlink() \
+                                            and not PathUtils.is_invalid_path(entry.path + os.sep):
+                                        sub_dirs.append(entry.path)
+                                    continue
+                                # 检查路径是否合法
+                                if PathUtils.is_invalid_path(entry.path):
+                                    continue
+                                # 检查格式匹配
+                                if episode_format and not episode_format.match(entry.name):
+                                    continue
+                                # 检查后缀
+                                if exts and os.path.splitext(entry.name)[-1].lower() not in exts:
+                                    continue
+                                # 检查文件大小
+                                if filesize and entry.stat().st_size < filesize:
+                                    continue
+                            except OSError:
+                                continue
+                            # 命中
+                            yield entry.path
+                except OSError:
+                    continue
+                # 按目录顺序深度优先遍历
+                dirs.extend(reversed(sub_dirs))
         else:
             # 检查路径是否合法
             if PathUtils.is_invalid_path(in_path):
-                return []
+                return
             # 检查后缀
             if exts and os.path.splitext(in_path)[-1].lower() not in exts:
-                return []
+                return
             # 检查格式
             if episode_format and not episode_format.match(os.path.basename(in_path)):
-                return []
+                return
             # 检查文件大小
             if filesize and os.path.getsize(in_path) < filesize:
-                return []
-            ret_list.append(in_path)
-        return ret_list
+                return
+            yield in_path
 
     @staticmethod
     def get_dir_level1_files(in_path, exts=""):
@@ -0,0 +1,75 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+class StripedLock:
+    """
+    分段锁：按键的哈希映射到固定数量的锁上，同一键互斥，不同键大概率互不阻塞，
+    并记录每段锁的等待及持有时间
+    """
+
+    def __init__(self, stripes=64):
+        self._stripes = max(int(stripes), 1)
+        self._locks = [threading.Lock() for _ in range(self._stripes)]
+        # 分段 -> {'key': 最近的键, 'count': 加锁次数, 'wait': 总等待时间, 'wait_max', 'hold': 总持有时间, 'hold_max'}
+        self._stats = {}
+        self._stats_lock = threading.Lock()
+
+    def get_stripe(self, key):
+        """
+        键对应的分段
+        """
+        return hash(key) % self._stripes
+
+    @contextmanager
+    def lock(self, *keys):
+        """
+        同时锁定多个键，按分段顺序加锁避免死锁，键为None时忽略
+        """
+        stripes = {}
+        for key in keys:
+            if key is not None:
+                stripes.setdefault(self.get_stripe(key), key)
+        acquired = []
+        try:
+            for stripe in sorted(stripes):
+                start_time = time.time()
+                self._locks[stripe].acquire()
+                locked_time = time.time()
+                acquired.append((stripe, locked_time, locked_time - start_time))
+            yield
+        finally:
+            for stripe, locked_time, wait_time in reversed(acquired):
+                hold_time = time.time() - locked_time
+                self._locks[stripe].release()
+                self.__record(stripe, stripes.get(stripe), wait_time, hold_time)
+
+    def __record(self, stripe, key, wait_time, hold_time):
+        with self._stats_lock:
+            stat = self._stats.get(stripe)
+            if not stat:
+                stat = self._stats[stripe] = {'key': None, 'count': 0,
+                                              'wait': 0, 'wait_max': 0,
+                                              'hold': 0, 'hold_max': 0}
+            stat['key'] = str(key)
+            stat['count'] += 1
+            stat['wait'] += wait_time
+            stat['wait_max'] = max(stat['wait_max'], wait_time)
+            stat['hold'] += hold_time
+            stat['hold_max'] = max(stat['hold_max'], hold_time)
+
+    def get_stats(self):
+        """
+        各分段的加锁次数、平均及最大等待时间、平均及最大持有时间，按总等待时间倒序
+        """
+        with self._stats_lock:
+            stats = [{'stripe': stripe,
+                      'key': stat['key'],
+                      'count': stat['count'],
+                      'wait_avg': round(stat['wait'] / stat['count'], 3),
+                      'wait_max': round(stat['wait_max'], 3),
+                      'hold_avg': round(stat['hold'] / stat['count'], 3),
+                      'hold_max': round(stat['hold_max'], 3)}
+                     for stripe, stat in self._stats.items()]
+        return sorted(stats, key=lambda x: x['wait_avg'] * x['count'], reverse=True)
@@ -1,9 +1,11 @@
 import datetime
+import errno
 import os
 import platform
 import shutil
 import subprocess
 
+from app.utils.copy_engine import CopyEngine
 from app.utils.path_utils import PathUtils
 from app.utils.exception_utils import ExceptionUtils
 from app.utils.types import OsType
@@ -112,6 +114,32 @@ class SystemUtils:
     def is_macos():
         return True if platform.system() == 'Darwin' else False
 
+    @staticmethod
+    def is_network_path(path):
+        """
+        路径是否位于SMB/NFS等网络共享挂载点下，仅支持Linux
+        """
+        if not path or not os.path.exists("/proc/mounts"):
+            return False
+        path = os.path.realpath(path)
+        mount_point, fs_type = "", ""
+        try:
+            with open("/proc/mounts", "r") as f:
+                for line in f:
+                    fields = line.split()
+                    if len(fields) < 3:
+                        continue
+                    # 挂载点中的空格等字符为八进制转义
+                    point = fields[1].encode().decode("unicode_escape")
+                    if len(point) > len(mount_point) \
+                            and (path == point or path.startswith(os.path.join(point, ""))):
+                        mount_point, fs_type = point, fields[2]
+        except Exception as err:
+            ExceptionUtils.exception_traceback(err)
+            return False
+        return fs_type in ["cifs", "smb3", "smbfs", "nfs", "nfs4", "9p", "afpfs", "davfs",
+                           "fuse.sshfs", "fuse.rclone"]
+
     @staticmethod
     def is_lite_version():
         return True if SystemUtils.is_docker() \
@@ -125,27 +153,38 @@ class SystemUtils:
             return WEBDRIVER_PATH.get(SystemUtils.get_system().value)
 
     @staticmethod
-    def copy(src, dest):
+    def copy(src, dest, callback=None, hasher=None, limiter=None):
         """
         复制
+        :param callback: 进度回调，参数为(已复制字节数, 总字节数)
+        :param hasher: FileChecksum，计算复制后文件的校验值，reflink时不计算
+        :param limiter: 限速回调，参数为即将复制的字节数
         """
         try:
-            shutil.copy2(os.path.normpath(src), os.path.normpath(dest))
+            CopyEngine.copy(src, dest, callback=callback, hasher=hasher, limiter=limiter)
             return 0, ""
         except Exception as err:
             ExceptionUtils.exception_traceback(err)
             return -1, str(err)
 
     @staticmethod
-    def move(src, dest):
+    def move(src, dest, callback=None, hasher=None, limiter=None):
         """
-        移动
+        移动，跨设备时复制后删除源文件；复制完成前源文件保持原名，中断时源文件不受影响
+        :param callback: 跨设备复制时的进度回调，参数为(已复制字节数, 总字节数)
+        :param hasher: FileChecksum，跨设备复制时计算校验值，同设备重命名及reflink时不计算
+        :param limiter: 跨设备复制时的限速回调，参数为即将复制的字节数
         """
         try:
-            tmp_file = os.path.normpath(os.path.join(os.path.dirname(src),
-                                                     os.path.basename(dest)))
-            os.rename(os.path.normpath(src), tmp_file)
-            shutil.move(tmp_file, os.path.normpath(dest))
+            src = os.path.normpath(src)
+            dest = os.path.normpath(dest)
+            try:
+                os.rename(src, dest)
+            except OSError as err:
+                if err.errno != errno.EXDEV:
+                    raise
+                CopyEngine.copy(src, dest, callback=callback, hasher=hasher, limiter=limiter)
+                os.remove(src)
             return 0, ""
         except Exception as err:
             ExceptionUtils.exception_traceback(err)
@@ -183,16 +222,18 @@ class SystemUtils:
             return -1, str(err)
 
     @staticmethod
-    def rclone_move(src, dest):
+    def rclone_move(src, dest, bwlimit=0):
         """
         Rclone移动
+        :param bwlimit: 限速，字节/秒，0为不限速
         """
         try:
             src = os.path.normpath(src)
             dest = dest.replace("\\", "/")
             retcode = subprocess.run(['rclone', 'moveto',
                                       src,
-                                      f'NASTOOL:{dest}'],
+                                      f'NASTOOL:{dest}'] + (['--bwlimit', '%sk' % max(int(bwlimit / 1024), 1)]
+                                                            if bwlimit else []),
                                      startupinfo=SystemUtils.__get_hidden_shell()).returncode
             return retcode, ""
         except Exception as err:
@@ -200,16 +241,18 @@ class SystemUtils:
             return -1, str(err)
 
     @staticmethod
-    def rclone_copy(src, dest):
+    def rclone_copy(src, dest, bwlimit=0):
         """
         Rclone复制
+        :param bwlimit: 限速，字节/秒，0为不限速
         """
         try:
             src = os.path.normpath(src)
             dest = dest.replace("\\", "/")
             retcode = subprocess.run(['rclone', 'copyto',
                                       src,
-                                      f'NASTOOL:{dest}'],
+                                      f'NASTOOL:{dest}'] + (['--bwlimit', '%sk' % max(int(bwlimit / 1024), 1)]
+                                                            if bwlimit else []),
                                      startupinfo=SystemUtils.__get_hidden_shell()).returncode
             return retcode, ""
         except Exception as err:
@@ -0,0 +1,63 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    令牌桶：按速率补充令牌，取令牌不足时等待；单次可取超过容量的令牌（透支），后续请求等待补足，保证长期速率不超过限制
+    """
+
+    def __init__(self, rate, capacity=None):
+        """
+        :param rate: 每秒补充的令牌数，0为不限制
+        :param capacity: 桶容量，默认为1秒的令牌数
+        """
+        self._lock = threading.Lock()
+        self._rate = 0
+        self._capacity = 0
+        self._tokens = 0
+        self._last = time.monotonic()
+        self.set_rate(rate, capacity)
+
+    @property
+    def rate(self):
+        return self._rate
+
+    def set_rate(self, rate, capacity=None):
+        """
+        调整速率
+        """
+        with self._lock:
+            self.__refill()
+            self._rate = max(float(rate or 0), 0)
+            self._capacity = float(capacity) if capacity else self._rate
+            self._tokens = min(self._tokens, self._capacity)
+
+    def __refill(self):
+        now = time.monotonic()
+        if self._rate:
+            self._tokens = min(self._capacity, self._tokens + (now - self._last) * self._rate)
+        self._last = now
+
+    def reserve(self, tokens=1):
+        """
+        预占令牌，返回需要等待的秒数
+        """
+        with self._lock:
+            if not self._rate:
+                return 0
+            self.__refill()
+            self._tokens -= tokens
+            if self._tokens >= 0:
+                return 0
+            return -self._tokens / self._rate
+
+    def consume(self, tokens=1):
+        """
+        取令牌，不足时等待
+        :return: 等待的秒数
+        """
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
@@ -21,14 +21,46 @@ RMT_SUBEXT = ['.srt', '.ass', '.ssa']
 ANIME_GENREIDS = ['16']
 # 默认过滤的文件大小，150M
 RMT_MIN_FILESIZE = 150 * 1024 * 1024
+# 文件转移时并发识别媒体信息的线程数
+RMT_RECOGNIZE_THREADS = 4
+# 文件转移时并行转移的线程数，同一设备上的复制、移动依次执行
+RMT_TRANSFER_THREADS = 4
+# 原盘目录转移时并行转移的小文件大小上限，超过的文件依次分块复制，32M
+RMT_DISC_SMALL_FILE_SIZE = 32 * 1024 * 1024
+# 原盘目录转移时暂存目录的后缀，全部转移完成后改名为目的目录
+RMT_STAGING_SUFFIX = '.nt-staging'
+# Rclone/Minio常驻服务同时执行的转移任务数
+RMT_REMOTE_TRANSFERS = 4
+# Rclone/Minio常驻服务单个转移任务的最长等待时间，超过时停止任务并按失败处理，秒
+RMT_REMOTE_JOB_TIMEOUT = 6 * 3600
+# 媒体库目录剩余空间刷新间隔，秒
+FREE_SPACE_REFRESH_INTERVAL = 30
 # 删种检查时间间隔
 AUTO_REMOVE_TORRENTS_INTERVAL = 1800
 # 下载文件转移检查时间间隔，
 PT_TRANSFER_INTERVAL = 300
 # TMDB信息缓存定时保存时间
 METAINFO_SAVE_INTERVAL = 600
-# SYNC目录同步聚合转移时间
-SYNC_TRANSFER_INTERVAL = 60
+# SYNC目录同步文件稳定等待时间（秒），文件大小及修改时间在该时间内不再变化才进行转移
+SYNC_STABLE_WINDOW = 10
+# SYNC目录同步转移线程数，不同设备间并行转移，同一设备串行转移
+SYNC_TRANSFER_THREADS = 4
+# SYNC目录监控可使用的inotify watch数占系统上限（fs.inotify.max_user_watches）的比例
+SYNC_INOTIFY_BUDGET_RATIO = 0.8
+# SYNC目录监控超出inotify watch预算转为轮询的子目录扫描间隔（秒）
+SYNC_POLLING_INTERVAL = 300
+# SYNC目录轮询监控每个目录每秒最多stat次数，避免网络共享目录元数据请求过多
+SYNC_POLLING_BUDGET = 200
+# SYNC目录轮询监控长时间未变化的子目录最长检查间隔（秒）
+SYNC_POLLING_COLD_INTERVAL = 600
+# SYNC目录监控转为轮询的子目录最大数量，每个轮询目录占用一个线程
+SYNC_POLLING_MAX_WATCHES = 16
+# SYNC已处理文件索引定时保存时间
+SYNC_INDEX_SAVE_INTERVAL = 300
+# SYNC已处理文件索引最大记录数
+SYNC_INDEX_MAX_SIZE = 500000
+# SYNC已处理文件索引记录过期时间（秒）
+SYNC_INDEX_EXPIRE_TIME = 90 * 24 * 3600
 # RSS队列中处理时间间隔
 RSS_CHECK_INTERVAL = 300
 # 站点流量数据刷新时间间隔（小时）
@@ -39,6 +71,20 @@ RSS_REFRESH_TMDB_INTERVAL = 6
 BRUSH_REMOVE_TORRENTS_INTERVAL = 300
 # 定时清除未识别的缓存时间间隔（小时）
 META_DELETE_UNKNOWN_INTERVAL = 12
+# TMDB接口响应缓存时间（秒）：搜索、详情、季、热门榜单
+TMDB_CACHE_TTLS = {
+    "search": 24 * 3600,
+    "details": 7 * 24 * 3600,
+    "season": 24 * 3600,
+    "trending": 3600
+}
+# TMDB接口响应缓存容量，256M
+TMDB_CACHE_MAX_SIZE = 256 * 1024 * 1024
+# TMDB接口连接超时、读取超时（秒）
+TMDB_CONNECT_TIMEOUT = 5
+TMDB_READ_TIMEOUT = 10
+# TMDB请求限速，所有请求共用（次/秒）
+TMDB_RATE_LIMIT = 40
 # 定时刷新壁纸的间隔（小时）
 REFRESH_WALLPAPER_INTERVAL = 1
 # fanart的api，用于拉取封面图片
@@ -37,7 +37,7 @@ from web.main import App
 from app.utils import SystemUtils, ConfigLoadCache
 from app.utils.commons import INSTANCES
 from app.db import init_db, update_db, init_data
-from app.helper import DisplayHelper, ChromeHelper
+from app.helper import DisplayHelper, ChromeHelper, TransferJournalHelper
 from app.scheduler import run_scheduler, restart_scheduler
 from app.sync import run_monitor, restart_monitor
 from check_config import update_config, check_config
@@ -108,6 +108,8 @@ def start_service():
     DisplayHelper()
     # 启动定时服务
     run_scheduler()
+    # 恢复中断的文件转移
+    TransferJournalHelper().recover()
     # 启动监控服务
     run_monitor()
     # 初始化浏览器
@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+import os
+import tempfile
+
+# 未设置配置文件时使用临时目录：配置文件从模板复制，并初始化数据库
+if not os.environ.get("NASTOOL_CONFIG"):
+    os.environ["NASTOOL_CONFIG"] = os.path.join(tempfile.mkdtemp(prefix="nastool-test-"), "config.yaml")
+    from app.db import init_db, update_db
+
+    init_db()
+    update_db()
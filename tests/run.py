@@ -1,11 +1,88 @@
 import unittest
 
+# 未设置NASTOOL_CONFIG时使用临时配置
+import tests.conftest  # noqa: F401
 from tests.test_metainfo import MetaInfoTest
+from tests.test_path_trie import PathTrieTest
+from tests.test_rclone_helper import RcloneHelperTest
+from tests.test_file_debouncer import FileDebouncerTest
+from tests.test_device_thread_pool import DeviceThreadPoolTest, DeviceTest
+from tests.test_mtime_polling_observer import MtimePollingObserverTest
+from tests.test_striped_lock import StripedLockTest
+from tests.test_copy_engine import CopyEngineTest
+from tests.test_token_bucket import TokenBucketTest
+from tests.test_free_space_helper import FreeSpaceHelperTest
+from tests.test_transfer_journal_helper import TransferJournalHelperTest
+from tests.test_tmdb_cache import TMDbCacheTest
+from tests.test_tmdb_limiter import TMDbRateLimiterTest
+from tests.test_filetransfer import FileTransferTest, DiscTransferTest
+from tests.test_sync_index_helper import SyncIndexHelperTest
+from tests.test_sync import SyncReconcileTest
+from tests.test_sync import SyncOnlyLinkTest
+from tests.test_path_utils import PathUtilsTest
+from tests.test_dir_listing_cache import DirListingCacheTest
+from tests.test_subtitle_index import SubtitleIndexTest
+from tests.test_sync_observer import SyncObserverTest
+from tests.test_sync_stats_helper import SyncStatsHelperTest
+from tests.test_tmdb import TMDbThreadLocalTest, TMDbSessionTest
+from tests.test_media import MediaRecognizeTest
 
 if __name__ == '__main__':
     suite = unittest.TestSuite()
+    loader = unittest.defaultTestLoader
     # 测试名称识别
     suite.addTest(MetaInfoTest('test_metainfo'))
+    # 路径前缀树
+    suite.addTest(loader.loadTestsFromTestCase(PathTrieTest))
+    # rclone常驻服务
+    suite.addTest(loader.loadTestsFromTestCase(RcloneHelperTest))
+    # 文件变化防抖
+    suite.addTest(loader.loadTestsFromTestCase(FileDebouncerTest))
+    # 按设备调度的线程池
+    suite.addTest(loader.loadTestsFromTestCase(DeviceThreadPoolTest))
+    suite.addTest(loader.loadTestsFromTestCase(DeviceTest))
+    # 低开销轮询观察者
+    suite.addTest(loader.loadTestsFromTestCase(MtimePollingObserverTest))
+    # 分段锁
+    suite.addTest(loader.loadTestsFromTestCase(StripedLockTest))
+    # 文件复制
+    suite.addTest(loader.loadTestsFromTestCase(CopyEngineTest))
+    # 令牌桶
+    suite.addTest(loader.loadTestsFromTestCase(TokenBucketTest))
+    # 剩余空间台账
+    suite.addTest(loader.loadTestsFromTestCase(FreeSpaceHelperTest))
+    # 文件转移预写日志
+    suite.addTest(loader.loadTestsFromTestCase(TransferJournalHelperTest))
+    # TMDB响应缓存
+    suite.addTest(loader.loadTestsFromTestCase(TMDbCacheTest))
+    # TMDB请求限速
+    suite.addTest(loader.loadTestsFromTestCase(TMDbRateLimiterTest))
+    # 文件转移
+    suite.addTest(loader.loadTestsFromTestCase(FileTransferTest))
+    # 目录监控已处理文件索引
+    suite.addTest(loader.loadTestsFromTestCase(SyncIndexHelperTest))
+    # 目录同步对账
+    suite.addTest(loader.loadTestsFromTestCase(SyncReconcileTest))
+    # 目录同步仅硬链接
+    suite.addTest(loader.loadTestsFromTestCase(SyncOnlyLinkTest))
+    # 目录文件遍历
+    suite.addTest(loader.loadTestsFromTestCase(PathUtilsTest))
+    # 目录列表缓存
+    suite.addTest(loader.loadTestsFromTestCase(DirListingCacheTest))
+    # 字幕目录索引
+    suite.addTest(loader.loadTestsFromTestCase(SubtitleIndexTest))
+    # 原盘目录转移
+    suite.addTest(loader.loadTestsFromTestCase(DiscTransferTest))
+    # 目录监控观察者
+    suite.addTest(loader.loadTestsFromTestCase(SyncObserverTest))
+    # 目录同步统计
+    suite.addTest(loader.loadTestsFromTestCase(SyncStatsHelperTest))
+    # TMDB按线程保存的状态
+    suite.addTest(loader.loadTestsFromTestCase(TMDbThreadLocalTest))
+    # 并发识别
+    suite.addTest(loader.loadTestsFromTestCase(MediaRecognizeTest))
+    # TMDB共用会话
+    suite.addTest(loader.loadTestsFromTestCase(TMDbSessionTest))
 
     # 运行测试
     runner = unittest.TextTestRunner()
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+import errno
+import os
+import shutil
+import tempfile
+from unittest import TestCase, mock
+
+from app.utils import CopyEngine, FileChecksum
+from app.utils import copy_engine
+
+
+def raise_oserror(code):
+    def __raise(*args, **kwargs):
+        raise OSError(code, os.strerror(code))
+
+    return __raise
+
+
+class CopyEngineTest(TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.mkdtemp()
+        self.src = os.path.join(self.temp_dir, "src.mkv")
+        self.data = os.urandom(3 * 1024 * 1024 + 123)
+        with open(self.src, "wb") as f:
+            f.write(self.data)
+        self.dest = os.path.join(self.temp_dir, "dest.mkv")
+        # 小块复制，覆盖多块的情况
+        self.patcher = mock.patch.object(CopyEngine, "CHUNK_SIZE", 1024 * 1024)
+        self.patcher.start()
+
+    def tearDown(self) -> None:
+        self.patcher.stop()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def __read_dest(self):
+        with open(self.dest, "rb") as f:
+            return f.read()
+
+    def __temp_files(self):
+        return [name for name in os.listdir(self.temp_dir) if name.endswith(CopyEngine.TEMP_SUFFIX)]
+
+    def __no_reflink(self):
+        return mock.patch.object(copy_engine.fcntl, "ioctl", side_effect=raise_oserror(errno.EOPNOTSUPP))
+
+    def test_reflink(self):
+        # 模拟文件系统支持reflink，不实际复制数据也不计算校验值
+        hasher = FileChecksum()
+        progress = []
+        with mock.patch.object(copy_engine.fcntl, "ioctl") as ioctl:
+            method = CopyEngine.copy(self.src, self.dest, callback=lambda *args: progress.append(args),
+                                     hasher=hasher)
+        self.assertEqual(method, "reflink")
+        self.assertEqual(ioctl.call_args[0][1], CopyEngine._FICLONE)
+        self.assertEqual(progress, [(len(self.data), len(self.data))])
+        self.assertIsNone(hasher.get_value())
+        self.assertTrue(os.path.exists(self.dest))
+        self.assertEqual(self.__temp_files(), [])
+
+    def test_copy_file_range(self):
+        if not hasattr(os, "copy_file_range"):
+            self.skipTest("os.copy_file_range不可用")
+        progress = []
+        with self.__no_reflink():
+            method = CopyEngine.copy(self.src, self.dest, callback=lambda *args: progress.append(args))
+        self.assertEqual(method, "copy_file_range")
+        self.assertEqual(self.__read_dest(), self.data)
+        self.assertEqual(progress[-1], (len(self.data), len(self.data)))
+        self.assertEqual(len(progress), 4)
+        self.assertEqual(os.stat(self.dest).st_mtime_ns, os.stat(self.src).st_mtime_ns)
+
+    def test_checksum(self):
+        # 计算校验值时不使用内核复制，按块读写同时计算，不再读取临时文件
+        hasher = FileChecksum()
+        with self.__no_reflink(), \
+                mock.patch.object(os, "copy_file_range", create=True) as copy_file_range, \
+                mock.patch.object(os, "sendfile", create=True) as sendfile, \
+                mock.patch("builtins.open", wraps=open) as opened:
+            method = CopyEngine.copy(self.src, self.dest, hasher=hasher)
+        self.assertEqual(method, "chunk")
+        copy_file_range.assert_not_called()
+        sendfile.assert_not_called()
+        self.assertEqual(len(opened.call_args_list), 2)
+        self.assertEqual(self.__read_dest(), self.data)
+        expected = FileChecksum()
+        expected.update(self.data)
+        expected.computed = True
+        self.assertEqual(hasher.get_value(), expected.get_value())
+
+    def test_chunk(self):
+        hasher = FileChecksum()
+        limits = []
+        with self.__no_reflink(), \
+                mock.patch.object(os, "copy_file_range", side_effect=raise_oserror(errno.ENOSYS), create=True), \
+                mock.patch.object(os, "sendfile", side_effect=raise_oserror(errno.EINVAL), create=True):
+            method = CopyEngine.copy(self.src, self.dest, hasher=hasher, limiter=limits.append)
+        self.assertEqual(method, "chunk")
+        self.assertEqual(self.__read_dest(), self.data)
+        # 按块读写时每块数据都限速
+        self.assertEqual(sum(limits), len(self.data))
+        expected = FileChecksum()
+        expected.update(self.data)
+        expected.computed = True
+        self.assertEqual(hasher.get_value(), expected.get_value())
+        self.assertTrue(hasher.get_value().startswith("blake2b:"))
+
+    def test_fallback(self):
+        # 内核复制不支持时回退为按块读写
+        with self.__no_reflink(), \
+                mock.patch.object(os, "copy_file_range", side_effect=raise_oserror(errno.ENOSYS), create=True), \
+                mock.patch.object(os, "sendfile", side_effect=raise_oserror(errno.EINVAL), create=True):
+            method = CopyEngine.copy(self.src, self.dest)
+        self.assertEqual(method, "chunk")
+        self.assertEqual(self.__read_dest(), self.data)
+        self.assertEqual(self.__temp_files(), [])
+
+    def test_sendfile_enotsock(self):
+        # macOS的sendfile不支持文件到文件，返回ENOTSOCK时回退为按块读写
+        with self.__no_reflink(), \
+                mock.patch.object(CopyEngine, "_SENDFILE_FILE", True), \
+                mock.patch.object(os, "copy_file_range", side_effect=raise_oserror(errno.ENOSYS), create=True), \
+                mock.patch.object(os, "sendfile", side_effect=raise_oserror(errno.ENOTSOCK), create=True):
+            method = CopyEngine.copy(self.src, self.dest)
+        self.assertEqual(method, "chunk")
+        self.assertEqual(self.__read_dest(), self.data)
+
+    def test_sendfile_not_linux(self):
+        # 非Linux系统不尝试sendfile
+        with self.__no_reflink(), \
+                mock.patch.object(CopyEngine, "_SENDFILE_FILE", False), \
+                mock.patch.object(os, "copy_file_range", side_effect=raise_oserror(errno.ENOSYS), create=True), \
+                mock.patch.object(os, "sendfile", create=True) as sendfile:
+            method = CopyEngine.copy(self.src, self.dest)
+        self.assertEqual(method, "chunk")
+        sendfile.assert_not_called()
+
+    def test_cancel(self):
+        # 复制取消时删除临时文件，不生成目标文件
+        with self.__no_reflink():
+            self.assertRaises(InterruptedError, CopyEngine.copy, self.src, self.dest,
+                              callback=lambda copied, total: copied < total / 2)
+        self.assertFalse(os.path.exists(self.dest))
+        self.assertEqual(self.__temp_files(), [])
+
+    def test_error(self):
+        # 已写入数据后出错不回退，删除临时文件
+        with self.__no_reflink(), \
+                mock.patch.object(CopyEngine, "_CopyEngine__progress", side_effect=OSError(errno.EIO, "io error")):
+            self.assertRaises(OSError, CopyEngine.copy, self.src, self.dest)
+        self.assertFalse(os.path.exists(self.dest))
+        self.assertEqual(self.__temp_files(), [])
+
+    def test_overwrite(self):
+        with open(self.dest, "wb") as f:
+            f.write(b"old")
+        with self.__no_reflink():
+            CopyEngine.copy(self.src, self.dest)
+        self.assertEqual(self.__read_dest(), self.data)
+        self.assertEqual(self.__temp_files(), [])
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+import os
+import tempfile
+import threading
+import time
+from unittest import TestCase, mock
+
+from app.helper.thread_helper import DeviceThreadPool
+
+
+class DeviceThreadPoolTest(TestCase):
+    def setUp(self) -> None:
+        # 以路径的第一级目录模拟设备
+        self.patcher = mock.patch.object(DeviceThreadPool, "get_device",
+                                         staticmethod(lambda path: path.strip("/").split("/")[0] if path else None))
+        self.patcher.start()
+        self.pool = DeviceThreadPool(max_workers=4)
+        self.lock = threading.Lock()
+        self.running = {}
+        self.max_running = {}
+
+    def tearDown(self) -> None:
+        self.pool.shutdown()
+        self.patcher.stop()
+
+    def __task(self, device, seconds=0.05):
+        with self.lock:
+            self.running[device] = self.running.get(device, 0) + 1
+            self.max_running[device] = max(self.max_running.get(device, 0), self.running[device])
+        time.sleep(seconds)
+        with self.lock:
+            self.running[device] -= 1
+        return device
+
+    def test_same_device(self):
+        futures = [self.pool.submit(self.__task, "disk1", paths=["/disk1/a/%s.mkv" % i]) for i in range(4)]
+        self.assertEqual([future.result(timeout=5) for future in futures], ["disk1"] * 4)
+        self.assertEqual(self.max_running.get("disk1"), 1)
+
+    def test_different_devices(self):
+        barrier = threading.Barrier(2, timeout=2)
+
+        def __wait():
+            # 两个设备的任务同时执行时才能通过
+            barrier.wait()
+            return True
+
+        futures = [self.pool.submit(__wait, paths=["/disk1/a.mkv"]),
+                   self.pool.submit(__wait, paths=["/disk2/a.mkv"])]
+        self.assertEqual([future.result(timeout=5) for future in futures], [True, True])
+
+    def test_shared_device(self):
+        # 源、目的设备任一相同时都需等待
+        futures = [self.pool.submit(self.__task, "disk1", paths=["/disk1/a.mkv", "/disk2/a.mkv"]),
+                   self.pool.submit(self.__task, "disk1", paths=["/disk3/a.mkv", "/disk1/b.mkv"])]
+        for future in futures:
+            future.result(timeout=5)
+        self.assertEqual(self.max_running.get("disk1"), 1)
+
+    def test_no_paths(self):
+        futures = [self.pool.submit(self.__task, "none", 0.1) for _ in range(3)]
+        for future in futures:
+            future.result(timeout=5)
+        self.assertEqual(self.max_running.get("none"), 3)
+
+    def test_exception(self):
+        def __fail():
+            raise ValueError("failed")
+
+        future = self.pool.submit(__fail, paths=["/disk1/a.mkv"])
+        self.assertRaises(ValueError, future.result, 5)
+        # 失败后设备释放
+        self.assertEqual(self.pool.submit(self.__task, "disk1", paths=["/disk1/b.mkv"]).result(timeout=5), "disk1")
+        self.assertEqual(self.pool.get_queue_size(), 0)
+
+    def test_shutdown(self):
+        first = self.pool.submit(self.__task, "disk1", 0.2, paths=["/disk1/a.mkv"])
+        second = self.pool.submit(self.__task, "disk1", paths=["/disk1/b.mkv"])
+        self.pool.shutdown()
+        self.assertEqual(first.result(timeout=5), "disk1")
+        self.assertTrue(second.cancelled())
+
+
+class DeviceTest(TestCase):
+    def test_get_device(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            device = os.stat(temp_dir).st_dev
+            self.assertEqual(DeviceThreadPool.get_device(temp_dir), device)
+            # 不存在的路径按已存在的上级目录
+            self.assertEqual(DeviceThreadPool.get_device(os.path.join(temp_dir, "none", "a.mkv")), device)
+            self.assertIsNone(DeviceThreadPool.get_device(None))
+        finally:
+            os.rmdir(temp_dir)
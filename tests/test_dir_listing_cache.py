@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+import contextlib
+import os
+import shutil
+import tempfile
+from unittest import TestCase, mock
+
+from app.utils import DirListingCache
+
+
+class DirListingCacheTest(TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.mkdtemp()
+        self.cache = DirListingCache()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def __write(self, name):
+        path = os.path.join(self.temp_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(b"x")
+        return path
+
+    def test_exists(self):
+        path = self.__write("a.mkv")
+        self.assertTrue(self.cache.exists(path))
+        self.assertFalse(self.cache.exists(os.path.join(self.temp_dir, "b.mkv")))
+        self.assertFalse(self.cache.exists(os.path.join(self.temp_dir, "none", "a.mkv")))
+        # 每个目录只列出一次
+        with mock.patch.object(os, "scandir") as scandir:
+            self.assertTrue(self.cache.exists(path))
+            scandir.assert_not_called()
+
+    def test_find_file(self):
+        self.__write("a.ass")
+        self.__write("a.srt")
+        stem = os.path.join(self.temp_dir, "a")
+        self.assertEqual(self.cache.find_file(stem, [".srt", ".ass"]), stem + ".srt")
+        self.assertEqual(self.cache.find_file(stem, [".ass", ".srt"]), stem + ".ass")
+        self.assertIsNone(self.cache.find_file(stem, [".sup"]))
+        self.assertIsNone(self.cache.find_file(os.path.join(self.temp_dir, "b"), [".srt"]))
+
+    def test_invalidate(self):
+        self.__write("Show/S01/a.mkv")
+        season_dir = os.path.join(self.temp_dir, "Show", "S01")
+        new_file = os.path.join(season_dir, "b.mkv")
+        self.assertFalse(self.cache.exists(new_file))
+        self.assertTrue(self.cache.exists(season_dir))
+        self.__write("Show/S01/b.mkv")
+        self.assertFalse(self.cache.exists(new_file))
+        # 清除该目录及上级目录的缓存
+        self.cache.invalidate(new_file)
+        self.assertTrue(self.cache.exists(new_file))
+        self.assertTrue(self.cache.exists(season_dir))
+
+    def test_invalidate_during_listing(self):
+        # 列目录期间其它线程写入并失效，本次结果不缓存，下次重新列出
+        self.__write("a.mkv")
+        new_file = os.path.join(self.temp_dir, "b.mkv")
+        scandir = os.scandir
+
+        def __scandir(path):
+            with scandir(path) as entries:
+                entries = list(entries)
+            self.__write("b.mkv")
+            self.cache.invalidate(new_file)
+            return contextlib.nullcontext(entries)
+
+        with mock.patch.object(os, "scandir", side_effect=__scandir):
+            self.cache.exists(new_file)
+        self.assertTrue(self.cache.exists(new_file))
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import time
+from unittest import TestCase
+
+from app.utils import FileDebouncer
+
+
+class FileDebouncerTest(TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.mkdtemp()
+        self.released = []
+        self.debouncer = FileDebouncer(lambda path, *args: self.released.append((path, args)),
+                                       window=0.2, interval=0.05)
+
+    def tearDown(self) -> None:
+        self.debouncer.stop()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def __write(self, name, data=b"x"):
+        path = os.path.join(self.temp_dir, name)
+        with open(path, "ab") as f:
+            f.write(data)
+        return path
+
+    def __check(self):
+        self.debouncer._FileDebouncer__check()
+
+    def test_touch(self):
+        path = self.__write("a.mkv")
+        self.assertTrue(self.debouncer.touch(path, "mon"))
+        self.assertFalse(self.debouncer.touch(path, "mon"))
+        self.assertEqual(self.debouncer.get_pending_count(), 1)
+        self.assertTrue(self.debouncer.has_pending(self.temp_dir))
+        self.assertFalse(self.debouncer.has_pending(os.path.dirname(self.temp_dir)))
+
+    def test_stable(self):
+        path = self.__write("a.mkv")
+        self.debouncer.touch(path, "mon")
+        self.__check()
+        self.assertEqual(self.released, [])
+        time.sleep(0.25)
+        self.__check()
+        self.assertEqual(self.released, [(path, ("mon",))])
+        self.assertEqual(self.debouncer.get_pending_paths(), [])
+
+    def test_growing(self):
+        path = self.__write("a.mkv")
+        self.debouncer.touch(path)
+        self.__check()
+        time.sleep(0.25)
+        # 文件仍在写入，重新计时
+        self.__write("a.mkv", b"more")
+        self.__check()
+        self.assertEqual(self.released, [])
+        time.sleep(0.25)
+        self.__check()
+        self.assertEqual([item[0] for item in self.released], [path])
+
+    def test_removed(self):
+        path = self.__write("a.mkv")
+        self.debouncer.touch(path)
+        os.remove(path)
+        self.__check()
+        self.assertEqual(self.debouncer.get_pending_count(), 0)
+        self.assertEqual(self.released, [])
+
+    def test_thread(self):
+        path = self.__write("a.mkv")
+        self.debouncer.start()
+        self.debouncer.touch(path)
+        deadline = time.time() + 3
+        while not self.released and time.time() < deadline:
+            time.sleep(0.05)
+        self.assertEqual([item[0] for item in self.released], [path])
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+import errno
+import os
+import shutil
+import tempfile
+from unittest import TestCase, mock
+
+from app.db.models import TRANSFERHISTORY
+from app.filetransfer import FileTransfer
+from app.helper import DbHelper, IoThrottleHelper, RcloneHelper
+from app.media.meta import MetaInfo
+from app.utils import FileChecksum
+from app.utils import copy_engine
+from app.utils.types import MediaType, SyncType, RmtMode
+
+
+class FileTransferTest(TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.mkdtemp()
+        self.src_dir = os.path.join(self.temp_dir, "Show.S01")
+        self.dest_dir = os.path.join(self.temp_dir, "library")
+        os.makedirs(self.src_dir)
+        os.makedirs(self.dest_dir)
+        for episode in range(1, 4):
+            with open(os.path.join(self.src_dir, "Show.S01E0%s.1080p.mkv" % episode), "wb") as f:
+                f.write(b"x" * 1024)
+        self.filetransfer = FileTransfer()
+        # 识别出的文件清单
+        self.file_list = []
+        self.patchers = [
+            mock.patch.object(self.filetransfer.media, "iter_media_info_on_files", side_effect=self.__recognize),
+            mock.patch.object(self.filetransfer.media, "get_tmdb_info", return_value={"id": 1}),
+            mock.patch.object(self.filetransfer, "dbhelper"),
+            mock.patch.object(self.filetransfer, "journal"),
+            mock.patch.object(self.filetransfer, "message"),
+            mock.patch.object(self.filetransfer, "threadhelper"),
+            mock.patch.object(self.filetransfer, "_scraper_flag", False),
+            mock.patch.object(self.filetransfer, "_refresh_mediaserver", False)
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+        self.filetransfer.journal.begin.side_effect = lambda src, **kwargs: "jid-%s" % os.path.basename(src)
+
+    def tearDown(self) -> None:
+        for patcher in reversed(self.patchers):
+            patcher.stop()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def __recognize(self, file_list, *args, **kwargs):
+        self.file_list = list(file_list)
+        for file_item in file_list:
+            media = MetaInfo(os.path.basename(file_item))
+            media.type = MediaType.TV
+            media.tmdb_info = {"id": 1}
+            media.tmdb_id = 1
+            media.title = "Show"
+            media.year = "2020"
+            media.category = ""
+            yield file_item, media
+
+    def __list_dest(self):
+        return sorted(os.path.relpath(os.path.join(root, name), self.dest_dir)
+                      for root, _, names in os.walk(self.dest_dir) for name in names)
+
+    def __transfer(self, **kwargs):
+        return self.filetransfer.transfer_media(in_from=SyncType.MAN,
+                                                in_path=self.src_dir,
+                                                rmt_mode=RmtMode.COPY,
+                                                target_dir=self.dest_dir,
+                                                min_filesize=0,
+                                                **kwargs)
+
+    def test_preview(self):
+        # 预览返回完整的计划，不修改文件系统
+        status, message, plan = self.filetransfer.preview_media(in_from=SyncType.MAN,
+                                                                in_path=self.src_dir,
+                                                                rmt_mode=RmtMode.COPY,
+                                                                target_dir=self.dest_dir,
+                                                                min_filesize=0)
+        self.assertTrue(status)
+        self.assertEqual(len(plan), 3)
+        self.assertEqual({item.get("action") for item in plan}, {"transfer"})
+        self.assertEqual(sorted(os.path.basename(item.get("target_file")) for item in plan),
+                         ["Show - S01E0%s - 第%s集.mkv" % (i, i) for i in range(1, 4)])
+        self.assertEqual(os.listdir(self.dest_dir), [])
+        self.filetransfer.journal.begin.assert_not_called()
+        self.filetransfer.dbhelper.insert_transfer_histories.assert_not_called()
+
+    def test_transfer(self):
+        self.assertEqual(self.__transfer(), (True, ""))
+        self.assertEqual(len(self.__list_dest()), 3)
+        self.assertEqual(len(self.filetransfer.dbhelper.insert_transfer_histories.call_args[0][0]), 3)
+        self.filetransfer.journal.complete_dir.assert_called_once_with(self.src_dir, self.dest_dir, RmtMode.COPY)
+
+    def test_transfer_checksum(self):
+        # 开启转移校验值时复制的文件记录校验值到转移历史
+        dbhelper = DbHelper()
+        self.filetransfer.dbhelper.insert_transfer_histories.side_effect = dbhelper.insert_transfer_histories
+        with mock.patch.object(self.filetransfer, "_transfer_checksum", True), \
+                mock.patch.object(copy_engine.fcntl, "ioctl", side_effect=OSError(errno.EOPNOTSUPP, "reflink")):
+            self.assertEqual(self.__transfer(), (True, ""))
+        rows = dbhelper._db.query(TRANSFERHISTORY).filter(TRANSFERHISTORY.SOURCE_PATH == self.src_dir).all()
+        try:
+            self.assertEqual(len(rows), 3)
+            expected = FileChecksum()
+            expected.update(b"x" * 1024)
+            expected.computed = True
+            self.assertEqual({row.CHECKSUM for row in rows}, {expected.get_value()})
+        finally:
+            for row in rows:
+                dbhelper.delete_transfer_log_by_id(row.ID)
+
+    def test_remote_bwlimit(self):
+        # Rclone远程转移按源文件所在设备的目录限速配置限速
+        throttle = IoThrottleHelper()
+        src_file = os.path.join(self.src_dir, "Show.S01E01.1080p.mkv")
+        with mock.patch.object(throttle, "_default_limit", 0), \
+                mock.patch.object(throttle, "_schedule_limits", []), \
+                mock.patch.object(throttle, "_path_limits", [(self.src_dir, 5 * 1024 * 1024)]), \
+                mock.patch.object(RcloneHelper(), "transfer", return_value=(0, "")) as transfer:
+            ret = self.filetransfer._FileTransfer__transfer_command(src_file, "/remote/a.mkv", RmtMode.RCLONECOPY)
+        self.assertEqual(ret, 0)
+        self.assertEqual(transfer.call_args.kwargs.get("bwlimit"), 5 * 1024 * 1024)
+
+    def test_transfer_exception(self):
+        # 转移出错的文件按失败处理，目录不登记为已完整处理
+        def __transfer_file(file_item, new_file, rmt_mode, over_flag=False):
+            if file_item == self.file_list[0]:
+                raise OSError("disk error")
+            shutil.copy(file_item, new_file)
+            return 0
+
+        with mock.patch.object(self.filetransfer, "_FileTransfer__transfer_file", side_effect=__transfer_file):
+            status, message = self.__transfer()
+        self.assertFalse(status)
+        self.assertIn("disk error", message)
+        self.assertEqual(len(self.__list_dest()), 2)
+        self.filetransfer.journal.complete_dir.assert_not_called()
+        self.filetransfer.message.send_transfer_fail_message.assert_called_once()
+
+    def test_udf_failure(self):
+        # 自定义转移失败即停止，已转移的文件仍登记转移记录
+        def __transfer_file(file_item, new_file, rmt_mode, over_flag=False):
+            if file_item == self.file_list[-1]:
+                return 1
+            shutil.copy(file_item, new_file)
+            return 0
+
+        with mock.patch.object(self.filetransfer, "_FileTransfer__transfer_file", side_effect=__transfer_file):
+            status, message = self.__transfer(udf_flag=True)
+        self.assertFalse(status)
+        histories = self.filetransfer.dbhelper.insert_transfer_histories.call_args[0][0]
+        self.assertEqual(sorted(history.get("in_path") for history in histories), sorted(self.file_list[:-1]))
+        self.filetransfer.journal.commit.assert_called_once_with(
+            ["jid-%s" % os.path.basename(file_item) for file_item in self.file_list[:-1]])
+        self.filetransfer.journal.complete_dir.assert_not_called()
+
+
+class DiscTransferTest(TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.mkdtemp()
+        self.src_dir = os.path.join(self.temp_dir, "Movie.2020.BluRay")
+        self.dest_dir = os.path.join(self.temp_dir, "library", "Movie (2020)")
+        self.files = {"BDMV/index.bdmv": 10,
+                      "BDMV/MovieObject.bdmv": 10,
+                      "BDMV/PLAYLIST/00000.mpls": 10,
+                      "BDMV/STREAM/00000.m2ts": 4096,
+                      "BDMV/STREAM/00001.m2ts": 4096,
+                      "CERTIFICATE/id.bdmv": 10}
+        for name, size in self.files.items():
+            path = os.path.join(self.src_dir, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(b"x" * size)
+        os.makedirs(os.path.dirname(self.dest_dir))
+        self.filetransfer = FileTransfer()
+        self.patchers = [
+            mock.patch.object(self.filetransfer, "dbhelper"),
+            # 小于1K的为小文件
+            mock.patch("app.filetransfer.RMT_DISC_SMALL_FILE_SIZE", 1024)
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def tearDown(self) -> None:
+        for patcher in reversed(self.patchers):
+            patcher.stop()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    @staticmethod
+    def __list_files(path):
+        return sorted(os.path.relpath(os.path.join(root, name), path)
+                      for root, _, names in os.walk(path) for name in names)
+
+    def __staging_dirs(self):
+        return [name for name in os.listdir(os.path.dirname(self.dest_dir)) if name.startswith(".")]
+
+    def __transfer(self, rmt_mode):
+        return self.filetransfer._FileTransfer__transfer_bluray_dir(self.src_dir, self.dest_dir, rmt_mode)
+
+    def test_commit(self):
+        self.assertEqual(self.__transfer(RmtMode.COPY), 0)
+        self.assertEqual(self.__list_files(self.dest_dir), sorted(self.files))
+        self.assertEqual(self.__list_files(self.src_dir), sorted(self.files))
+        self.assertEqual(self.__staging_dirs(), [])
+        self.filetransfer.dbhelper.insert_transfer_blacklist.assert_called_once_with(self.src_dir)
+
+    def test_commit_merge(self):
+        # 目的目录已有的文件保留，其它文件合并进去
+        exist_file = os.path.join(self.dest_dir, "BDMV", "index.bdmv")
+        os.makedirs(os.path.dirname(exist_file))
+        with open(exist_file, "wb") as f:
+            f.write(b"old")
+        self.assertEqual(self.__transfer(RmtMode.COPY), 0)
+        self.assertEqual(self.__list_files(self.dest_dir), sorted(self.files))
+        with open(exist_file, "rb") as f:
+            self.assertEqual(f.read(), b"old")
+        self.assertEqual(self.__staging_dirs(), [])
+
+    def test_rollback(self):
+        # 大文件移动失败时已移动的文件移回原目录，目的目录不留下不完整的原盘
+        transfer_command = self.filetransfer._FileTransfer__transfer_command
+
+        def __transfer_command(file_item, target_file, rmt_mode, **kwargs):
+            if file_item.endswith("00001.m2ts"):
+                return 1
+            return transfer_command(file_item, target_file, rmt_mode, **kwargs)
+
+        with mock.patch.object(self.filetransfer, "_FileTransfer__transfer_command", side_effect=__transfer_command):
+            self.assertNotEqual(self.__transfer(RmtMode.MOVE), 0)
+        self.assertFalse(os.path.exists(self.dest_dir))
+        self.assertEqual(self.__list_files(self.src_dir), sorted(self.files))
+        self.assertEqual(self.__staging_dirs(), [])
+        self.filetransfer.dbhelper.insert_transfer_blacklist.assert_not_called()
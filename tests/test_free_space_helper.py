@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+import shutil
+import tempfile
+from collections import namedtuple
+from unittest import TestCase, mock
+
+from app.helper import FreeSpaceHelper
+from app.helper import free_space_helper
+
+DiskUsage = namedtuple("DiskUsage", ["total", "used", "free"])
+
+GB = 1024 ** 3
+
+
+class FreeSpaceHelperTest(TestCase):
+    def setUp(self) -> None:
+        self.helper = FreeSpaceHelper()
+        self.helper._devices = {}
+        self.helper._reservations = {}
+        self.temp_dir = tempfile.mkdtemp()
+        self.free = 10 * GB
+        self.disk_usage_calls = 0
+        self.patcher = mock.patch.object(free_space_helper.shutil, "disk_usage", side_effect=self.__disk_usage)
+        self.patcher.start()
+
+    def tearDown(self) -> None:
+        self.patcher.stop()
+        self.helper._devices = {}
+        self.helper._reservations = {}
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def __disk_usage(self, path):
+        self.disk_usage_calls += 1
+        return DiskUsage(100 * GB, 100 * GB - self.free, self.free)
+
+    def test_reserve_release(self):
+        self.assertEqual(self.helper.get_free(self.temp_dir), 10 * GB)
+        self.helper.reserve(self.temp_dir, 3 * GB, key="a.mkv")
+        self.helper.reserve(self.temp_dir, 2 * GB, key="b.mkv")
+        self.assertEqual(self.helper.get_free(self.temp_dir), 5 * GB)
+        # 同一标识重复预占时先释放原预占
+        self.helper.reserve(self.temp_dir, 1 * GB, key="a.mkv")
+        self.assertEqual(self.helper.get_free(self.temp_dir), 7 * GB)
+        # 转移失败，释放后恢复
+        self.helper.release("a.mkv")
+        self.assertEqual(self.helper.get_free(self.temp_dir), 8 * GB)
+        self.helper.release("a.mkv")
+        self.assertEqual(self.helper.get_free(self.temp_dir), 8 * GB)
+
+    def test_release_written(self):
+        self.helper.reserve(self.temp_dir, 3 * GB, key="a.mkv")
+        # 已写入，刷新前从缓存的剩余空间中扣除
+        self.helper.release("a.mkv", written=True)
+        self.assertEqual(self.helper.get_free(self.temp_dir), 7 * GB)
+        self.assertEqual(self.disk_usage_calls, 1)
+        stats = self.helper.get_stats()
+        self.assertEqual(stats[0].get("free"), 7 * GB)
+        self.assertEqual(stats[0].get("reserved"), 0)
+
+    def test_refresh(self):
+        self.helper.get_free(self.temp_dir)
+        self.free = 20 * GB
+        # 刷新间隔内使用缓存
+        self.assertEqual(self.helper.get_free(self.temp_dir), 10 * GB)
+        with mock.patch.object(free_space_helper, "FREE_SPACE_REFRESH_INTERVAL", 0):
+            self.assertEqual(self.helper.get_free(self.temp_dir), 20 * GB)
+
+    def test_select(self):
+        other_dir = tempfile.mkdtemp()
+        try:
+            # 两个目录在同一设备，预占后第二次选择时空间不足
+            self.assertEqual(self.helper.select([self.temp_dir, other_dir], 6 * GB, key="a.mkv"), self.temp_dir)
+            self.assertIsNone(self.helper.select([self.temp_dir, other_dir], 6 * GB, key="b.mkv"))
+            self.assertEqual(self.helper.select([other_dir, self.temp_dir], 3 * GB), other_dir)
+            # 没有标识时不预占
+            self.assertEqual(self.helper.get_free(self.temp_dir), 4 * GB)
+        finally:
+            shutil.rmtree(other_dir, ignore_errors=True)
+
+    def test_invalid(self):
+        self.assertEqual(self.helper.get_free(None), 0)
+        self.assertEqual(self.helper.get_free("/not/exists/path"), 0)
+        self.helper.reserve("/not/exists/path", GB, key="a.mkv")
+        self.helper.reserve(self.temp_dir, 0, key="b.mkv")
+        self.assertEqual(self.helper._reservations, {})
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+from unittest import TestCase, mock
+
+from app.media import Media
+from app.media.tmdbv3api import TMDbRateLimiter
+
+
+class MediaRecognizeTest(TestCase):
+    def setUp(self) -> None:
+        self.media = Media()
+        self.file_list = ["/downloads/Show.S01E0%s.mkv" % i for i in range(1, 7)]
+        self.lock = threading.Lock()
+        self.running = 0
+        self.max_running = 0
+        self.recognized = []
+        self.patchers = [
+            mock.patch.object(self.media, "tmdb", mock.Mock(limiter=TMDbRateLimiter())),
+            mock.patch.object(self.media, "get_media_info_on_file", side_effect=self.__recognize)
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+
+    def tearDown(self) -> None:
+        for patcher in reversed(self.patchers):
+            patcher.stop()
+
+    def __recognize(self, file_path, *args):
+        with self.lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+        # 前面的文件识别得慢
+        time.sleep(0.02 * (len(self.file_list) - self.file_list.index(file_path)))
+        with self.lock:
+            self.running -= 1
+            self.recognized.append(file_path)
+        # 第二个文件未识别出有效信息
+        return None if file_path == self.file_list[1] else "meta-%s" % file_path
+
+    def test_order(self):
+        # 并发识别，按文件清单顺序返回，未识别出的文件不返回
+        results = list(self.media.iter_media_info_on_files(self.file_list, max_workers=3))
+        self.assertEqual([file_path for file_path, _ in results],
+                         [file_path for file_path in self.file_list if file_path != self.file_list[1]])
+        self.assertEqual([meta for _, meta in results], ["meta-%s" % file_path for file_path, _ in results])
+        self.assertGreater(self.max_running, 1)
+        self.assertLessEqual(self.max_running, 3)
+
+    def test_stop_early(self):
+        # 调用方提前结束时不再识别后续文件
+        iterator = self.media.iter_media_info_on_files(self.file_list, max_workers=1)
+        self.assertEqual(next(iterator)[0], self.file_list[0])
+        iterator.close()
+        time.sleep(0.3)
+        self.assertLess(len(self.recognized), len(self.file_list))
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import TestCase
+
+from watchdog.events import FileSystemEventHandler
+
+from app.utils import MtimePollingObserver
+
+
+class EventCollector(FileSystemEventHandler):
+    def __init__(self):
+        self.events = []
+        self.lock = threading.Lock()
+
+    def on_any_event(self, event):
+        with self.lock:
+            self.events.append((event.event_type, event.src_path, getattr(event, "dest_path", "")))
+
+    def wait_for(self, event_type, path, timeout=3):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            with self.lock:
+                for event in self.events:
+                    if event[0] == event_type and path in event[1:]:
+                        return event
+            time.sleep(0.02)
+        return None
+
+
+class MtimePollingObserverTest(TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.temp_dir, "tv"))
+        self.collector = EventCollector()
+        self.observer = MtimePollingObserver(timeout=0.05, cold_interval=0.2)
+        self.observer.schedule(self.collector, self.temp_dir, recursive=True)
+        self.observer.start()
+        # 等待首次登记目录
+        time.sleep(0.3)
+
+    def tearDown(self) -> None:
+        self.observer.stop()
+        self.observer.join(timeout=5)
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def __write(self, path, data=b"x"):
+        with open(path, "ab") as f:
+            f.write(data)
+
+    def test_created(self):
+        path = os.path.join(self.temp_dir, "tv", "a.mkv")
+        self.__write(path)
+        self.assertIsNotNone(self.collector.wait_for("created", path))
+
+    def test_new_dir(self):
+        # 新目录下已有的文件也生成创建事件
+        new_dir = os.path.join(self.temp_dir, "movie")
+        os.makedirs(new_dir)
+        path = os.path.join(new_dir, "b.mkv")
+        self.__write(path)
+        self.assertIsNotNone(self.collector.wait_for("created", new_dir))
+        self.assertIsNotNone(self.collector.wait_for("created", path))
+
+    def test_moved_deleted(self):
+        path = os.path.join(self.temp_dir, "tv", "a.mkv")
+        self.__write(path)
+        self.assertIsNotNone(self.collector.wait_for("created", path))
+        new_path = os.path.join(self.temp_dir, "tv", "b.mkv")
+        os.rename(path, new_path)
+        self.assertEqual(self.collector.wait_for("moved", new_path), ("moved", path, new_path))
+        os.remove(new_path)
+        self.assertIsNotNone(self.collector.wait_for("deleted", new_path))
+
+    def test_no_change(self):
+        # 没有变化时不生成事件
+        time.sleep(0.5)
+        self.assertEqual(self.collector.events, [])
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+import os
+from unittest import TestCase
+
+from app.utils import PathTrie
+
+
+class PathTrieTest(TestCase):
+    def setUp(self) -> None:
+        self.trie = PathTrie()
+        self.trie.add("/media/downloads", "sync")
+        self.trie.add("/media/downloads/tv", "sync")
+        self.trie.add("/media/downloads/tv", "exclude")
+        self.trie.add("/media/library", "library")
+
+    def tearDown(self) -> None:
+        pass
+
+    def test_lookup(self):
+        roots = [root for root, _ in self.trie.lookup("/media/downloads/tv/Show/S01E01.mkv")]
+        self.assertEqual(roots, [os.path.normpath("/media/downloads"), os.path.normpath("/media/downloads/tv")])
+        self.assertEqual(self.trie.lookup("/media/other/file.mkv"), [])
+        # 名称前缀相同但不是子目录
+        self.assertEqual(self.trie.lookup("/media/downloads2/file.mkv"), [])
+
+    def test_match(self):
+        self.assertEqual(self.trie.match("/media/downloads/tv/Show/S01E01.mkv"),
+                         os.path.normpath("/media/downloads/tv"))
+        self.assertEqual(self.trie.match("/media/downloads/tv/Show/S01E01.mkv", tag="exclude"),
+                         os.path.normpath("/media/downloads/tv"))
+        self.assertEqual(self.trie.match("/media/downloads/movie/a.mkv", tag="sync"),
+                         os.path.normpath("/media/downloads"))
+        self.assertIsNone(self.trie.match("/media/downloads/movie/a.mkv", tag="library"))
+
+    def test_find_under(self):
+        roots = sorted(root for root, _ in self.trie.find_under("/media/downloads"))
+        self.assertEqual(roots, [os.path.normpath("/media/downloads"), os.path.normpath("/media/downloads/tv")])
+        self.assertEqual(len(self.trie.find_under("/media")), 3)
+        self.assertEqual(self.trie.find_under("/media/none"), [])
+
+    def test_remove(self):
+        self.assertEqual(len(self.trie), 3)
+        self.assertTrue(self.trie.remove("/media/downloads/tv"))
+        self.assertFalse(self.trie.remove("/media/downloads/tv"))
+        self.assertEqual(len(self.trie), 2)
+        self.assertEqual(self.trie.match("/media/downloads/tv/a.mkv"), os.path.normpath("/media/downloads"))
+        self.assertTrue(self.trie.remove("/media/library"))
+        self.assertEqual(self.trie.find_under("/media/library"), [])
+        self.trie.clear()
+        self.assertEqual(len(self.trie), 0)
+        self.assertEqual(self.trie.lookup("/media/downloads/a.mkv"), [])
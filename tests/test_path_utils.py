@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+from unittest import TestCase, mock
+
+from app.utils import PathUtils
+
+
+class PathUtilsTest(TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.mkdtemp()
+        self.root = os.path.join(self.temp_dir, "downloads")
+        for name, size in [("a.mkv", 100),
+                           ("small.mkv", 1),
+                           ("a.nfo", 100),
+                           ("Show/S01/Show.S01E01.mp4", 100),
+                           ("Show/S01/Show.S01E02.MKV", 100),
+                           ("Show/.cache/b.mkv", 100),
+                           ("@Recycle/c.mkv", 100),
+                           ("#recycle/d.mkv", 100),
+                           ("Show/@eaDir/e.mkv", 100),
+                           ("Show/.f.mkv", 100)]:
+            path = os.path.join(self.root, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(b"x" * size)
+        # 链接的目录不进入
+        outside = os.path.join(self.temp_dir, "outside")
+        os.makedirs(outside)
+        with open(os.path.join(outside, "g.mkv"), "wb") as f:
+            f.write(b"x" * 100)
+        os.symlink(outside, os.path.join(self.root, "link"))
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    @staticmethod
+    def __walk_files(in_path, exts="", filesize=0, episode_format=None):
+        """
+        原os.walk实现，作为对照
+        """
+        ret_list = []
+        for root, dirs, files in os.walk(in_path):
+            for file in files:
+                cur_path = os.path.join(root, file)
+                if PathUtils.is_invalid_path(cur_path):
+                    continue
+                if episode_format and not episode_format.match(file):
+                    continue
+                if exts and os.path.splitext(file)[-1].lower() not in exts:
+                    continue
+                if filesize and os.path.getsize(cur_path) < filesize:
+                    continue
+                ret_list.append(cur_path)
+        return ret_list
+
+    def test_same_as_walk(self):
+        for kwargs in [{},
+                       {"exts": [".mkv", ".mp4"]},
+                       {"filesize": 10},
+                       {"exts": [".mkv"], "filesize": 10},
+                       {"episode_format": mock.Mock(match=lambda name: "S01E" in name)}]:
+            self.assertEqual(sorted(PathUtils.iter_dir_files(self.root, **kwargs)),
+                             sorted(self.__walk_files(self.root, **kwargs)))
+            self.assertEqual(sorted(PathUtils.get_dir_files(self.root, **kwargs)),
+                             sorted(self.__walk_files(self.root, **kwargs)))
+        self.assertEqual(sorted(os.path.relpath(path, self.root)
+                                for path in PathUtils.get_dir_files(self.root, exts=[".mkv", ".mp4"], filesize=10)),
+                         ["Show/S01/Show.S01E01.mp4", "Show/S01/Show.S01E02.MKV", "a.mkv"])
+
+    def test_prune(self):
+        # 回收站、隐藏目录及链接的目录不进入遍历
+        scanned = []
+        scandir = os.scandir
+
+        def __scandir(path):
+            scanned.append(os.path.relpath(path, self.root))
+            return scandir(path)
+
+        with mock.patch.object(os, "scandir", side_effect=__scandir):
+            list(PathUtils.iter_dir_files(self.root))
+        self.assertEqual(sorted(scanned), [".", "Show", "Show/S01"])
+
+    def test_file(self):
+        path = os.path.join(self.root, "a.mkv")
+        self.assertEqual(list(PathUtils.iter_dir_files(path, exts=[".mkv"])), [path])
+        self.assertEqual(list(PathUtils.iter_dir_files(path, exts=[".mp4"])), [])
+        self.assertEqual(list(PathUtils.iter_dir_files(os.path.join(self.root, "none.mkv"))), [])
+        self.assertEqual(list(PathUtils.iter_dir_files(os.path.join(self.root, "@Recycle", "c.mkv"))), [])
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import threading
+import time
+from unittest import TestCase, mock, skipUnless
+
+import requests
+
+from app.helper import RcloneHelper
+
+
+class RcloneHelperTest(TestCase):
+    def setUp(self) -> None:
+        self.helper = RcloneHelper()
+        self.job = {"id": 1, "src": "/tmp/a.mkv", "dest": "/a.mkv", "finished": False, "success": False, "error": ""}
+        self.temp_dir = tempfile.mkdtemp()
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def __wait_job(self, call):
+        with mock.patch.object(self.helper, "_MAX_POLL_INTERVAL", 0.01), \
+                mock.patch.object(self.helper, "is_running", return_value=True), \
+                mock.patch.object(self.helper, "_RcloneHelper__call", side_effect=call):
+            return self.helper._RcloneHelper__wait_job(self.job)
+
+    def test_status_errors(self):
+        calls = []
+
+        def __call(command, params=None, timeout=30):
+            calls.append(command)
+            raise requests.ConnectionError("connection refused")
+
+        ret, msg = self.__wait_job(__call)
+        self.assertEqual(ret, 1)
+        self.assertTrue(msg)
+        self.assertEqual(calls.count("job/status"), self.helper._MAX_STATUS_ERRORS)
+        self.assertEqual(calls[-1], "job/stop")
+
+    def test_status_errors_reset(self):
+        max_errors = self.helper._MAX_STATUS_ERRORS
+        results = [requests.ConnectionError()] * (max_errors - 1) \
+            + [{"finished": False}] \
+            + [requests.ConnectionError()] * (max_errors - 1) \
+            + [{"finished": True, "success": True}]
+
+        def __call(command, params=None, timeout=30):
+            result = results.pop(0)
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        self.assertEqual(self.__wait_job(__call), (0, ""))
+
+    def test_job_timeout(self):
+        calls = []
+
+        def __call(command, params=None, timeout=30):
+            calls.append(command)
+            return {"finished": False}
+
+        with mock.patch.object(self.helper, "_JOB_TIMEOUT", 0.2):
+            ret, msg = self.__wait_job(__call)
+        self.assertEqual(ret, 1)
+        self.assertTrue(msg)
+        self.assertEqual(calls[-1], "job/stop")
+
+    def test_bwlimit(self):
+        # rclone限速对整个进程生效，并发任务取限速最小值，任务结束后恢复
+        rates = []
+        release = threading.Event()
+
+        def __call(command, params=None, timeout=30):
+            if command == "core/bwlimit":
+                rates.append(params.get("rate"))
+            return {"jobid": params.get("srcRemote")}
+
+        def __wait_job(job):
+            if job.get("id") == "a.mkv":
+                release.wait(5)
+            return 0, ""
+
+        with mock.patch.object(self.helper, "_RcloneHelper__start", return_value=True), \
+                mock.patch.object(self.helper, "is_running", return_value=True), \
+                mock.patch.object(self.helper, "_RcloneHelper__call", side_effect=__call), \
+                mock.patch.object(self.helper, "_RcloneHelper__wait_job", side_effect=__wait_job), \
+                mock.patch.object(self.helper, "_bwlimit", 0), \
+                mock.patch.object(self.helper, "_job_limits", []):
+            thread = threading.Thread(target=self.helper.transfer,
+                                      args=("/src/a.mkv", "/a.mkv"), kwargs={"bwlimit": 10 * 1024 * 1024})
+            thread.start()
+            while not rates:
+                time.sleep(0.01)
+            self.helper.transfer("/src/b.mkv", "/b.mkv", bwlimit=2 * 1024 * 1024)
+            release.set()
+            thread.join()
+        self.assertEqual(rates, ["10240k", "2048k", "10240k", "off"])
+
+    @skipUnless(shutil.which("rclone"), "rclone未安装")
+    def test_transfer_local(self):
+        src_file = os.path.join(self.temp_dir, "src", "a.mkv")
+        os.makedirs(os.path.dirname(src_file))
+        with open(src_file, "wb") as f:
+            f.write(os.urandom(1024 * 1024))
+        dest_file = os.path.join(self.temp_dir, "dest", "a.mkv")
+        os.makedirs(os.path.dirname(dest_file))
+        try:
+            # 远程名称为空时为本地路径
+            self.assertEqual(self.helper.transfer(src_file, dest_file, remote=""), (0, ""))
+            self.assertTrue(os.path.exists(src_file))
+            with open(src_file, "rb") as f1, open(dest_file, "rb") as f2:
+                self.assertEqual(f1.read(), f2.read())
+            os.remove(dest_file)
+            self.assertEqual(self.helper.transfer(src_file, dest_file, move=True, remote=""), (0, ""))
+            self.assertFalse(os.path.exists(src_file))
+            self.assertTrue(os.path.exists(dest_file))
+            # 源文件不存在时失败
+            ret, _ = self.helper.transfer(src_file, dest_file, remote="")
+            self.assertNotEqual(ret, 0)
+        finally:
+            self.helper.stop()
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+from unittest import TestCase
+
+from app.utils import StripedLock
+
+
+class StripedLockTest(TestCase):
+    def setUp(self) -> None:
+        self.locks = StripedLock(stripes=16)
+
+    def tearDown(self) -> None:
+        pass
+
+    def __find_keys(self, count, same_stripe):
+        """
+        查找count个在同一分段或在不同分段的键
+        """
+        keys = []
+        for i in range(10000):
+            key = "/media/%s.mkv" % i
+            stripes = {self.locks.get_stripe(k) for k in keys}
+            if not keys or (self.locks.get_stripe(key) in stripes) == same_stripe:
+                keys.append(key)
+            if len(keys) == count:
+                return keys
+        raise AssertionError("no keys found")
+
+    def test_same_key(self):
+        running = []
+        max_running = []
+
+        def __task():
+            with self.locks.lock("/media/a.mkv"):
+                running.append(1)
+                max_running.append(len(running))
+                time.sleep(0.02)
+                running.pop()
+
+        threads = [threading.Thread(target=__task) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=5)
+        self.assertEqual(max(max_running), 1)
+
+    def test_different_stripes(self):
+        key1, key2 = self.__find_keys(2, same_stripe=False)
+        acquired = threading.Event()
+
+        def __task():
+            with self.locks.lock(key2):
+                acquired.set()
+
+        with self.locks.lock(key1):
+            thread = threading.Thread(target=__task)
+            thread.start()
+            # 不同分段的键不会阻塞
+            self.assertTrue(acquired.wait(2))
+        thread.join(timeout=5)
+
+    def test_multiple_keys(self):
+        # 多个键在同一分段时只加一次锁，逆序传入也不会死锁
+        key1, key2 = self.__find_keys(2, same_stripe=True)
+        with self.locks.lock(key1, key2, None):
+            pass
+        key3, key4 = self.__find_keys(2, same_stripe=False)
+        errors = []
+
+        def __task(keys):
+            try:
+                for _ in range(200):
+                    with self.locks.lock(*keys):
+                        pass
+            except Exception as err:
+                errors.append(err)
+
+        threads = [threading.Thread(target=__task, args=((key3, key4),)),
+                   threading.Thread(target=__task, args=((key4, key3),))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=5)
+            self.assertFalse(thread.is_alive())
+        self.assertEqual(errors, [])
+
+    def test_stats(self):
+        key = "/media/a.mkv"
+        with self.locks.lock(key):
+            time.sleep(0.05)
+        with self.locks.lock(key):
+            pass
+        stats = self.locks.get_stats()
+        self.assertEqual(len(stats), 1)
+        self.assertEqual(stats[0].get("stripe"), self.locks.get_stripe(key))
+        self.assertEqual(stats[0].get("count"), 2)
+        self.assertGreaterEqual(stats[0].get("hold_max"), 0.04)
+        # 异常时也释放锁
+        with self.assertRaises(ValueError):
+            with self.locks.lock(key):
+                raise ValueError()
+        with self.locks.lock(key):
+            pass
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from app.filetransfer import FileTransfer, SubtitleIndex
+
+
+class SubtitleIndexTest(TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.mkdtemp()
+        for name in ["Show.S01E01.1080p.chs.srt",
+                     "Show.S01E01.1080p.cht.srt",
+                     "Show.S01E01.1080p.eng.srt",
+                     "Show.S01E02.1080p.chs.ass",
+                     "Movie.2020.srt",
+                     "Show.S01E01.1080p.mkv"]:
+            self.__touch(name)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def __touch(self, name):
+        path = os.path.join(self.temp_dir, name)
+        with open(path, "wb"):
+            pass
+        return path
+
+    def test_lookup(self):
+        sub_index = SubtitleIndex(self.temp_dir)
+        self.assertEqual(sub_index.count, 5)
+        results = sub_index.lookup("Show.S01E01.1080p.mkv", "/library/Show - S01E01.mkv")
+        self.assertEqual([os.path.basename(sub) for sub, _ in results],
+                         ["Show.S01E01.1080p.chs.srt", "Show.S01E01.1080p.cht.srt", "Show.S01E01.1080p.eng.srt"])
+        # 按语言标签生成依次尝试的目标文件
+        self.assertEqual([new_files[0] for _, new_files in results],
+                         ["/library/Show - S01E01.chi.zh-cn.srt",
+                          "/library/Show - S01E01.zh-tw.srt",
+                          "/library/Show - S01E01.eng.srt"])
+        self.assertEqual(results[0][1][1], "/library/Show - S01E01.chi.zh-cn.简体中文(1).srt")
+        self.assertEqual(len(results[0][1]), SubtitleIndex._max_same_tags)
+        # 其它集不匹配
+        self.assertEqual(sub_index.lookup("Show.S01E03.1080p.mkv", "/library/Show - S01E03.mkv"), [])
+
+    def test_lookup_stem(self):
+        # 无法识别名称的按文件名匹配
+        self.__touch("一部电影.srt")
+        results = SubtitleIndex(self.temp_dir).lookup("一部电影.mkv", "/library/一部电影.mkv")
+        self.assertIn(os.path.join(self.temp_dir, "一部电影.srt"), [sub for sub, _ in results])
+
+    def test_empty(self):
+        empty_dir = os.path.join(self.temp_dir, "empty")
+        os.makedirs(empty_dir)
+        sub_index = SubtitleIndex(empty_dir)
+        self.assertEqual(sub_index.count, 0)
+        self.assertEqual(sub_index.lookup("Show.S01E01.1080p.mkv", "/library/Show - S01E01.mkv"), [])
+
+    def test_cache(self):
+        # 目录未变化时复用索引，新增字幕后重新建立
+        filetransfer = FileTransfer()
+        sub_index = filetransfer._FileTransfer__get_subtitle_index(self.temp_dir)
+        self.assertIs(filetransfer._FileTransfer__get_subtitle_index(self.temp_dir), sub_index)
+        self.__touch("Show.S01E02.1080p.eng.srt")
+        stat = os.stat(self.temp_dir)
+        os.utime(self.temp_dir, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        new_index = filetransfer._FileTransfer__get_subtitle_index(self.temp_dir)
+        self.assertIsNot(new_index, sub_index)
+        self.assertEqual(new_index.count, 6)
+        self.assertIsNone(filetransfer._FileTransfer__get_subtitle_index(os.path.join(self.temp_dir, "none")))
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+from unittest import TestCase, mock
+
+from app.sync import Sync
+from app.utils import PathTrie
+from app.utils.types import RmtMode
+
+
+class SyncReconcileTest(TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.mkdtemp()
+        self.mon_dir = os.path.join(self.temp_dir, "downloads")
+        self.dest_dir = os.path.join(self.temp_dir, "library")
+        os.makedirs(self.mon_dir)
+        os.makedirs(self.dest_dir)
+        self.sync = Sync()
+        self.patchers = [
+            mock.patch.object(self.sync, "sync_dir_config", {
+                self.mon_dir: {'target': self.dest_dir, 'unknown': None,
+                               'onlylink': False, 'syncmod': RmtMode.COPY}
+            }),
+            mock.patch.object(self.sync, "_debouncer"),
+            mock.patch.object(self.sync, "_manifest_pending", {}),
+            mock.patch.object(self.sync, "_manifest_pending_trie", PathTrie()),
+            mock.patch.object(self.sync, "_manifest_pending_count", {}),
+            mock.patch.object(self.sync, "_manifest_done", {}),
+            mock.patch.object(self.sync.syncmanifest, "_manifest_path", os.path.join(self.temp_dir, "manifest")),
+            mock.patch.object(self.sync, "_Sync__transfer_sync_dir")
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+        self.manifest = self.sync.syncmanifest
+
+    def tearDown(self) -> None:
+        for patcher in reversed(self.patchers):
+            patcher.stop()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def __write(self, name, data=b"x"):
+        path = os.path.join(self.mon_dir, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def __touched(self):
+        return sorted(call.args[0] for call in self.sync._debouncer.touch.call_args_list)
+
+    def test_no_manifest(self):
+        # 没有快照时全量转移并生成快照
+        self.__write("Movie/a.mkv")
+        self.sync.reconcile_sync_dirs()
+        self.sync._Sync__transfer_sync_dir.assert_called_once()
+        self.sync._debouncer.touch.assert_not_called()
+        self.assertEqual(self.manifest.load(self.mon_dir), self.manifest.scan(self.mon_dir))
+
+    def test_diff(self):
+        unchanged = self.__write("Movie/a.mkv")
+        modified = self.__write("Movie/b.mkv")
+        self.manifest.save(self.mon_dir, self.manifest.scan(self.mon_dir))
+        old_manifest = self.manifest.load(self.mon_dir)
+        self.__write("Movie/b.mkv", b"xx")
+        added = self.__write("Show/c.mkv")
+        self.sync.reconcile_sync_dirs()
+        # 只有新增和变化的文件进入防抖队列，不再全量转移
+        self.sync._Sync__transfer_sync_dir.assert_not_called()
+        self.assertEqual(self.__touched(), sorted([modified, added]))
+        self.assertNotIn(unchanged, self.__touched())
+        # 未处理完成前快照保持原状，中途退出时下次对账会重新处理
+        committed = self.manifest.load(self.mon_dir)
+        self.assertEqual(committed, old_manifest)
+        # 处理完成后更新快照
+        self.sync._Sync__manifest_handled([modified])
+        committed = self.manifest.load(self.mon_dir)
+        self.assertNotIn(os.path.join("Show", "c.mkv"), committed)
+        self.sync._Sync__manifest_handled([os.path.join(self.mon_dir, "Show")])
+        self.assertEqual(self.manifest.load(self.mon_dir), self.manifest.scan(self.mon_dir))
+        self.assertFalse(self.sync._manifest_pending)
+        # 再次对账没有变化
+        self.sync._debouncer.reset_mock()
+        self.sync.reconcile_sync_dirs()
+        self.sync._debouncer.touch.assert_not_called()
+
+    def test_transfer_all_sync(self):
+        # 目录同步始终全量转移，并刷新快照
+        self.__write("Movie/a.mkv")
+        self.manifest.save(self.mon_dir, {})
+        self.sync.transfer_all_sync()
+        self.sync._Sync__transfer_sync_dir.assert_called_once_with(self.mon_dir, self.sync.sync_dir_config[self.mon_dir])
+        self.sync._debouncer.touch.assert_not_called()
+        self.assertEqual(self.manifest.load(self.mon_dir), self.manifest.scan(self.mon_dir))
+
+
+class SyncOnlyLinkTest(TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.mkdtemp()
+        self.mon_dir = os.path.join(self.temp_dir, "downloads")
+        self.dest_dir = os.path.join(self.temp_dir, "library")
+        self.files = []
+        for name in ("a.mkv", "Movie/b.mkv", "Movie/c.mkv"):
+            path = os.path.join(self.mon_dir, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as f:
+                f.write(b"x")
+            self.files.append(path)
+        self.sync = Sync()
+        self.patchers = [
+            mock.patch.object(self.sync, "sync_dir_config", {
+                self.mon_dir: {'target': self.dest_dir, 'unknown': None,
+                               'onlylink': True, 'syncmod': RmtMode.LINK}
+            }),
+            mock.patch.object(self.sync, "dbhelper"),
+            mock.patch.object(self.sync, "filetransfer"),
+            mock.patch.object(self.sync.syncmanifest, "_manifest_path", os.path.join(self.temp_dir, "manifest"))
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+        # 第一个文件已同步过
+        self.sync.dbhelper.get_sync_history_paths.return_value = {os.path.normpath(self.files[0])}
+        self.sync.filetransfer.link_sync_file.return_value = (0, "")
+
+    def tearDown(self) -> None:
+        for patcher in reversed(self.patchers):
+            patcher.stop()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def __inserted(self):
+        return sorted(path for call in self.sync.dbhelper.insert_sync_histories.call_args_list
+                      for path in call.args[0])
+
+    def test_set_difference(self):
+        # 已同步的文件不再处理，同步历史只查询一次
+        self.sync.transfer_all_sync()
+        self.sync.dbhelper.get_sync_history_paths.assert_called_once_with(self.mon_dir, self.dest_dir)
+        linked = sorted(call.kwargs.get("in_file") for call in self.sync.filetransfer.link_sync_file.call_args_list)
+        self.assertEqual(linked, sorted(self.files[1:]))
+        self.assertEqual(self.__inserted(), sorted(self.files[1:]))
+
+    def test_batch_insert(self):
+        # 同步历史分批写入，失败或目的文件已存在的不登记
+        self.sync.filetransfer.link_sync_file.side_effect = [(0, ""), (1, "失败")]
+        with mock.patch.object(self.sync, "_HISTORY_BATCH_SIZE", 1):
+            self.sync.transfer_all_sync()
+        self.assertEqual(len(self.__inserted()), 1)
+        self.assertGreaterEqual(self.sync.dbhelper.insert_sync_histories.call_count, 2)
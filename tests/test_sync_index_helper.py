@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+import time
+from collections import OrderedDict
+from unittest import TestCase, mock
+
+from app.helper import SyncIndexHelper
+from app.helper import sync_index_helper
+
+
+class SyncIndexHelperTest(TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.mkdtemp()
+        self.helper = SyncIndexHelper()
+        self.saved = (self.helper._index_path, self.helper._index)
+        self.helper._index_path = os.path.join(self.temp_dir, "sync_index.dat")
+        self.helper._index = OrderedDict()
+
+    def tearDown(self) -> None:
+        self.helper._index_path, self.helper._index = self.saved
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def __write(self, name, data=b"x"):
+        path = os.path.join(self.temp_dir, name)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def test_add(self):
+        path = self.__write("a.mkv")
+        self.assertFalse(self.helper.is_handled(path))
+        self.helper.add(path)
+        self.assertTrue(self.helper.is_handled(path))
+        # 不存在的文件不登记
+        self.helper.add(os.path.join(self.temp_dir, "none.mkv"))
+        self.assertEqual(self.helper.get_index_size(), 1)
+
+    def test_key_changed(self):
+        path = self.__write("a.mkv")
+        self.helper.add(path)
+        # 大小变化
+        self.__write("a.mkv", b"xx")
+        self.assertFalse(self.helper.is_handled(path))
+        self.helper.add(path)
+        # 修改时间变化
+        stat = os.stat(path)
+        os.utime(path, (stat.st_atime, stat.st_mtime + 10))
+        self.assertFalse(self.helper.is_handled(path))
+        # 替换为其它文件（inode变化）
+        self.helper.add(path)
+        other = self.__write("b.mkv", b"xx")
+        os.utime(other, (stat.st_atime, stat.st_mtime + 10))
+        os.replace(other, path)
+        self.assertFalse(self.helper.is_handled(path))
+
+    def test_persist(self):
+        paths = [self.__write("%s.mkv" % i) for i in range(3)]
+        for path in paths:
+            self.helper.add(path)
+        self.helper.save_index()
+        index = self.helper._SyncIndexHelper__load_index(self.helper._index_path)
+        self.assertEqual(list(index), [os.path.normpath(path) for path in paths])
+        self.helper._index = index
+        for path in paths:
+            self.assertTrue(self.helper.is_handled(path))
+        self.helper.clear()
+        self.assertFalse(self.helper.is_handled(paths[0]))
+
+    def test_evict_size(self):
+        paths = [self.__write("%s.mkv" % i) for i in range(5)]
+        with mock.patch.object(sync_index_helper, "SYNC_INDEX_MAX_SIZE", 3):
+            for path in paths:
+                self.helper.add(path)
+        self.assertEqual(self.helper.get_index_size(), 3)
+        self.assertFalse(self.helper.is_handled(paths[0]))
+        self.assertTrue(self.helper.is_handled(paths[-1]))
+
+    def test_evict_expired(self):
+        old_path = self.__write("old.mkv")
+        new_path = self.__write("new.mkv")
+        with mock.patch.object(sync_index_helper.time, "time", return_value=time.time() - 3600):
+            self.helper.add(old_path)
+        with mock.patch.object(sync_index_helper, "SYNC_INDEX_EXPIRE_TIME", 1800):
+            self.helper.add(new_path)
+        self.assertFalse(self.helper.is_handled(old_path))
+        self.assertTrue(self.helper.is_handled(new_path))
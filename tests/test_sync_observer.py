@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+from unittest import TestCase, mock
+
+from app.sync import SyncObserver
+
+
+class SyncObserverTest(TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.mkdtemp()
+        self.root1 = os.path.join(self.temp_dir, "downloads")
+        self.root2 = os.path.join(self.temp_dir, "tv")
+        for path in ["downloads/hot/a", "downloads/hot/b",
+                     "downloads/cold/c", "downloads/cold/d", "downloads/cold/e",
+                     "tv/x"]:
+            os.makedirs(os.path.join(self.temp_dir, path))
+        # 最近无变化的目录
+        for path in ["downloads/cold/c", "downloads/cold/d", "downloads/cold/e", "downloads/cold"]:
+            os.utime(os.path.join(self.temp_dir, path), (1000, 1000))
+        self.cold = os.path.join(self.root1, "cold")
+        self.observer = SyncObserver(mock.Mock())
+        self.patchers = [
+            mock.patch("app.sync.Observer"),
+            mock.patch("app.sync.MtimePollingObserver"),
+            mock.patch.object(SyncObserver, "is_inotify", return_value=True),
+            mock.patch.object(SyncObserver, "get_inotify_used", return_value=0)
+        ]
+        self.mocks = [patcher.start() for patcher in self.patchers]
+
+    def tearDown(self) -> None:
+        for patcher in reversed(self.patchers):
+            patcher.stop()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def __start(self, limit):
+        with mock.patch.object(SyncObserver, "get_inotify_limit", return_value=limit):
+            self.observer.start([self.root1, self.root2])
+
+    def __native(self):
+        return {path: kwargs.get("recursive")
+                for path, kwargs in [(call.kwargs.get("path"), call.kwargs)
+                                     for call in self.mocks[0].return_value.schedule.call_args_list]}
+
+    def test_within_budget(self):
+        # 所有监控目录共用一个观察者，预算充足时均递归原生监控
+        self.__start(limit=1000)
+        self.mocks[0].assert_called_once()
+        self.assertEqual(self.__native(), {self.root1: True, self.root2: True})
+        self.mocks[1].assert_not_called()
+        state = self.observer.get_state()
+        self.assertEqual(state.get("budget"), 800)
+        self.assertEqual(state.get("planned"), 10)
+        self.assertEqual(state.get("polling"), [])
+
+    def test_over_budget(self):
+        # 共10个目录，预算8个，最冷、最深的两个目录转为轮询，上级目录只监控本级
+        self.__start(limit=10)
+        state = self.observer.get_state()
+        self.assertEqual(state.get("budget"), 8)
+        self.assertLessEqual(state.get("planned"), 8)
+        self.assertEqual(len(state.get("polling")), 2)
+        for path in state.get("polling"):
+            self.assertEqual(os.path.dirname(path), self.cold)
+        native = self.__native()
+        self.assertFalse(native.pop(self.root1))
+        self.assertFalse(native.pop(self.cold))
+        self.assertTrue(all(native.values()))
+        self.assertIn(self.root2, native)
+        self.assertIn(os.path.join(self.root1, "hot"), native)
+        # 只监控本级的目录下新建的子目录单独监控
+        new_dir = os.path.join(self.cold, "f")
+        os.makedirs(new_dir)
+        self.assertTrue(self.observer.on_dir_created(new_dir))
+        self.assertTrue(self.__native().get(new_dir))
+        self.assertFalse(self.observer.on_dir_created(new_dir))
+        self.assertFalse(self.observer.on_dir_created(os.path.join(self.root2, "x")))
+
+    def test_no_budget(self):
+        # 没有可用预算时整个监控目录转为轮询
+        self.__start(limit=1)
+        self.assertEqual(self.observer.get_state().get("polling"), sorted([self.root1, self.root2]))
+        self.assertEqual(self.__native(), {})
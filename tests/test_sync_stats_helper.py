@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+from unittest import TestCase, mock
+
+from app.helper import SyncStatsHelper
+from app.helper.sync_stats_helper import Histogram
+from app.utils.types import RmtMode
+
+
+class SyncStatsHelperTest(TestCase):
+    def setUp(self) -> None:
+        self.stats = SyncStatsHelper()
+        self.stats.clear()
+        self.root = "/downloads"
+
+    def tearDown(self) -> None:
+        self.stats.clear()
+
+    def __root_stats(self):
+        return self.stats.get_stats().get("roots").get(self.root)
+
+    def test_transfer_file(self):
+        self.stats.event(self.root, "/downloads/a.mkv")
+        self.stats.event(self.root, "/downloads/a.mkv")
+        self.stats.dedup(self.root)
+        self.assertEqual(self.stats.get_stats().get("waiting_events"), 1)
+        self.stats.transferred(self.root, ["/downloads/a.mkv"], RmtMode.COPY, 1.5)
+        root_stats = self.__root_stats()
+        self.assertEqual(root_stats.get("events"), 2)
+        self.assertEqual(root_stats.get("deduped"), 1)
+        self.assertEqual(root_stats.get("transferred"), 1)
+        self.assertEqual(root_stats.get("latency").get("count"), 1)
+        self.assertEqual(self.stats.get_stats().get("modes").get(RmtMode.COPY.value).get("count"), 1)
+        self.assertEqual(self.stats.get_stats().get("waiting_events"), 0)
+
+    def test_transfer_dir(self):
+        # 按目录转移时目录下有事件记录的文件均视为完成，同名前缀的目录不受影响
+        for path in ["/downloads/Show/S01/a.mkv", "/downloads/Show/S01/b.mkv", "/downloads/Show2/c.mkv"]:
+            self.stats.event(self.root, path)
+        self.stats.transferred(self.root, ["/downloads/Show/"], RmtMode.LINK, 2, success=False)
+        root_stats = self.__root_stats()
+        self.assertEqual(root_stats.get("failed"), 1)
+        self.assertEqual(root_stats.get("latency").get("count"), 2)
+        self.assertEqual(self.stats.get_stats().get("waiting_events"), 1)
+
+    def test_discard(self):
+        self.stats.event(self.root, "/downloads/a.nfo")
+        self.stats.discard("/downloads/a.nfo")
+        self.stats.event(self.root, "/downloads/b.mkv")
+        self.stats.dedup(self.root, "/downloads/b.mkv")
+        self.assertEqual(self.stats.get_stats().get("waiting_events"), 0)
+        self.assertEqual(self.__root_stats().get("deduped"), 1)
+        # 没有监控目录的事件不统计
+        self.stats.event(None, "/other/a.mkv")
+        self.assertEqual(self.stats.get_stats().get("waiting_events"), 0)
+
+    def test_max_pending(self):
+        # 超出最大记录数时丢弃最早的事件
+        with mock.patch.object(self.stats, "_MAX_PENDING_EVENTS", 2):
+            for name in ["a", "b", "c"]:
+                self.stats.event(self.root, "/downloads/%s.mkv" % name)
+            self.assertEqual(self.stats.get_stats().get("waiting_events"), 2)
+            self.stats.transferred(self.root, ["/downloads"], RmtMode.COPY, 1)
+        self.assertEqual(self.__root_stats().get("latency").get("count"), 2)
+
+    def test_histogram(self):
+        histogram = Histogram()
+        for value in [0.05, 0.1, 3, 7200, None, -1]:
+            histogram.observe(value)
+        result = histogram.to_dict()
+        self.assertEqual(result.get("count"), 4)
+        self.assertEqual(result.get("max"), 7200)
+        self.assertEqual(result.get("buckets").get("0.1"), 2)
+        self.assertEqual(result.get("buckets").get("5"), 1)
+        self.assertEqual(result.get("buckets").get("+Inf"), 1)
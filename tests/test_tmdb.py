@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+import os
+import threading
+from unittest import TestCase, mock
+
+from app.media.tmdbv3api.tmdb import TMDb
+
+
+class TMDbThreadLocalTest(TestCase):
+    def setUp(self) -> None:
+        self.tmdb = TMDb()
+        self.default_language = self.tmdb.default_language
+
+    def tearDown(self) -> None:
+        self.tmdb.default_language = self.default_language
+        self.tmdb.language = None
+
+    @staticmethod
+    def __run(func):
+        result = {}
+        thread = threading.Thread(target=lambda: result.update(value=func()))
+        thread.start()
+        thread.join()
+        return result.get("value")
+
+    def test_language(self):
+        # 各线程设置的语言互不影响，没有设置时使用默认语言
+        self.tmdb.default_language = "zh"
+        self.tmdb.language = "en-US"
+
+        def __other():
+            language = TMDb().language
+            TMDb().language = "ja"
+            return language, TMDb().language
+
+        self.assertEqual(self.__run(__other), ("zh", "ja"))
+        self.assertEqual(self.tmdb.language, "en-US")
+        self.tmdb.language = None
+        self.assertEqual(self.tmdb.language, "zh")
+
+    def test_paging(self):
+        self.tmdb._handle_json({"page": 1, "total_results": 30, "total_pages": 2})
+
+        def __other():
+            TMDb()._handle_json({"page": 5, "total_results": 100, "total_pages": 5})
+            return TMDb().page
+
+        self.assertEqual(self.__run(__other), "5")
+        self.assertEqual((self.tmdb.page, self.tmdb.total_results, self.tmdb.total_pages), ("1", "30", "2"))
+
+
+class TMDbSessionTest(TestCase):
+    def setUp(self) -> None:
+        self.patchers = [
+            mock.patch.dict(os.environ),
+            mock.patch.object(TMDb, "_shared_session", None),
+            mock.patch.object(TMDb, "limiter")
+        ]
+        for patcher in self.patchers:
+            patcher.start()
+        os.environ.pop(TMDb.TMDB_PROXIES, None)
+        os.environ[TMDb.TMDB_API_KEY] = "key"
+        os.environ[TMDb.TMDB_DOMAIN] = "https://api.themoviedb.org/3"
+
+    def tearDown(self) -> None:
+        for patcher in reversed(self.patchers):
+            patcher.stop()
+
+    def test_shared(self):
+        # 所有实例共用一个会话，代理或域名变化时重建
+        session, proxies = TMDb()._get_session()
+        self.assertIsNone(proxies)
+        self.assertIs(TMDb()._get_session()[0], session)
+        TMDb().proxies = {"http": "http://127.0.0.1:7890", "https": "http://127.0.0.1:7890"}
+        new_session, proxies = TMDb()._get_session()
+        self.assertIsNot(new_session, session)
+        self.assertEqual(proxies, {"http": "http://127.0.0.1:7890", "https": "http://127.0.0.1:7890"})
+        self.assertIs(TMDb()._get_session()[0], new_session)
+        TMDb().domain = "api.tmdb.org"
+        self.assertIsNot(TMDb()._get_session()[0], new_session)
+
+    def test_custom_session(self):
+        session = mock.Mock()
+        self.assertIs(TMDb(session=session)._get_session()[0], session)
+
+    def test_invalid_proxies(self):
+        # 代理配置只按字面量解析，不执行表达式
+        os.environ[TMDb.TMDB_PROXIES] = "__import__('os').getcwd()"
+        self.assertIsNone(TMDb()._get_session()[1])
+
+    def test_call(self):
+        session = mock.Mock()
+        session.request.return_value = mock.Mock(status_code=200, headers={}, json=lambda: {"id": 1})
+        tmdb = TMDb(obj_cached=False)
+        with mock.patch.object(TMDb, "_get_session", return_value=(session, None)):
+            self.assertEqual(tmdb._call("/movie/1", ""), {"id": 1})
+            self.assertEqual(tmdb._call("/movie/1", ""), {"id": 1})
+        self.assertEqual(session.request.call_count, 2)
+        self.assertEqual(session.request.call_args.kwargs.get("timeout"), tmdb.timeout)
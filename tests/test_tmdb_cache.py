@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+from unittest import TestCase, mock
+
+from app.media.tmdbv3api import cache
+from app.media.tmdbv3api.cache import TMDbCache
+
+
+class TMDbCacheTest(TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.mkdtemp()
+        self.now = 1000000.0
+        self.patcher = mock.patch.object(cache.time, "time", side_effect=lambda: self.now)
+        self.patcher.start()
+        self.cache = TMDbCache(os.path.join(self.temp_dir, "tmdb_cache.db"),
+                               ttls={"search": 100, "details": 1000, "trending": 0})
+
+    def tearDown(self) -> None:
+        self.cache.close()
+        self.patcher.stop()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_key(self):
+        # 不含域名及api_key，参数按名称排序
+        key1 = TMDbCache.get_key("get", "https://api.themoviedb.org/3/search/movie?query=a&api_key=x&page=1")
+        key2 = TMDbCache.get_key("GET", "https://api.tmdb.org/3/search/movie?page=1&query=a&api_key=y")
+        self.assertEqual(key1, key2)
+        self.assertNotEqual(key1, TMDbCache.get_key("GET", "https://api.tmdb.org/3/search/movie?page=2&query=a"))
+        self.assertNotEqual(key1, TMDbCache.get_key("POST", "https://api.tmdb.org/3/search/movie?page=1&query=a"))
+
+    def test_endpoint(self):
+        self.assertEqual(TMDbCache.get_endpoint("/search/movie"), "search")
+        self.assertEqual(TMDbCache.get_endpoint("/find/tt0111161"), "search")
+        self.assertEqual(TMDbCache.get_endpoint("/tv/1396/season/1"), "season")
+        self.assertEqual(TMDbCache.get_endpoint("/trending/all/week"), "trending")
+        self.assertEqual(TMDbCache.get_endpoint("/movie/popular"), "trending")
+        self.assertEqual(TMDbCache.get_endpoint("/movie/550"), "details")
+
+    def test_ttl(self):
+        self.cache.set("search-key", "search", {"results": [1]})
+        self.cache.set("details-key", "details", {"id": 550, "title": "电影"})
+        self.assertEqual(self.cache.get("search-key", "search"), {"results": [1]})
+        self.now += 101
+        self.assertIsNone(self.cache.get("search-key", "search"))
+        self.assertEqual(self.cache.get("details-key", "details"), {"id": 550, "title": "电影"})
+        self.now += 1000
+        self.assertIsNone(self.cache.get("details-key", "details"))
+        # 缓存时间为0的类别不缓存
+        self.cache.set("trending-key", "trending", {"results": []})
+        self.assertIsNone(self.cache.get("trending-key", "trending"))
+        stats = self.cache.get_stats()
+        self.assertEqual(stats.get("hits"), 2)
+        self.assertEqual(stats.get("misses"), 3)
+        self.assertEqual(stats.get("endpoints").get("search").get("hit_rate"), 0.5)
+
+    def test_persist(self):
+        self.cache.set("details-key", "details", {"id": 550})
+        self.cache.close()
+        self.cache = TMDbCache(self.cache.path, ttls={"details": 1000})
+        self.assertEqual(self.cache.get("details-key", "details"), {"id": 550})
+        self.cache.clear()
+        self.assertIsNone(self.cache.get("details-key", "details"))
+        self.assertEqual(self.cache.get_stats().get("size"), 0)
+
+    def test_lru(self):
+        self.cache.set("key-0", "details", {"overview": os.urandom(2048).hex()})
+        entry_size = self.cache.get_stats().get("size")
+        self.cache.close()
+        # 容量为3条多一点，超过时淘汰到90%
+        self.cache = TMDbCache(self.cache.path, ttls={"details": 100000}, max_size=int(entry_size * 3.5))
+        self.cache.clear()
+        for i in range(3):
+            self.now += 1
+            self.cache.set("key-%s" % i, "details", {"overview": os.urandom(2048).hex()})
+        # 访问最早的条目，访问时间超过更新间隔时更新
+        self.now += TMDbCache._TOUCH_INTERVAL + 1
+        self.assertIsNotNone(self.cache.get("key-0", "details"))
+        self.now += 1
+        self.cache.set("key-3", "details", {"overview": os.urandom(2048).hex()})
+        self.assertIsNotNone(self.cache.get("key-0", "details"))
+        self.assertIsNone(self.cache.get("key-1", "details"))
+        self.assertIsNotNone(self.cache.get("key-2", "details"))
+        self.assertIsNotNone(self.cache.get("key-3", "details"))
+        self.assertLessEqual(self.cache.get_stats().get("size"), entry_size * 3.5)
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+from unittest import TestCase
+
+from app.media.tmdbv3api import TMDbRateLimiter
+
+
+class GateBucket(object):
+    """
+    第一次取令牌时阻塞到放行，记录取令牌的顺序
+    """
+
+    def __init__(self):
+        self.gate = threading.Event()
+        self.order = []
+        self.rate = 40
+
+    def consume(self, tokens=1):
+        if not self.order:
+            self.order.append(None)
+            self.gate.wait(5)
+            return
+        self.order.append(threading.current_thread().name)
+
+    def set_rate(self, rate):
+        self.rate = rate
+
+
+class TMDbRateLimiterTest(TestCase):
+    def setUp(self) -> None:
+        self.limiter = TMDbRateLimiter(rate=40)
+
+    def tearDown(self) -> None:
+        pass
+
+    def __start(self, name, priority, caller=None):
+        def __acquire():
+            with self.limiter.priority(priority, caller):
+                self.limiter.acquire()
+
+        thread = threading.Thread(target=__acquire, name=name)
+        thread.start()
+        return thread
+
+    def __wait_waiters(self, count):
+        deadline = time.time() + 5
+        while len(self.limiter._waiters) < count and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(len(self.limiter._waiters), count)
+
+    def test_priority_order(self):
+        bucket = self.limiter._bucket = GateBucket()
+        threads = [self.__start("first", TMDbRateLimiter.PRIORITY_BACKGROUND)]
+        # 第一个请求取令牌时阻塞，其余请求排队
+        while not bucket.order:
+            time.sleep(0.01)
+        threads += [self.__start("background-%s" % i, TMDbRateLimiter.PRIORITY_BACKGROUND) for i in range(3)]
+        self.__wait_waiters(3)
+        threads.append(self.__start("normal", TMDbRateLimiter.PRIORITY_NORMAL))
+        self.__wait_waiters(4)
+        threads.append(self.__start("interactive", TMDbRateLimiter.PRIORITY_INTERACTIVE))
+        self.__wait_waiters(5)
+        bucket.gate.set()
+        for thread in threads:
+            thread.join(timeout=5)
+        # 交互请求优先，同一优先级按先后顺序
+        self.assertEqual(bucket.order[1:], ["interactive", "normal", "background-0", "background-1", "background-2"])
+
+    def test_context(self):
+        self.assertEqual(self.limiter.get_context(), (TMDbRateLimiter.PRIORITY_NORMAL, None))
+        with self.limiter.priority(TMDbRateLimiter.PRIORITY_BACKGROUND, "recognize"):
+            # 嵌套时未指定调用方沿用外层
+            with self.limiter.priority(TMDbRateLimiter.PRIORITY_INTERACTIVE):
+                self.assertEqual(self.limiter.get_context(), (TMDbRateLimiter.PRIORITY_INTERACTIVE, "recognize"))
+            self.assertEqual(self.limiter.get_context(), (TMDbRateLimiter.PRIORITY_BACKGROUND, "recognize"))
+        self.assertEqual(self.limiter.get_context(), (TMDbRateLimiter.PRIORITY_NORMAL, None))
+
+    def test_rate_limited(self):
+        self.limiter.set_max_rate(1000)
+        self.limiter.on_rate_limited(0.2)
+        self.assertEqual(self.limiter.rate, 500)
+        # 暂停期间取令牌需等待
+        with self.limiter.priority(TMDbRateLimiter.PRIORITY_INTERACTIVE, "web"):
+            self.assertGreaterEqual(self.limiter.acquire(), 0.15)
+        stats = self.limiter.get_stats()
+        self.assertEqual(stats.get("rate_limited"), 1)
+        self.assertEqual(stats.get("callers").get("web").get("requests"), 1)
+        self.assertEqual(stats.get("callers").get("web").get("priority"), TMDbRateLimiter.PRIORITY_INTERACTIVE)
+        # 持续成功后逐步恢复，不超过最大速率
+        for _ in range(TMDbRateLimiter._RECOVER_REQUESTS):
+            self.limiter.on_success()
+        self.assertEqual(self.limiter.rate, 750)
+        for _ in range(TMDbRateLimiter._RECOVER_REQUESTS * 3):
+            self.limiter.on_success()
+        self.assertEqual(self.limiter.rate, 1000)
+
+    def test_min_rate(self):
+        self.limiter.set_max_rate(2)
+        for _ in range(5):
+            self.limiter.on_rate_limited(0)
+        self.assertEqual(self.limiter.rate, TMDbRateLimiter.MIN_RATE)
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+from unittest import TestCase, mock
+
+from app.utils import TokenBucket
+
+
+class TokenBucketTest(TestCase):
+    def setUp(self) -> None:
+        # 模拟时钟，不实际等待
+        self.now = 100.0
+        self.sleeps = []
+        self.patcher = mock.patch("app.utils.token_bucket.time")
+        time_mock = self.patcher.start()
+        time_mock.monotonic.side_effect = lambda: self.now
+        time_mock.sleep.side_effect = self.__sleep
+
+    def tearDown(self) -> None:
+        self.patcher.stop()
+
+    def __sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+    def test_unlimited(self):
+        bucket = TokenBucket(0)
+        self.assertEqual(bucket.consume(10 ** 9), 0)
+        self.assertEqual(self.sleeps, [])
+
+    def test_rate(self):
+        bucket = TokenBucket(100)
+        # 初始没有令牌
+        self.assertAlmostEqual(bucket.reserve(50), 0.5)
+        self.now += 0.5
+        self.assertAlmostEqual(bucket.reserve(100), 1.0)
+        # 补充的令牌不超过容量
+        self.now += 10
+        self.assertEqual(bucket.reserve(100), 0)
+        self.assertAlmostEqual(bucket.reserve(1), 0.01)
+
+    def test_overdraft(self):
+        # 超过容量的请求透支，后续请求等待补足
+        bucket = TokenBucket(100, capacity=100)
+        self.now += 1
+        self.assertAlmostEqual(bucket.consume(300), 2.0)
+        self.assertAlmostEqual(bucket.reserve(100), 1.0)
+
+    def test_long_term_rate(self):
+        bucket = TokenBucket(1000)
+        start = self.now
+        for _ in range(100):
+            bucket.consume(100)
+        # 10000个令牌按每秒1000个，约10秒
+        self.assertAlmostEqual(self.now - start, 10.0, places=3)
+
+    def test_set_rate(self):
+        bucket = TokenBucket(100)
+        self.now += 1
+        bucket.set_rate(10)
+        self.assertEqual(bucket.rate, 10)
+        # 降速后令牌不超过新容量
+        self.assertEqual(bucket.reserve(10), 0)
+        self.assertAlmostEqual(bucket.reserve(10), 1.0)
+        bucket.set_rate(None)
+        self.assertEqual(bucket.reserve(10 ** 6), 0)
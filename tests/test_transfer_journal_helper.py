@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+import os
+import shutil
+import tempfile
+from unittest import TestCase, mock
+
+from app.helper import TransferJournalHelper
+from app.helper import transfer_journal_helper
+from app.utils import CopyEngine
+from app.utils.types import RmtMode
+from config import RMT_STAGING_SUFFIX
+
+
+class TransferJournalHelperTest(TestCase):
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.mkdtemp()
+        self.src_dir = os.path.join(self.temp_dir, "src")
+        self.dest_dir = os.path.join(self.temp_dir, "dest")
+        os.makedirs(self.src_dir)
+        os.makedirs(self.dest_dir)
+        self.journal = TransferJournalHelper()
+        self.journal_file = self.journal._journal_file
+        self.journal._journal_file = os.path.join(self.temp_dir, "journal", "journal.log")
+        self.journal._TransferJournalHelper__load()
+        self.patcher = mock.patch.object(transfer_journal_helper, "DbHelper")
+        self.dbhelper = self.patcher.start().return_value
+
+    def tearDown(self) -> None:
+        self.patcher.stop()
+        self.journal._journal_file = self.journal_file
+        self.journal._TransferJournalHelper__load()
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def __write(self, path, data=b"data"):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def __begin(self, src, target, rmt_mode, bluray=False):
+        return self.journal.begin(src=src, target=target, rmt_mode=rmt_mode, bluray=bluray,
+                                  history={"SOURCE_PATH": src, "DEST_PATH": target})
+
+    def __reload(self):
+        """
+        模拟重启，重新读取日志
+        """
+        self.journal._TransferJournalHelper__load()
+
+    def test_copy_interrupted(self):
+        src = self.__write(os.path.join(self.src_dir, "a.mkv"))
+        target = os.path.join(self.dest_dir, "a.mkv")
+        self.__begin(src, target, RmtMode.COPY)
+        temp_file = self.__write(os.path.join(self.dest_dir, ".a.mkv.12345678%s" % CopyEngine.TEMP_SUFFIX))
+        self.__reload()
+        self.journal.recover()
+        self.assertFalse(os.path.exists(temp_file))
+        self.assertTrue(os.path.exists(src))
+        self.dbhelper.insert_transfer_history_rows.assert_not_called()
+        self.__reload()
+        self.assertEqual(self.journal.get_unfinished(), [])
+
+    def test_copy_finished(self):
+        src = self.__write(os.path.join(self.src_dir, "a.mkv"))
+        target = self.__write(os.path.join(self.dest_dir, "a.mkv"))
+        self.__begin(src, target, RmtMode.COPY)
+        self.__reload()
+        self.journal.recover()
+        self.dbhelper.insert_transfer_history_rows.assert_called_once()
+        self.dbhelper.insert_transfer_blacklist.assert_called_once_with(os.path.normpath(src))
+        self.__reload()
+        self.assertEqual(self.journal.get_unfinished(), [])
+
+    def test_copy_size_mismatch(self):
+        src = self.__write(os.path.join(self.src_dir, "a.mkv"))
+        target = self.__write(os.path.join(self.dest_dir, "a.mkv"), b"da")
+        self.__begin(src, target, RmtMode.COPY)
+        self.__reload()
+        self.journal.recover()
+        self.dbhelper.insert_transfer_history_rows.assert_not_called()
+
+    def test_done_with_checksum(self):
+        src = self.__write(os.path.join(self.src_dir, "a.mkv"))
+        target = self.__write(os.path.join(self.dest_dir, "a.mkv"))
+        jid = self.__begin(src, target, RmtMode.COPY)
+        self.journal.done(jid, checksum="blake2b:abc")
+        self.__reload()
+        self.journal.recover()
+        history = self.dbhelper.insert_transfer_history_rows.call_args[0][0][0]
+        self.assertEqual(history.get("CHECKSUM"), "blake2b:abc")
+
+    def test_committed(self):
+        src = self.__write(os.path.join(self.src_dir, "a.mkv"))
+        target = self.__write(os.path.join(self.dest_dir, "a.mkv"))
+        jid = self.__begin(src, target, RmtMode.COPY)
+        self.journal.done(jid)
+        self.journal.commit([jid])
+        self.__reload()
+        self.assertEqual(self.journal.get_unfinished(), [])
+        self.journal.recover()
+        self.dbhelper.insert_transfer_history_rows.assert_not_called()
+
+    def test_move_finish(self):
+        # 复制已完成但源文件未删除，继续完成移动
+        src = self.__write(os.path.join(self.src_dir, "a.mkv"))
+        target = self.__write(os.path.join(self.dest_dir, "a.mkv"))
+        self.__begin(src, target, RmtMode.MOVE)
+        self.__reload()
+        self.journal.recover()
+        self.assertFalse(os.path.exists(src))
+        self.assertTrue(os.path.exists(target))
+        self.dbhelper.insert_transfer_history_rows.assert_called_once()
+
+    def test_link(self):
+        src = self.__write(os.path.join(self.src_dir, "a.mkv"))
+        # 目的文件不是源文件的硬链接
+        other = self.__write(os.path.join(self.dest_dir, "b.mkv"))
+        self.__begin(src, other, RmtMode.LINK)
+        target = os.path.join(self.dest_dir, "a.mkv")
+        os.link(src, target)
+        self.__begin(src, target, RmtMode.LINK)
+        self.__reload()
+        self.journal.recover()
+        self.dbhelper.insert_transfer_history_rows.assert_called_once()
+        self.assertEqual(self.dbhelper.insert_transfer_history_rows.call_args[0][0][0].get("DEST_PATH"),
+                         os.path.normpath(target))
+
+    def test_softlink(self):
+        src = self.__write(os.path.join(self.src_dir, "a.mkv"))
+        other = self.__write(os.path.join(self.src_dir, "b.mkv"))
+        wrong = os.path.join(self.dest_dir, "b.mkv")
+        os.symlink(other, wrong)
+        self.__begin(src, wrong, RmtMode.SOFTLINK)
+        target = os.path.join(self.dest_dir, "a.mkv")
+        os.symlink(src, target)
+        self.__begin(src, target, RmtMode.SOFTLINK)
+        self.__reload()
+        self.journal.recover()
+        self.dbhelper.insert_transfer_history_rows.assert_called_once()
+        self.assertEqual(self.dbhelper.insert_transfer_history_rows.call_args[0][0][0].get("DEST_PATH"),
+                         os.path.normpath(target))
+
+    def test_bluray_staging(self):
+        # 原盘目录移动中断，已移动到暂存目录的文件移回原目录
+        src = os.path.join(self.src_dir, "Movie.BluRay")
+        self.__write(os.path.join(src, "BDMV", "STREAM", "00001.m2ts"))
+        target = os.path.join(self.dest_dir, "Movie (2020)")
+        staging = os.path.join(self.dest_dir, ".Movie (2020).12345678%s" % RMT_STAGING_SUFFIX)
+        self.__write(os.path.join(staging, "BDMV", "index.bdmv"))
+        self.__write(os.path.join(staging, "BDMV", "STREAM", ".00002.m2ts.abcdef12%s" % CopyEngine.TEMP_SUFFIX))
+        self.__begin(src, target, RmtMode.MOVE, bluray=True)
+        self.__reload()
+        self.journal.recover()
+        self.assertFalse(os.path.exists(staging))
+        self.assertFalse(os.path.exists(target))
+        self.assertTrue(os.path.exists(os.path.join(src, "BDMV", "index.bdmv")))
+        self.assertTrue(os.path.exists(os.path.join(src, "BDMV", "STREAM", "00001.m2ts")))
+        self.dbhelper.insert_transfer_history_rows.assert_not_called()
+
+    def test_bluray_finished(self):
+        src = os.path.join(self.src_dir, "Movie.BluRay")
+        self.__write(os.path.join(src, "BDMV", "index.bdmv"))
+        target = os.path.join(self.dest_dir, "Movie (2020)")
+        self.__write(os.path.join(target, "BDMV", "index.bdmv"))
+        self.__begin(src, target, RmtMode.COPY, bluray=True)
+        self.__reload()
+        self.journal.recover()
+        self.dbhelper.insert_transfer_history_rows.assert_called_once()
+
+    def test_completed_dir(self):
+        src = self.__write(os.path.join(self.src_dir, "Show", "a.mkv"))
+        show_dir = os.path.dirname(src)
+        self.journal.complete_dir(show_dir, self.dest_dir, RmtMode.COPY)
+        self.__reload()
+        self.assertTrue(self.journal.is_dir_completed(show_dir, self.dest_dir, RmtMode.COPY))
+        # 目的目录或转移方式不同时需重新处理
+        self.assertFalse(self.journal.is_dir_completed(show_dir, self.dest_dir, RmtMode.LINK))
+        self.assertFalse(self.journal.is_dir_completed(show_dir, None, RmtMode.COPY))
+        # 目录变化后需重新处理
+        self.__write(os.path.join(show_dir, "Season 1", "b.mkv"))
+        self.assertFalse(self.journal.is_dir_completed(show_dir, self.dest_dir, RmtMode.COPY))
+
+    def test_completed_dir_limit(self):
+        with mock.patch.object(self.journal, "_MAX_COMPLETED_DIRS", 3):
+            for i in range(5):
+                self.journal.complete_dir(self.src_dir, os.path.join(self.dest_dir, str(i)), RmtMode.COPY)
+            self.assertEqual(len(self.journal._completed_dirs), 3)
+            self.assertFalse(self.journal.is_dir_completed(self.src_dir, os.path.join(self.dest_dir, "0"),
+                                                           RmtMode.COPY))
+            self.assertTrue(self.journal.is_dir_completed(self.src_dir, os.path.join(self.dest_dir, "4"),
+                                                          RmtMode.COPY))
@@ -17,9 +17,10 @@ from app.conf import SystemConfig, ModuleConf
 from app.filetransfer import FileTransfer
 from app.filter import Filter
 from app.helper import DbHelper, ProgressHelper, ThreadHelper, \
-    MetaHelper, DisplayHelper, WordsHelper
+    MetaHelper, DisplayHelper, WordsHelper, SyncIndexHelper, SyncManifestHelper
 from app.media import Media
 from app.media.meta import MetaInfo
+from app.media.tmdbv3api import TMDb, TMDbRateLimiter
 from app.mediaserver import MediaServer
 from app.message import Message, MessageCenter
 from app.scheduler import stop_scheduler
@@ -56,6 +57,9 @@ class WebAction:
             "get_sync_path": self.__get_sync_path,
             "delete_sync_path": self.__delete_sync_path,
             "check_sync_path": self.__check_sync_path,
+            "get_sync_statistics": self.get_sync_statistics,
+            "get_tmdb_cache_statistics": self.get_tmdb_cache_statistics,
+            "get_tmdb_rate_statistics": self.get_tmdb_rate_statistics,
             "re_identification": self.__re_identification,
             "test_connection": self.__test_connection,
             "user_manager": self.__user_manager,
@@ -109,7 +113,9 @@ class WebAction:
         if not func:
             return {"code": -1, "msg": "非授权访问！"}
         else:
-            return func(data)
+            # 页面操作的TMDB请求优先
+            with TMDb.limiter.priority(TMDbRateLimiter.PRIORITY_INTERACTIVE, "web"):
+                return func(data)
 
     def api_action(self, cmd, data=None):
         result = self.action(cmd, data)
@@ -357,18 +363,22 @@ class WebAction:
         if os.path.splitext(path)[-1].lower() in RMT_MEDIAEXT and episode_format:
             path = os.path.dirname(path)
             need_fix_all = True
+        dry_run = StringUtils.to_bool(data.get("dry_run"), False)
         # 开始转移
-        succ_flag, ret_msg = self.__manual_transfer(inpath=path,
-                                                    syncmod=syncmod,
-                                                    outpath=dest_dir,
-                                                    media_type=media_type,
-                                                    episode_format=episode_format,
-                                                    episode_details=episode_details,
-                                                    episode_offset=episode_offset,
-                                                    need_fix_all=need_fix_all,
-                                                    min_filesize=min_filesize,
-                                                    tmdbid=tmdbid,
-                                                    season=season)
+        succ_flag, ret_msg, plan = self.__manual_transfer(inpath=path,
+                                                          syncmod=syncmod,
+                                                          outpath=dest_dir,
+                                                          media_type=media_type,
+                                                          episode_format=episode_format,
+                                                          episode_details=episode_details,
+                                                          episode_offset=episode_offset,
+                                                          need_fix_all=need_fix_all,
+                                                          min_filesize=min_filesize,
+                                                          tmdbid=tmdbid,
+                                                          season=season,
+                                                          dry_run=dry_run)
+        if dry_run:
+            return {"retcode": 0 if succ_flag else 2, "retmsg": ret_msg, "plan": plan or []}
         if succ_flag:
             if not need_fix_all and not logid:
                 # 更新记录状态
@@ -399,17 +409,21 @@ class WebAction:
             media_type = MediaType.TV
         else:
             media_type = MediaType.ANIME
+        dry_run = StringUtils.to_bool(data.get("dry_run"), False)
         # 开始转移
-        succ_flag, ret_msg = self.__manual_transfer(inpath=inpath,
-                                                    syncmod=syncmod,
-                                                    outpath=outpath,
-                                                    media_type=media_type,
-                                                    episode_format=episode_format,
-                                                    episode_details=episode_details,
-                                                    episode_offset=episode_offset,
-                                                    min_filesize=min_filesize,
-                                                    tmdbid=tmdbid,
-                                                    season=season)
+        succ_flag, ret_msg, plan = self.__manual_transfer(inpath=inpath,
+                                                          syncmod=syncmod,
+                                                          outpath=outpath,
+                                                          media_type=media_type,
+                                                          episode_format=episode_format,
+                                                          episode_details=episode_details,
+                                                          episode_offset=episode_offset,
+                                                          min_filesize=min_filesize,
+                                                          tmdbid=tmdbid,
+                                                          season=season,
+                                                          dry_run=dry_run)
+        if dry_run:
+            return {"retcode": 0 if succ_flag else 2, "retmsg": ret_msg, "plan": plan or []}
         if succ_flag:
             return {"retcode": 0, "retmsg": "转移成功"}
         else:
@@ -426,51 +440,44 @@ class WebAction:
                           min_filesize=None,
                           tmdbid=None,
                           season=None,
-                          need_fix_all=False
+                          need_fix_all=False,
+                          dry_run=False
                           ):
         """
         开始手工转移文件
+        :param dry_run: 只预览转移计划，不实际转移
+        :return: 处理状态，错误信息，转移计划（仅预览时）
         """
         inpath = os.path.normpath(inpath)
         if outpath:
             outpath = os.path.normpath(outpath)
         if not os.path.exists(inpath):
-            return False, "输入路径不存在"
+            return False, "输入路径不存在", None
+        tmdb_info = None
         if tmdbid:
             # 有输入TMDBID
             tmdb_info = Media().get_tmdb_info(mtype=media_type, tmdbid=tmdbid)
             if not tmdb_info:
-                return False, "识别失败，无法查询到TMDB信息"
-            # 按识别的信息转移
-            succ_flag, ret_msg = FileTransfer().transfer_media(in_from=SyncType.MAN,
-                                                               in_path=inpath,
-                                                               rmt_mode=syncmod,
-                                                               target_dir=outpath,
-                                                               tmdb_info=tmdb_info,
-                                                               media_type=media_type,
-                                                               season=season,
-                                                               episode=(
-                                                                   EpisodeFormat(episode_format,
-                                                                                 episode_details,
-                                                                                 episode_offset),
-                                                                   need_fix_all),
-                                                               min_filesize=min_filesize,
-                                                               udf_flag=True)
-        else:
-            # 按识别的信息转移
-            succ_flag, ret_msg = FileTransfer().transfer_media(in_from=SyncType.MAN,
-                                                               in_path=inpath,
-                                                               rmt_mode=syncmod,
-                                                               target_dir=outpath,
-                                                               media_type=media_type,
-                                                               episode=(
-                                                                   EpisodeFormat(episode_format,
-                                                                                 episode_details,
-                                                                                 episode_offset),
-                                                                   need_fix_all),
-                                                               min_filesize=min_filesize,
-                                                               udf_flag=True)
-        return succ_flag, ret_msg
+                return False, "识别失败，无法查询到TMDB信息", None
+        # 按识别的信息转移
+        transfer_args = dict(in_from=SyncType.MAN,
+                             in_path=inpath,
+                             rmt_mode=syncmod,
+                             target_dir=outpath,
+                             tmdb_info=tmdb_info,
+                             media_type=media_type,
+                             season=season if tmdbid else None,
+                             episode=(
+                                 EpisodeFormat(episode_format,
+                                               episode_details,
+                                               episode_offset),
+                                 need_fix_all),
+                             min_filesize=min_filesize,
+                             udf_flag=True)
+        if dry_run:
+            return FileTransfer().preview_media(**transfer_args)
+        succ_flag, ret_msg = FileTransfer().transfer_media(**transfer_args)
+        return succ_flag, ret_msg, None
 
     def __delete_history(self, data):
         """
@@ -549,7 +556,7 @@ class WebAction:
                                                 e)
                                 rm_parent_dir = True
                             if rm_parent_dir \
-                                    and not PathUtils.get_dir_files(os.path.dirname(dest_path), exts=RMT_MEDIAEXT):
+                                    and not any(PathUtils.iter_dir_files(os.path.dirname(dest_path), exts=RMT_MEDIAEXT)):
                                 # 没有媒体文件时，删除整个目录
                                 try:
                                     shutil.rmtree(os.path.dirname(dest_path))
@@ -576,7 +583,7 @@ class WebAction:
             if re.findall(r"^S\d{2}|^Season", os.path.basename(filedir), re.I):
                 # 当前是季文件夹，判断并删除
                 seaon_dir = filedir
-                if seaon_dir.count('/') > 1 and not PathUtils.get_dir_files(seaon_dir, exts=RMT_MEDIAEXT):
+                if seaon_dir.count('/') > 1 and not any(PathUtils.iter_dir_files(seaon_dir, exts=RMT_MEDIAEXT)):
                     shutil.rmtree(seaon_dir)
                 # 媒体文件夹
                 media_dir = os.path.dirname(seaon_dir)
@@ -586,7 +593,7 @@ class WebAction:
             if media_dir != '/' \
                     and media_dir.count('/') > 1 \
                     and not re.search(r'[a-zA-Z]:/$', media_dir) \
-                    and not PathUtils.get_dir_files(media_dir, exts=RMT_MEDIAEXT):
+                    and not any(PathUtils.iter_dir_files(media_dir, exts=RMT_MEDIAEXT)):
                 shutil.rmtree(media_dir)
             return True, f"{file} 删除成功"
         except Exception as e:
@@ -948,6 +955,8 @@ class WebAction:
         清空文件转移黑名单记录
         """
         self.dbhelper.truncate_transfer_blacklist()
+        SyncIndexHelper().clear()
+        SyncManifestHelper().clear()
         return {"code": 0}
 
     def __name_test(self, data):
@@ -1131,6 +1140,7 @@ class WebAction:
         """
         try:
             MetaHelper().clear_meta_data()
+            TMDb().cache_clear()
             os.remove(MetaHelper().get_meta_data_path())
         except Exception as e:
             ExceptionUtils.exception_traceback(e)
@@ -1908,6 +1918,27 @@ class WebAction:
         SyncPaths = sorted(SyncPaths, key=lambda o: o.get("from"))
         return {"code": 0, "result": SyncPaths}
 
+    @staticmethod
+    def get_sync_statistics(data=None):
+        """
+        查询目录同步统计：事件数、去重数、队列深度、处理耗时
+        """
+        return {"code": 0, "result": Sync().get_sync_stats()}
+
+    @staticmethod
+    def get_tmdb_cache_statistics(data=None):
+        """
+        查询TMDB接口响应缓存统计：条目数、占用空间、各类接口的命中率
+        """
+        return {"code": 0, "result": TMDb.get_http_cache_stats()}
+
+    @staticmethod
+    def get_tmdb_rate_statistics(data=None):
+        """
+        查询TMDB请求限速统计：当前速率、排队数、各调用方的等待时间
+        """
+        return {"code": 0, "result": TMDb.limiter.get_stats()}
+
     def get_users(self, data=None):
         """
         查询所有用户